@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import asyncio
+from typing import Any, Awaitable, Callable, Optional
+import anyio.from_thread
+from instrumentation import db_duration, timed
+from replicas import ReplicaSet, Replica, choose_replica
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    import asyncpg
+except ImportError:
+    asyncpg = None
+
+# Direct Postgres connection for aggregate queries PostgREST can't express,
+# e.g. the session pooler string from the Supabase dashboard. Unset: the
+# analytics endpoints aggregate PostgREST rows in Python as before.
+ANALYTICS_DATABASE_URL = os.getenv("ANALYTICS_DATABASE_URL")
+ANALYTICS_POOL_MIN_SIZE = int(os.getenv("ANALYTICS_POOL_MIN_SIZE", "1"))
+ANALYTICS_POOL_MAX_SIZE = int(os.getenv("ANALYTICS_POOL_MAX_SIZE", "5"))
+# asyncpg prepares and caches every statement per connection. Set to 0 behind
+# a transaction-mode pooler (port 6543), which can't keep prepared statements.
+ANALYTICS_STATEMENT_CACHE_SIZE = int(os.getenv("ANALYTICS_STATEMENT_CACHE_SIZE", "100"))
+ANALYTICS_TIMEOUT_SECONDS = float(os.getenv("ANALYTICS_TIMEOUT_SECONDS", "10"))
+# Comma-separated connection strings for read replicas of the same database.
+# GET requests run their analytics queries there when one is healthy and caught up.
+ANALYTICS_REPLICA_URLS = [u.strip() for u in os.getenv("ANALYTICS_REPLICA_URLS", "").split(",") if u.strip()]
+
+PATIENT_LIST_STATS = """
+WITH ids AS (
+    SELECT unnest($1::uuid[]) AS patient_id
+), sessions AS (
+    SELECT patient_id,
+           max(created_at) FILTER (WHERE status = 'completed') AS last_session_at,
+           coalesce(sum(duration_seconds), 0) AS total_duration
+    FROM exercise_sessions
+    WHERE patient_id = ANY($1::uuid[])
+    GROUP BY patient_id
+), assigned AS (
+    SELECT patient_id, count(*) AS assigned_exercises_count
+    FROM assigned_exercises
+    WHERE patient_id = ANY($1::uuid[]) AND status = 'active'
+    GROUP BY patient_id
+)
+SELECT ids.patient_id::text AS patient_id,
+       to_jsonb(sessions.last_session_at) AS last_session_at,
+       coalesce(sessions.total_duration, 0) AS total_duration,
+       coalesce(assigned.assigned_exercises_count, 0) AS assigned_exercises_count
+FROM ids
+LEFT JOIN sessions USING (patient_id)
+LEFT JOIN assigned USING (patient_id)
+"""
+
+PATIENT_STATS = """
+SELECT count(*) AS total_sessions,
+       coalesce(sum(duration_seconds), 0) AS total_duration,
+       round(avg((metrics->>'accuracy')::numeric) FILTER (WHERE jsonb_typeof(metrics->'accuracy') = 'number')) AS avg_accuracy,
+       to_jsonb(max(created_at)) AS last_session
+FROM exercise_sessions
+WHERE patient_id = $1::uuid
+"""
+
+# The newest sessions across a doctor's caseload with the names the dashboard
+# shows; to_jsonb keeps every column in the same JSON form PostgREST returns.
+SESSION_HISTORY = """
+SELECT to_jsonb(s) AS session, p.full_name, e.name AS exercise_name
+FROM exercise_sessions s
+JOIN patients p ON p.id = s.patient_id
+LEFT JOIN exercises e ON e.id = s.exercise_id
+WHERE p.doctor_id = $1::uuid
+ORDER BY s.created_at DESC
+LIMIT $2
+"""
+
+class AnalyticsUnavailable(Exception):
+    pass
+
+async def _init_connection(conn):
+    for name in ("json", "jsonb"):
+        await conn.set_type_codec(name, encoder=json.dumps, decoder=json.loads, schema="pg_catalog")
+
+class AnalyticsDB:
+    """
+    asyncpg pools for analytics reads that aggregate in the database (GROUP BY,
+    FILTER) instead of pulling every row through PostgREST. GET requests use a
+    read replica when one is healthy and has caught up with the user's writes.
+    Callers check `enabled` and keep their PostgREST path as the fallback, which
+    they also take when a query fails (see AnalyticsUnavailable).
+    """
+    def __init__(self, dsn: Optional[str] = ANALYTICS_DATABASE_URL, replica_dsns: list[str] = ANALYTICS_REPLICA_URLS):
+        self.dsn = dsn
+        self.replicas = ReplicaSet("analytics", replica_dsns if dsn else [], self._replica_lag)
+        self._pools: dict[str, Any] = {}
+        self._pool_locks: dict[str, asyncio.Lock] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.dsn) and asyncpg is not None
+
+    async def _get_pool(self, dsn: str):
+        if dsn not in self._pools:
+            # One lock per database, so an unreachable replica doesn't hold up the primary's pool
+            async with self._pool_locks.setdefault(dsn, asyncio.Lock()):
+                if dsn not in self._pools:
+                    self._pools[dsn] = await asyncpg.create_pool(
+                        dsn,
+                        min_size=ANALYTICS_POOL_MIN_SIZE,
+                        max_size=ANALYTICS_POOL_MAX_SIZE,
+                        statement_cache_size=ANALYTICS_STATEMENT_CACHE_SIZE,
+                        command_timeout=ANALYTICS_TIMEOUT_SECONDS,
+                        timeout=ANALYTICS_TIMEOUT_SECONDS,
+                        init=_init_connection
+                    )
+        return self._pools[dsn]
+
+    async def _replica_lag(self, replica: Replica) -> float:
+        pool = await self._get_pool(replica.url)
+        return await pool.fetchval("SELECT public.replication_lag()")
+
+    async def _fetch(self, name: str, dsn: str, query: str, *args) -> list:
+        start = time.perf_counter()
+        try:
+            with timed("db"):
+                pool = await self._get_pool(dsn)
+                return await pool.fetch(query, *args)
+        except (OSError, asyncio.TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+            raise AnalyticsUnavailable(str(e)) from e
+        finally:
+            db_duration.observe((f"analytics:{name}", "SQL"), time.perf_counter() - start)
+
+    async def fetch(self, name: str, query: str, *args) -> list:
+        """Run one of the queries above; `name` labels it in db_query_duration_seconds."""
+        replica = choose_replica(self.replicas)
+        if replica is not None:
+            try:
+                with self.replicas.acquire(replica):
+                    return await self._fetch(name, replica.url, query, *args)
+            except AnalyticsUnavailable as e:
+                self.replicas.mark_failed(replica, e)
+        try:
+            return await self._fetch(name, self.dsn, query, *args)
+        except AnalyticsUnavailable as e:
+            logger.warning(f"Analytics query {name} failed, falling back to PostgREST: {e}")
+            raise
+
+    async def patient_list_stats(self, patient_ids: list[str]) -> dict[str, dict]:
+        """patient_id -> last_session_at, total_duration, assigned_exercises_count."""
+        if not patient_ids:
+            return {}
+        rows = await self.fetch("patient_list_stats", PATIENT_LIST_STATS, patient_ids)
+        return {r["patient_id"]: {
+            "last_session_at": r["last_session_at"],
+            "total_duration": int(r["total_duration"]),
+            "assigned_exercises_count": r["assigned_exercises_count"]
+        } for r in rows}
+
+    async def patient_stats(self, patient_id: str) -> dict:
+        row = (await self.fetch("patient_stats", PATIENT_STATS, patient_id))[0]
+        return {
+            "total_sessions": row["total_sessions"],
+            "total_duration": int(row["total_duration"]),
+            "avg_accuracy": int(row["avg_accuracy"] or 0),
+            "last_session": row["last_session"]
+        }
+
+    async def session_history(self, doctor_id: str, limit: int = 50) -> list[dict]:
+        rows = await self.fetch("session_history", SESSION_HISTORY, doctor_id, limit)
+        return [{
+            **r["session"],
+            "patients": {"full_name": r["full_name"] or "Unknown"},
+            "exercises": {"title": r["exercise_name"] or "Unknown"}
+        } for r in rows]
+
+    async def close(self):
+        pools, self._pools = self._pools, {}
+        for pool in pools.values():
+            await pool.close()
+
+analytics = AnalyticsDB()
+
+def run_from_thread(query: Callable[..., Awaitable[Any]], *args) -> Optional[Any]:
+    """
+    Run an analytics query from a sync route (FastAPI's threadpool) on the
+    app's event loop. None when analytics is off or the query failed, in which
+    case the route takes its PostgREST path.
+    """
+    if not analytics.enabled:
+        return None
+    try:
+        return anyio.from_thread.run(query, *args)
+    except AnalyticsUnavailable:
+        return None
@@ -2,18 +2,37 @@ from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel
 from typing import Optional, List
 from database import supabase
-import httpx
-import os
 import datetime
 import json
+import uuid
+import asyncio
+import contextlib
+from postgrest.exceptions import APIError
+from async_db import db
+from resilience import StaleCache, UpstreamUnavailable
 from notifications import create_notification
+from cache import invalidate_dashboard, response_cache
+from replicas import primary_reads
+from daily_plan import daily_plans
+from scheduling import schedule_index, parse_minutes, expand_recurrence, to_rrule
+from google_calendar import GOOGLE_CLIENT_ID, GOOGLE_CLIENT_SECRET, exchange_code, token_cache
+from calendar_sync import enqueue_calendar_sync
+from reminders import reminder_scheduler
+import logging
 
-GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
-GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
-GOOGLE_REDIRECT_URI = os.getenv("GOOGLE_REDIRECT_URI", "http://localhost:3000/oauth2/callback")
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/appointments", tags=["Appointments"])
 
+# Last-known-good appointment lists, served while Supabase is failing
+list_cache = StaleCache("appointment_lists")
+
+async def invalidate_appointment_lists(appointments: list[dict]):
+    """Drop cached appointment lists of everyone these appointments belong to."""
+    tags = {t for a in appointments for t in (f"patient:{a.get('patient_id')}", f"doctor:{a.get('doctor_id')}")}
+    # Off the loop: the response cache may be backed by Redis
+    await asyncio.to_thread(response_cache.invalidate, *tags)
+
 # --- Schemas ---
 class CreateAppointmentPayload(BaseModel):
     patient_id: str
@@ -23,6 +42,22 @@ class CreateAppointmentPayload(BaseModel):
     end_time: str          # HH:MM
     notes: Optional[str] = None
 
+class RecurrenceRulePayload(BaseModel):
+    freq: str = "weekly"               # 'daily' or 'weekly'
+    interval: int = 1
+    by_day: Optional[List[str]] = None # MO, TU, WE, TH, FR, SA, SU
+    count: Optional[int] = None
+    until: Optional[str] = None        # YYYY-MM-DD, inclusive
+
+class CreateAppointmentSeriesPayload(BaseModel):
+    patient_id: str
+    appointment_mode: str  # 'virtual' or 'in_clinic'
+    start_date: str        # YYYY-MM-DD
+    start_time: str        # HH:MM
+    end_time: str          # HH:MM
+    rule: RecurrenceRulePayload
+    notes: Optional[str] = None
+
 class UpdateAppointmentPayload(BaseModel):
     appointment_date: Optional[str] = None
     start_time: Optional[str] = None
@@ -30,96 +65,38 @@ class UpdateAppointmentPayload(BaseModel):
     status: Optional[str] = None # scheduled, completed, cancelled
     notes: Optional[str] = None
 
-# --- Helper: Google Calendar ---
-GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
-GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
-
-async def create_google_calendar_event(doctor_id: str, appointment: dict, patient_email: str):
-    """
-    Creates a Google Calendar event with Meet link.
-    Requires doctor to have a stored refresh_token.
-    """
+def validate_slot(start_time: str, end_time: str):
     try:
-        # 1. Get Doctor's Google Refresh Token
-        # NOTE: This assumes the 'doctors' table has 'google_refresh_token'.
-        # If not present, this will fail or return None.
-        doc_res = supabase.from_("doctors").select("google_refresh_token").eq("id", doctor_id).single().execute()
-        
-        refresh_token = None
-        if doc_res.data:
-            refresh_token = doc_res.data.get("google_refresh_token")
-            
-        if not refresh_token:
-            print(f"No Google refresh token found for doctor {doctor_id}")
-            # We will generate a mock link if no token is found, to allow testing without real auth.
-            # In production, this should raise an error.
-            return {"id": "mock_event_id", "meet_link": "https://meet.google.com/mock-link-abc-def"}
+        start, end = parse_minutes(start_time), parse_minutes(end_time)
+    except (ValueError, IndexError):
+        raise HTTPException(status_code=400, detail="Times must be in HH:MM format")
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end_time must be after start_time")
 
-        # 2. Refresh Access Token
-        token_url = "https://oauth2.googleapis.com/token"
-        data = {
-            "client_id": GOOGLE_CLIENT_ID,
-            "client_secret": GOOGLE_CLIENT_SECRET,
-            "refresh_token": refresh_token,
-            "grant_type": "refresh_token"
-        }
-        
-        async with httpx.AsyncClient() as client:
-            resp = await client.post(token_url, data=data)
-            if resp.status_code != 200:
-                print(f"Failed to refresh token: {resp.text}")
-                return None
-            
-            access_token = resp.json()["access_token"]
-            
-        # 3. Create Event
-        event_url = "https://www.googleapis.com/calendar/v3/calendars/primary/events?conferenceDataVersion=1"
-        
-        start_datetime = f"{appointment['appointment_date']}T{appointment['start_time']}:00"
-        end_datetime = f"{appointment['appointment_date']}T{appointment['end_time']}:00"
-        
-        event_body = {
-            "summary": "PhysioCheck Appointment",
-            "description": f"Appointment with patient. Notes: {appointment.get('notes', '')}",
-            "start": {
-                "dateTime": start_datetime,
-                "timeZone": "UTC" # Should ideally be doctor's timezone
-            },
-            "end": {
-                "dateTime": end_datetime,
-                "timeZone": "UTC"
-            },
-            "attendees": [
-                {"email": patient_email}
-            ],
-            "conferenceData": {
-                "createRequest": {
-                    "requestId": f"meet-{appointment['patient_id']}-{datetime.datetime.now().timestamp()}",
-                    "conferenceSolutionKey": {"type": "hangoutsMeet"}
-                }
-            }
-        }
-        
-        headers = {
-            "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json"
-        }
-        
-        async with httpx.AsyncClient() as client:
-            resp = await client.post(event_url, json=event_body, headers=headers)
-            if resp.status_code != 200:
-                print(f"Failed to create event: {resp.text}")
-                return None
-            
-            event_data = resp.json()
-            return {
-                "id": event_data["id"],
-                "meet_link": event_data.get("conferenceData", {}).get("entryPoints", [{}])[0].get("uri")
-            }
-            
-    except Exception as e:
-        print(f"Google Calendar Error: {e}")
-        return None
+def raise_conflict(conflict_id: Optional[str]):
+    raise HTTPException(status_code=409, detail={
+        "message": "Doctor already has an appointment in this time slot",
+        "conflicting_appointment_id": conflict_id
+    })
+
+# Exclusion violation of appointments_no_overlap (migration 0015)
+OVERLAP_VIOLATION = "23P01"
+
+async def raise_overlap(doctor_id: str, appointment_date: str, start_time: str, end_time: str,
+                        exclude_id: Optional[str] = None):
+    """The database rejected an overlap this worker's index missed, i.e. one booked on another worker."""
+    schedule_index.invalidate(doctor_id)
+    conflict_id = await db.run(schedule_index.find_conflict, doctor_id, appointment_date, start_time, end_time,
+                               exclude_id=exclude_id)
+    raise_conflict(conflict_id)
+
+def _series_conflicts(doctor_id: str, dates: list, start_time: str, end_time: str) -> list[dict]:
+    conflicts = []
+    for d in dates:
+        conflict_id = schedule_index.find_conflict(doctor_id, d.isoformat(), start_time, end_time)
+        if conflict_id:
+            conflicts.append({"appointment_date": d.isoformat(), "conflicting_appointment_id": conflict_id})
+    return conflicts
 
 # --- Endpoints ---
 
@@ -142,40 +119,31 @@ async def exchange_google_code(payload: GoogleAuthRequest, request: Request):
         if not GOOGLE_CLIENT_ID or not GOOGLE_CLIENT_SECRET:
              raise HTTPException(status_code=500, detail="Google credentials not configured on server")
 
-        token_url = "https://oauth2.googleapis.com/token"
-        data = {
-            "code": payload.code,
-            "client_id": GOOGLE_CLIENT_ID,
-            "client_secret": GOOGLE_CLIENT_SECRET,
-            "redirect_uri": GOOGLE_REDIRECT_URI,
-            "grant_type": "authorization_code"
-        }
-
-        async with httpx.AsyncClient() as client:
-            resp = await client.post(token_url, data=data)
-        
-        if resp.status_code != 200:
-            print(f"Token exchange failed: {resp.text}")
+        tokens = await exchange_code(payload.code)
+        if not tokens:
             raise HTTPException(status_code=400, detail=f"Failed to exchange code")
 
-        tokens = resp.json()
         refresh_token = tokens.get("refresh_token")
         
         if refresh_token:
             # Update doctor profile
             # 1. Get doctor ID from auth_user_id
-            doc_res = supabase.from_("doctors").select("id").eq("auth_user_id", current_user.id).single().execute()
+            doc_res = await db.from_("doctors").select("id").eq("auth_user_id", current_user.id).single().execute()
             if doc_res.data:
                  doctor_id = doc_res.data["id"]
                  # 2. Update
-                 supabase.table("doctors").update({"google_refresh_token": refresh_token}).eq("id", doctor_id).execute()
+                 await db.table("doctors").update({"google_refresh_token": refresh_token}).eq("id", doctor_id).execute()
+                 # Seed the caches so the first appointment skips the refresh round-trip
+                 token_cache.store_refresh_token(doctor_id, refresh_token)
+                 if tokens.get("access_token"):
+                     token_cache.store(doctor_id, tokens["access_token"], tokens.get("expires_in", 3600))
         
         return {"status": "success", "connected": True}
         
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Google Auth Error: {e}")
+        logger.error(f"Google Auth Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("")
@@ -188,7 +156,7 @@ async def create_appointment(payload: CreateAppointmentPayload, request: Request
             raise HTTPException(status_code=403, detail="Only doctors can create appointments")
             
         # Get doctor DB ID
-        doc_res = supabase.from_("doctors").select("id").eq("auth_user_id", current_user.id).single().execute()
+        doc_res = await db.from_("doctors").select("id").eq("auth_user_id", current_user.id).single().execute()
         if not doc_res.data:
              raise HTTPException(status_code=404, detail="Doctor profile not found")
         doctor_id = doc_res.data["id"]
@@ -205,47 +173,169 @@ async def create_appointment(payload: CreateAppointmentPayload, request: Request
             "status": "scheduled"
         }
         
-        # Google Calendar Logic (if virtual)
-        if payload.appointment_mode == "virtual":
-            # Fetch patient email for invite
-            pat_res = supabase.from_("patients").select("email").eq("id", payload.patient_id).single().execute()
-            if pat_res.data:
-                patient_email = pat_res.data["email"]
-                
-                # Call helper
-                g_event = await create_google_calendar_event(doctor_id, appt_data, patient_email)
-                
-                if g_event:
-                    appt_data["google_event_id"] = g_event.get("id")
-                    appt_data["google_meet_link"] = g_event.get("meet_link")
-                else:
-                    # If failed, maybe warn? For now we proceed but without link, or use mock.
-                    pass
-        
-        # Insert into DB
-        res = supabase.from_("appointments").insert(appt_data).execute()
+        # Reject overlapping bookings. The doctor's booking lock is held from the
+        # check until the new row is indexed, so no other request on this worker
+        # can take the slot in between.
+        validate_slot(payload.start_time, payload.end_time)
+        async with schedule_index.booking_lock(doctor_id):
+            conflict_id = await db.run(schedule_index.find_conflict, doctor_id, payload.appointment_date, payload.start_time, payload.end_time)
+            if conflict_id:
+                raise_conflict(conflict_id)
+            
+            # Insert into DB
+            try:
+                res = await db.from_("appointments").insert(appt_data).execute()
+            except APIError as e:
+                if e.code != OVERLAP_VIOLATION:
+                    raise
+                await raise_overlap(doctor_id, payload.appointment_date, payload.start_time, payload.end_time)
+            
+            if not res.data:
+                 raise HTTPException(status_code=500, detail="Failed to create appointment")
+
+            schedule_index.add(doctor_id, res.data[0]["id"], payload.appointment_date, payload.start_time, payload.end_time)
+        reminder_scheduler.schedule(res.data[0])
+        invalidate_dashboard(doctor_id=doctor_id)
+        daily_plans.invalidate(payload.patient_id)
+        await invalidate_appointment_lists(res.data)
         
-        if not res.data:
-             raise HTTPException(status_code=500, detail="Failed to create appointment")
+        # Google Calendar event + Meet link (if virtual) are created off-request
+        # by the calendar sync worker, which writes them back to the row.
+        if payload.appointment_mode == "virtual":
+            await db.run(enqueue_calendar_sync, doctor_id, res.data[0]["id"], "create")
              
         # Notify Patient
         try:
             # Get patient auth id
-            p_auth_res = supabase.from_("patients").select("auth_user_id").eq("id", payload.patient_id).single().execute()
+            p_auth_res = await db.from_("patients").select("auth_user_id").eq("id", payload.patient_id).single().execute()
             if p_auth_res.data:
-                create_notification(
+                await db.run(
+                    create_notification,
                     user_id=p_auth_res.data["auth_user_id"],
                     title="New Appointment",
                     message=f"You have a new appointment on {payload.appointment_date} at {payload.start_time}",
                     type="info"
                 )
         except Exception as e:
-            print(f"Notification error: {e}")
+            logger.error(f"Notification error: {e}")
             
         return res.data[0]
         
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error creating appointment: {e}")
+        logger.error(f"Error creating appointment: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/series")
+async def create_appointment_series(payload: CreateAppointmentSeriesPayload, request: Request):
+    """
+    Schedule a recurring treatment plan, e.g. twice a week for six weeks.
+    All occurrences are conflict-checked together and inserted in one write;
+    nothing is created if any of them overlaps an existing appointment.
+    """
+    try:
+        current_user = request.state.user
+        role = current_user.user_metadata.get("role")
+        
+        if role != "doctor":
+            raise HTTPException(status_code=403, detail="Only doctors can create appointments")
+            
+        # Get doctor DB ID
+        doc_res = await db.from_("doctors").select("id").eq("auth_user_id", current_user.id).single().execute()
+        if not doc_res.data:
+             raise HTTPException(status_code=404, detail="Doctor profile not found")
+        doctor_id = doc_res.data["id"]
+        
+        validate_slot(payload.start_time, payload.end_time)
+        try:
+            dates = expand_recurrence(
+                datetime.date.fromisoformat(payload.start_date),
+                payload.rule.freq.lower(),
+                payload.rule.interval,
+                payload.rule.by_day,
+                payload.rule.count,
+                datetime.date.fromisoformat(payload.rule.until) if payload.rule.until else None
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if not dates:
+            raise HTTPException(status_code=400, detail="Recurrence produces no occurrences")
+        
+        series_id = str(uuid.uuid4())
+        recurrence_rule = to_rrule(payload.rule.freq.lower(), payload.rule.interval, dates, payload.rule.by_day)
+        rows = [{
+            "patient_id": payload.patient_id,
+            "doctor_id": doctor_id,
+            "appointment_mode": payload.appointment_mode,
+            "appointment_date": d.isoformat(),
+            "start_time": payload.start_time,
+            "end_time": payload.end_time,
+            "notes": payload.notes,
+            "status": "scheduled",
+            "series_id": series_id,
+            "recurrence_rule": recurrence_rule
+        } for d in dates]
+        
+        async with schedule_index.booking_lock(doctor_id):
+            # One pass over the index for every occurrence
+            conflicts = await db.run(_series_conflicts, doctor_id, dates, payload.start_time, payload.end_time)
+            if not conflicts:
+                # Single bulk insert for the whole series
+                try:
+                    res = await db.from_("appointments").insert(rows).execute()
+                except APIError as e:
+                    if e.code != OVERLAP_VIOLATION:
+                        raise
+                    # Booked on another worker; reload the index to say which occurrences clash
+                    schedule_index.invalidate(doctor_id)
+                    conflicts = await db.run(_series_conflicts, doctor_id, dates, payload.start_time, payload.end_time)
+                    if not conflicts:
+                        # The other booking has since gone; still nothing was created
+                        raise_conflict(None)
+            if conflicts:
+                raise HTTPException(status_code=409, detail={
+                    "message": f"{len(conflicts)} of {len(dates)} occurrences overlap existing appointments",
+                    "conflicts": conflicts
+                })
+            
+            if not res.data:
+                 raise HTTPException(status_code=500, detail="Failed to create appointment series")
+            
+            for appt in res.data:
+                schedule_index.add(doctor_id, appt["id"], appt["appointment_date"], payload.start_time, payload.end_time)
+        for appt in res.data:
+            reminder_scheduler.schedule(appt)
+        invalidate_dashboard(doctor_id=doctor_id)
+        daily_plans.invalidate(payload.patient_id)
+        await invalidate_appointment_lists(res.data)
+        
+        # One recurring calendar event for the whole series
+        if payload.appointment_mode == "virtual":
+            first = min(res.data, key=lambda a: a["appointment_date"])
+            await db.run(enqueue_calendar_sync, doctor_id, first["id"], "create_series", series_id=series_id)
+        
+        # One consolidated notification instead of one per occurrence
+        try:
+            p_auth_res = await db.from_("patients").select("auth_user_id").eq("id", payload.patient_id).single().execute()
+            if p_auth_res.data:
+                await db.run(
+                    create_notification,
+                    user_id=p_auth_res.data["auth_user_id"],
+                    title="New Appointment Series",
+                    message=f"You have {len(dates)} appointments scheduled from {dates[0].isoformat()} to {dates[-1].isoformat()} at {payload.start_time}",
+                    type="info",
+                    data={"series_id": series_id}
+                )
+        except Exception as e:
+            logger.error(f"Notification error: {e}")
+        
+        return {"series_id": series_id, "recurrence_rule": recurrence_rule, "appointments": res.data}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error creating appointment series: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("")
@@ -253,51 +343,172 @@ async def list_appointments(request: Request, patient_id: Optional[str] = None,
     try:
         current_user = request.state.user
         role = current_user.user_metadata.get("role")
+        cache_key = f"appointments:{current_user.id}:{patient_id}"
+        cached = await asyncio.to_thread(response_cache.get, cache_key)
+        if cached is not None:
+            return cached
+        # Whose appointments these are, so an empty list is dropped by the first one created too
+        tags = [f"user:{current_user.id}"]
         
-        query = supabase.from_("appointments").select("*, patients(full_name)")
+        async def fetch():
+            query = db.from_("appointments").select("*, patients(full_name)")
+            
+            if role == "doctor":
+                # If specifically asking for a patient's appointments
+                if patient_id:
+                    query = query.eq("patient_id", patient_id)
+                    tags.append(f"patient:{patient_id}")
+                else:
+                    # Get this doctor's appointments
+                    doc_res = await db.from_("doctors").select("id").eq("auth_user_id", current_user.id).single().execute()
+                    if doc_res.data:
+                         query = query.eq("doctor_id", doc_res.data["id"])
+                         tags.append(f"doctor:{doc_res.data['id']}")
+            elif role == "patient":
+                # Only see own appointments
+                pat_res = await db.from_("patients").select("id").eq("auth_user_id", current_user.id).single().execute()
+                if pat_res.data:
+                    query = query.eq("patient_id", pat_res.data["id"])
+                    tags.append(f"patient:{pat_res.data['id']}")
+                    
+            # Order by date/time
+            query = query.order("appointment_date", desc=True).order("start_time", desc=True)
+            
+            res = await query.execute()
+            return res.data or []
+        
+        # Cached copies must not come from a lagging replica
+        with primary_reads():
+            appointments = await list_cache.read_async(f"{current_user.id}:{patient_id}", fetch, "appointments")
+        if len(tags) > 1:
+            tags += [t for a in appointments for t in (f"patient:{a.get('patient_id')}", f"doctor:{a.get('doctor_id')}")]
+            await asyncio.to_thread(response_cache.set, cache_key, appointments, tags)
+        return appointments
+        
+    except UpstreamUnavailable:
+        raise HTTPException(status_code=503, detail="Appointments temporarily unavailable")
+    except Exception as e:
+        logger.error(f"List appointments error: {e}")
+        return []
+
+@router.get("/free-slots")
+def get_free_slots(
+    request: Request,
+    start_date: str,
+    end_date: Optional[str] = None,
+    slot_minutes: int = 30,
+    day_start: str = "09:00",
+    day_end: str = "18:00"
+):
+    """
+    Free windows in the doctor's schedule between start_date and end_date
+    (inclusive, YYYY-MM-DD), within working hours, of at least slot_minutes.
+    Patients get their own doctor's availability.
+    """
+    try:
+        current_user = request.state.user
+        role = current_user.user_metadata.get("role")
         
         if role == "doctor":
-            # If specifically asking for a patient's appointments
-            if patient_id:
-                query = query.eq("patient_id", patient_id)
-            else:
-                # Get this doctor's appointments
-                doc_res = supabase.from_("doctors").select("id").eq("auth_user_id", current_user.id).single().execute()
-                if doc_res.data:
-                     query = query.eq("doctor_id", doc_res.data["id"])
-        elif role == "patient":
-            # Only see own appointments
-            pat_res = supabase.from_("patients").select("id").eq("auth_user_id", current_user.id).single().execute()
-            if pat_res.data:
-                query = query.eq("patient_id", pat_res.data["id"])
-                
-        # Order by date/time
-        query = query.order("appointment_date", desc=True).order("start_time", desc=True)
+            doc_res = supabase.from_("doctors").select("id").eq("auth_user_id", current_user.id).single().execute()
+            doctor_id = doc_res.data["id"] if doc_res.data else None
+        else:
+            pat_res = supabase.from_("patients").select("doctor_id").eq("auth_user_id", current_user.id).single().execute()
+            doctor_id = pat_res.data.get("doctor_id") if pat_res.data else None
         
-        res = query.execute()
-        return res.data or []
+        if not doctor_id:
+            raise HTTPException(status_code=404, detail="Doctor not found")
         
+        try:
+            first = datetime.date.fromisoformat(start_date)
+            last = datetime.date.fromisoformat(end_date) if end_date else first
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Dates must be in YYYY-MM-DD format")
+        if last < first or (last - first).days > 62:
+            raise HTTPException(status_code=400, detail="Date range must be between 1 and 63 days")
+        validate_slot(day_start, day_end)
+        
+        return schedule_index.free_slots(doctor_id, first, last, day_start, day_end, max(5, slot_minutes))
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"List appointments error: {e}")
-        return []
+        logger.error(f"Free slot search error: {e}")
+        raise HTTPException(status_code=500, detail="Failed to search free slots")
 
 @router.patch("/{appointment_id}")
 async def update_appointment(appointment_id: str, payload: UpdateAppointmentPayload, request: Request):
     try:
-        # Just basic update for now
         data = {k: v for k, v in payload.dict().items() if v is not None}
-        res = supabase.from_("appointments").update(data).eq("id", appointment_id).execute()
+        
+        # Check the resulting slot against the doctor's other appointments
+        merged = None
+        guard = contextlib.nullcontext()
+        if any(k in data for k in ("appointment_date", "start_time", "end_time", "status")):
+            current_res = await db.from_("appointments")\
+                .select("doctor_id, appointment_date, start_time, end_time, status")\
+                .eq("id", appointment_id)\
+                .execute()
+            if not current_res.data:
+                raise HTTPException(status_code=404, detail="Appointment not found")
+            merged = {**current_res.data[0], **data}
+            guard = schedule_index.booking_lock(merged["doctor_id"])
+        
+        async with guard:
+            if merged and merged.get("status") != "cancelled":
+                validate_slot(merged["start_time"], merged["end_time"])
+                conflict_id = await db.run(
+                    schedule_index.find_conflict,
+                    merged["doctor_id"], merged["appointment_date"],
+                    merged["start_time"], merged["end_time"],
+                    exclude_id=appointment_id
+                )
+                if conflict_id:
+                    raise_conflict(conflict_id)
+            
+            try:
+                res = await db.from_("appointments").update(data).eq("id", appointment_id).execute()
+            except APIError as e:
+                if e.code != OVERLAP_VIOLATION or not merged:
+                    raise
+                await raise_overlap(merged["doctor_id"], merged["appointment_date"],
+                                    merged["start_time"], merged["end_time"], exclude_id=appointment_id)
+            for appt in res.data or []:
+                if appt.get("status") == "cancelled":
+                    schedule_index.remove(appt["id"])
+                else:
+                    schedule_index.add(appt["doctor_id"], appt["id"], appt["appointment_date"], appt["start_time"], appt["end_time"])
+        for appt in res.data or []:
+            if "appointment_date" in data or "start_time" in data:
+                await reminder_scheduler.reschedule(appt)
+            else:
+                reminder_scheduler.schedule(appt)
+            invalidate_dashboard(doctor_id=appt.get("doctor_id"))
+            daily_plans.invalidate(appt["patient_id"])
+            if appt.get("google_event_id") or appt.get("appointment_mode") == "virtual":
+                await db.run(enqueue_calendar_sync, appt["doctor_id"], appt["id"], "patch")
+        await invalidate_appointment_lists(res.data or [])
         return res.data
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Update error: {e}")
+        logger.error(f"Update error: {e}")
         raise HTTPException(status_code=500, detail="Update failed")
 
 @router.delete("/{appointment_id}")
 async def delete_appointment(appointment_id: str, request: Request):
     try:
-        # TODO: Delete from Google Calendar if exists
-        res = supabase.from_("appointments").delete().eq("id", appointment_id).execute()
+        res = await db.from_("appointments").delete().eq("id", appointment_id).execute()
+        for appt in res.data or []:
+            schedule_index.remove(appt["id"])
+            reminder_scheduler.cancel(appt["id"])
+            invalidate_dashboard(doctor_id=appt.get("doctor_id"))
+            daily_plans.invalidate(appt["patient_id"])
+            # A virtual appointment whose create job hasn't run yet has no event
+            # id; that job then finds the row gone and creates nothing.
+            if appt.get("google_event_id"):
+                await db.run(enqueue_calendar_sync, appt["doctor_id"], appt["id"], "delete", appt["google_event_id"])
+        await invalidate_appointment_lists(res.data or [])
         return {"status": "success"}
     except Exception as e:
-        print(f"Delete error: {e}")
+        logger.error(f"Delete error: {e}")
         raise HTTPException(status_code=500, detail="Delete failed")
@@ -0,0 +1,83 @@
+from typing import Optional
+from database import supabase
+from cache import TTLCache
+
+# Columns a doctor prescribes; a change in any of them is an update
+ASSIGNMENT_FIELDS = ["sets", "reps", "frequency", "start_date", "end_date", "selected_days", "notes"]
+
+# Responses of completed bulk requests, keyed by "<doctor_auth_id>:<idempotency key>".
+# A retry that lands on another worker is still safe: the diff finds nothing to change.
+idempotency_cache = TTLCache(ttl_seconds=24 * 60 * 60)
+
+def _normalized(row: dict, field: str):
+    value = row.get(field)
+    if field == "selected_days":
+        return sorted(value or [])
+    if field == "start_date" or field == "end_date":
+        return str(value)[:10] if value else None
+    return value
+
+def fetch_active_assignments(patient_ids: list[str], exercise_ids: Optional[list[str]] = None) -> list[dict]:
+    query = supabase.from_("assigned_exercises")\
+        .select("*")\
+        .in_("patient_id", patient_ids)\
+        .eq("status", "active")
+    if exercise_ids is not None:
+        query = query.in_("exercise_id", exercise_ids)
+    return query.execute().data or []
+
+def diff_assignments(requested: list[dict], existing: list[dict], archive_missing: bool) -> dict:
+    """
+    Compare requested (patient_id, exercise_id) prescriptions with the active rows.
+    Returns rows to insert, rows to update (with id), untouched rows and,
+    if archive_missing, existing rows absent from the request.
+    """
+    current = {(row["patient_id"], row["exercise_id"]): row for row in existing}
+    wanted: dict[tuple[str, str], dict] = {}
+    for row in requested:
+        # Last one wins if the same pair is listed twice
+        wanted[(row["patient_id"], row["exercise_id"])] = row
+
+    to_insert, to_update, unchanged = [], [], []
+    for key, row in wanted.items():
+        old = current.get(key)
+        if old is None:
+            to_insert.append({**row, "status": "active"})
+        elif any(_normalized(old, f) != _normalized(row, f) for f in ASSIGNMENT_FIELDS):
+            to_update.append({**old, **{f: row.get(f) for f in ASSIGNMENT_FIELDS}})
+        else:
+            unchanged.append(old)
+
+    to_archive = [row for key, row in current.items() if key not in wanted] if archive_missing else []
+    return {"insert": to_insert, "update": to_update, "unchanged": unchanged, "archive": to_archive}
+
+def apply_assignment_diff(diff: dict) -> dict:
+    """Write a diff with at most three statements and return a change summary."""
+    if diff["insert"]:
+        supabase.from_("assigned_exercises").insert(diff["insert"]).execute()
+    if diff["update"]:
+        # Full rows keyed by id, so the upsert is a pure bulk update
+        supabase.from_("assigned_exercises").upsert(diff["update"], on_conflict="id").execute()
+    if diff["archive"]:
+        supabase.from_("assigned_exercises")\
+            .update({"status": "archived"})\
+            .in_("id", [row["id"] for row in diff["archive"]])\
+            .execute()
+
+    def pairs(rows):
+        return [{"patient_id": r["patient_id"], "exercise_id": r["exercise_id"]} for r in rows]
+
+    return {
+        "created": len(diff["insert"]),
+        "updated": len(diff["update"]),
+        "unchanged": len(diff["unchanged"]),
+        "archived": len(diff["archive"]),
+        "changes": {
+            "created": pairs(diff["insert"]),
+            "updated": pairs(diff["update"]),
+            "archived": pairs(diff["archive"])
+        }
+    }
+
+def changed_patient_ids(diff: dict) -> set[str]:
+    return {row["patient_id"] for key in ("insert", "update", "archive") for row in diff[key]}
@@ -0,0 +1,138 @@
+import os
+import time
+import asyncio
+import threading
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor
+from database import supabase
+from instrumentation import Histogram, Gauge, METRICS, COUNT_BUCKETS
+from instrumentation import builder_table
+from singleflight import async_single_flight, read_key, SINGLEFLIGHT_ENABLED
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Supabase round-trips from async code run on this many threads; the rest queue
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "16"))
+
+class DBExecutor:
+    """
+    Bounded thread pool for the sync Supabase client. Calls keep the caller's
+    contextvars, so request metrics still attribute their time to the request.
+    """
+    def __init__(self, size: int = DB_POOL_SIZE):
+        self.size = size
+        self.queued = 0
+        self.active = 0
+        self._executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="db")
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """Queue a call on the pool without waiting for it, e.g. a background refresh from a sync route."""
+        ctx = contextvars.copy_context()
+        submitted = time.perf_counter()
+        with self._lock:
+            depth = self.queued
+            self.queued += 1
+        pool_queue_depth.observe((), depth)
+
+        def job():
+            with self._lock:
+                self.queued -= 1
+                self.active += 1
+            pool_wait.observe((), time.perf_counter() - submitted)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.active -= 1
+
+        future = self._executor.submit(ctx.run, job)
+
+        def on_done(f):
+            # A call cancelled while still queued never runs job()
+            if f.cancelled():
+                with self._lock:
+                    self.queued -= 1
+        future.add_done_callback(on_done)
+        return future
+
+    async def run(self, fn, *args, **kwargs):
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+db_executor = DBExecutor()
+
+pool_wait = Histogram(
+    "db_pool_wait_seconds", "Time a DB call from async code waited for a free pool thread.", ())
+pool_queue_depth = Histogram(
+    "db_pool_queue_depth", "Calls already waiting for the pool when a DB call was submitted.", (), COUNT_BUCKETS)
+METRICS.extend([
+    pool_wait,
+    pool_queue_depth,
+    Gauge("db_pool_queued", "DB calls waiting for a pool thread right now.", lambda: db_executor.queued),
+    Gauge("db_pool_active", "DB calls running on the pool right now.", lambda: db_executor.active),
+    Gauge("db_pool_size", "Configured DB pool threads.", lambda: db_executor.size),
+])
+
+class AsyncQuery:
+    """
+    Wraps a PostgREST request builder: chain filters exactly as on the sync
+    client, then `await .execute()` to run the round-trip on the DB pool.
+    """
+    __slots__ = ("_builder",)
+
+    def __init__(self, builder):
+        self._builder = builder
+
+    def __getattr__(self, name):
+        attr = getattr(self._builder, name)
+        if not callable(attr):
+            # e.g. the `.not_` property returns a builder
+            return AsyncQuery(attr) if hasattr(attr, "execute") else attr
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            return AsyncQuery(result) if hasattr(result, "execute") else result
+        return call
+
+    async def execute(self):
+        key = read_key(self._builder)
+        if key is None or not SINGLEFLIGHT_ENABLED:
+            return await db_executor.run(self._builder.execute)
+        # Identical reads in flight on this loop share one pool slot and round-trip
+        return await async_single_flight.do(
+            (type(self._builder).__name__,) + key,
+            lambda: db_executor.run(self._builder.execute),
+            builder_table(self._builder)
+        )
+
+class AsyncSupabase:
+    """
+    The parts of database.supabase used from async handlers and WebSockets,
+    with every round-trip awaited on the DB pool instead of run on the loop.
+    """
+    def __init__(self, client):
+        self._client = client
+
+    def from_(self, table: str) -> AsyncQuery:
+        return AsyncQuery(self._client.from_(table))
+
+    table = from_
+
+    def rpc(self, fn: str, params: dict = None) -> AsyncQuery:
+        return AsyncQuery(self._client.rpc(fn, params or {}))
+
+    async def get_user(self, token: str):
+        # A page load fires several requests with the same token at once
+        if not SINGLEFLIGHT_ENABLED:
+            return await db_executor.run(self._client.auth.get_user, token)
+        return await async_single_flight.do(("auth", token), lambda: db_executor.run(self._client.auth.get_user, token), "auth")
+
+    async def run(self, fn, *args, **kwargs):
+        """Any other sync client call, e.g. db.run(supabase.auth.admin.get_user_by_id, uid)."""
+        return await db_executor.run(fn, *args, **kwargs)
+
+db = AsyncSupabase(supabase)
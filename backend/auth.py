@@ -2,6 +2,10 @@ from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel, EmailStr
 from typing import Optional
 from database import supabase
+from replicas import note_write
+import logging
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(tags=["Auth"])
 
@@ -12,7 +16,7 @@ class AuthBody(BaseModel):
     full_name: Optional[str] = None
 
 @router.post("/login")
-async def login(body: AuthBody):
+def login(body: AuthBody):
     try:
         res = supabase.auth.sign_in_with_password({"email": body.email, "password": body.password})
         if not res.user or not res.session:
@@ -31,10 +35,12 @@ async def login(body: AuthBody):
                 else:
                     # Auto-create doctor profile if missing
                     new_doc = supabase.from_("doctors").insert({"auth_user_id": res.user.id}).execute()
+                    # Their first dashboard requests must see the new row
+                    note_write(res.user.id)
                     if new_doc.data:
                         doctor_id = new_doc.data[0]["id"]
             except Exception as e:
-                print(f"Error fetching/creating doctor profile: {e}")
+                logger.error(f"Error fetching/creating doctor profile: {e}")
                 pass
         
         return {
@@ -49,11 +55,11 @@ async def login(body: AuthBody):
             }
         }
     except Exception as e:
-        print(f"Login error: {e}")
+        logger.error(f"Login error: {e}")
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
 @router.post("/register")
-async def register(body: AuthBody):
+def register(body: AuthBody):
     try:
         role = body.role or "patient"
         
@@ -84,8 +90,9 @@ async def register(body: AuthBody):
                     "email": body.email,
                     "status": "active" # Assuming default status
                 }).execute()
+            note_write(res.user.id)
         except Exception as e:
-             print(f"Failed to create {role} profile: {e}")
+             logger.error(f"Failed to create {role} profile: {e}")
              # We might want to rollback auth user here if possible, but hard with Supabase.
              # User exists but no profile.
              
@@ -95,5 +102,5 @@ async def register(body: AuthBody):
             "email": res.user.email
         }
     except Exception as e:
-        print(f"Registration error: {e}")
+        logger.error(f"Registration error: {e}")
         raise HTTPException(status_code=400, detail="Registration failed. Email may already be in use.")
\ No newline at end of file
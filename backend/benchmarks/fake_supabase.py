@@ -0,0 +1,501 @@
+"""
+In-process stand-in for the parts of Supabase that the backend talks to:
+PostgREST (/rest/v1), GoTrue (/auth/v1) and Realtime postgres_changes
+(/realtime/v1/websocket, for the change feed). Tables live in memory, every
+request can be delayed by a configurable latency, and calls are counted so
+benchmarks can report database round-trips per request.
+
+Only the query features the backend actually uses are implemented: filters
+(eq, neq, gt, gte, lt, lte, like, ilike, is, in, not.*, or/and), order, limit,
+offset, exact counts, single-object responses, many-to-one embeds such as
+"*, exercises(*)", insert, upsert, update, delete and registered RPCs.
+Every REST write is published to Realtime subscribers; write_external()
+changes rows the way the Supabase dashboard or a SQL script would.
+"""
+import json
+import random
+import asyncio
+import threading
+import uuid
+from datetime import datetime
+from typing import Any, Callable, Optional
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route, WebSocketRoute
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+# Columns filled in on insert when the row doesn't carry them
+DEFAULTS: dict[str, dict[str, Callable[[], Any]]] = {
+    "*": {"id": lambda: str(uuid.uuid4()), "created_at": lambda: datetime.utcnow().isoformat()},
+    "assigned_exercises": {"status": lambda: "active", "assigned_at": lambda: datetime.utcnow().isoformat()},
+    "exercise_sessions": {"status": lambda: "in_progress", "started_at": lambda: datetime.utcnow().isoformat()},
+    "appointments": {"status": lambda: "scheduled"},
+    "notifications": {"is_read": lambda: False},
+    "messages": {"is_read": lambda: False},
+}
+
+class RPCError(Exception):
+    """Raised by RPC handlers for a PostgREST error response, like RAISE SQLSTATE 'PTxxx'."""
+    def __init__(self, status: int, code: str, message: str):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+        self.message = message
+
+def start_exercise_session(fake: "FakeSupabase", params: dict) -> dict:
+    """migrations/0013_start_exercise_session.sql"""
+    patient = next((p for p in fake.table("patients") if p.get("auth_user_id") == params["p_auth_user_id"]), None)
+    if patient is None:
+        raise RPCError(404, "PT404", "Patient profile not found. Please complete your profile.")
+    if not any(e["id"] == params["p_exercise_id"] for e in fake.table("exercises")):
+        raise RPCError(404, "PT404", "Exercise not found")
+    session = fake.rpc_insert("exercise_sessions", {
+        "patient_id": patient["id"],
+        "exercise_id": params["p_exercise_id"],
+        "duration_seconds": params.get("p_duration_seconds") or 0,
+        "repetitions": params.get("p_repetitions") or 0,
+        "notes": params.get("p_notes"),
+        "status": params.get("p_status") or "in_progress"
+    })
+    doctor = next((d for d in fake.table("doctors") if d["id"] == patient.get("doctor_id")), None)
+    if doctor is not None:
+        fake.rpc_insert("notifications", {
+            "user_id": doctor["auth_user_id"],
+            "title": "Patient Started Session",
+            "message": f"{patient.get('full_name') or 'Patient'} has started a new exercise session.",
+            "type": "info",
+            "data": {"session_id": session["id"], "patient_id": patient["id"]}
+        })
+    return session
+
+# Unique keys other than id, mirroring the SQL schema
+UNIQUE: dict[str, list[tuple[str, ...]]] = {
+    "appointment_reminders": [("appointment_id", "offset_minutes")],
+}
+
+def _text(value: Any) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return str(value)
+
+def _compare(stored: Any, raw: str) -> Optional[int]:
+    if stored is None:
+        return None
+    try:
+        a, b = float(stored), float(raw)
+    except (TypeError, ValueError):
+        a, b = _text(stored), raw
+    return (a > b) - (a < b)
+
+def _split_top_level(value: str) -> list[str]:
+    parts, depth, quoted, current = [], 0, False, ""
+    for ch in value:
+        if ch == '"':
+            quoted = not quoted
+        elif not quoted and ch == "(":
+            depth += 1
+        elif not quoted and ch == ")":
+            depth -= 1
+        elif not quoted and ch == "," and depth == 0:
+            parts.append(current)
+            current = ""
+            continue
+        current += ch
+    if current:
+        parts.append(current)
+    return [p.strip() for p in parts]
+
+def _unquote(value: str) -> str:
+    return value[1:-1] if len(value) >= 2 and value[0] == value[-1] == '"' else value
+
+def _like(stored: Any, pattern: str, case_insensitive: bool) -> bool:
+    import fnmatch
+    text, pattern = _text(stored), pattern.replace("%", "*")
+    if case_insensitive:
+        text, pattern = text.lower(), pattern.lower()
+    return fnmatch.fnmatchcase(text, pattern)
+
+def _match_op(row: dict, column: str, expression: str) -> bool:
+    negate = expression.startswith("not.")
+    if negate:
+        expression = expression[4:]
+    op, _, raw = expression.partition(".")
+    stored = row.get(column)
+    if op == "eq":
+        result = _text(stored) == _unquote(raw)
+    elif op == "neq":
+        result = stored is not None and _text(stored) != _unquote(raw)
+    elif op in ("gt", "gte", "lt", "lte"):
+        cmp = _compare(stored, _unquote(raw))
+        result = cmp is not None and {"gt": cmp > 0, "gte": cmp >= 0, "lt": cmp < 0, "lte": cmp <= 0}[op]
+    elif op == "is":
+        result = _text(stored) == raw if raw != "null" else stored is None
+    elif op == "in":
+        values = {_unquote(v) for v in _split_top_level(raw.strip("()"))}
+        result = _text(stored) in values
+    elif op in ("like", "ilike"):
+        result = _like(stored, raw, op == "ilike")
+    else:
+        raise ValueError(f"Unsupported operator {op}")
+    return not result if negate else result
+
+def _match_logic(row: dict, conditions: str, any_of: bool) -> bool:
+    results = []
+    for condition in _split_top_level(conditions):
+        if condition.startswith(("and(", "or(")):
+            name, _, inner = condition.partition("(")
+            results.append(_match_logic(row, inner[:-1], name == "or"))
+        else:
+            column, _, expression = condition.partition(".")
+            results.append(_match_op(row, column, expression))
+    return any(results) if any_of else all(results)
+
+def _parse_select(select: str) -> tuple[list[str], dict[str, list[str]]]:
+    columns, embeds = [], {}
+    for part in _split_top_level(select or "*"):
+        if "(" in part:
+            name, _, inner = part.partition("(")
+            embeds[name.split(":")[-1].strip()] = _split_top_level(inner[:-1])
+        else:
+            columns.append(part)
+    return columns, embeds
+
+class FakeSupabase:
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0):
+        self.tables: dict[str, list[dict]] = {}
+        self.users: dict[str, dict] = {}
+        self.tokens: dict[str, str] = {}
+        self.rpcs: dict[str, Callable[["FakeSupabase", dict], Any]] = {}
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rest_calls = 0
+        self.auth_calls = 0
+        self._lock = threading.Lock()
+        # Realtime sockets -> topic -> [(binding id, postgres_changes binding)]
+        self._subscribers: dict[WebSocket, dict[str, list[tuple[int, dict]]]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.app = Starlette(routes=[
+            Route("/rest/v1/rpc/{name}", self._rpc, methods=["GET", "POST"]),
+            Route("/rest/v1/{table}", self._rest, methods=["GET", "POST", "PATCH", "DELETE", "HEAD"]),
+            Route("/auth/v1/{path:path}", self._auth, methods=["GET", "POST", "PUT"]),
+            WebSocketRoute("/realtime/v1/websocket", self._realtime),
+        ])
+        # Served under another host name, the fake is a read replica with no lag
+        self.register_rpc("replication_lag", lambda fake, params: 0.0)
+        self.register_rpc("start_exercise_session", start_exercise_session)
+        # Rows written by the running RPC handler, published once it returns
+        self._rpc_changes: list[tuple[str, str, list[dict]]] = []
+
+    # --- seeding -----------------------------------------------------------
+
+    def table(self, name: str) -> list[dict]:
+        return self.tables.setdefault(name, [])
+
+    def insert(self, table: str, row: dict) -> dict:
+        full = dict(row)
+        for defaults in (DEFAULTS["*"], DEFAULTS.get(table, {})):
+            for column, factory in defaults.items():
+                full.setdefault(column, factory())
+        self.table(table).append(full)
+        return full
+
+    def add_user(self, role: str, email: Optional[str] = None, **metadata) -> tuple[dict, str]:
+        """Create an auth user and return it with a bearer token accepted by /auth/v1/user."""
+        user_id = str(uuid.uuid4())
+        user = {
+            "id": user_id,
+            "aud": "authenticated",
+            "role": "authenticated",
+            "email": email or f"{role}-{user_id[:8]}@bench.local",
+            "app_metadata": {"provider": "email"},
+            "user_metadata": {"role": role, **metadata},
+            "created_at": datetime.utcnow().isoformat() + "Z"
+        }
+        token = f"bench-{user_id}"
+        self.users[user_id] = user
+        self.tokens[token] = user_id
+        return user, token
+
+    def register_rpc(self, name: str, handler: Callable[["FakeSupabase", dict], Any]):
+        self.rpcs[name] = handler
+
+    def rpc_insert(self, table: str, row: dict) -> dict:
+        """insert() for RPC handlers: the row is also published to Realtime, like a REST insert."""
+        full = self.insert(table, row)
+        self._rpc_changes.append((table, "INSERT", [dict(full)]))
+        return full
+
+    def write_external(self, table: str, match: dict, changes: Optional[dict] = None, delete: bool = False) -> list[dict]:
+        """
+        Update (or delete) rows matching `match` without going through the API,
+        and publish the change to Realtime subscribers. Safe to call from any thread.
+        """
+        with self._lock:
+            rows = [r for r in self.table(table) if all(_text(r.get(k)) == _text(v) for k, v in match.items())]
+            if delete:
+                ids = {id(r) for r in rows}
+                self.tables[table] = [r for r in self.table(table) if id(r) not in ids]
+            else:
+                for row in rows:
+                    row.update(changes or {})
+            rows = [dict(r) for r in rows]
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self._publish(table, "DELETE" if delete else "UPDATE", rows), self._loop).result()
+        return rows
+
+    def reset_counters(self):
+        with self._lock:
+            self.rest_calls = 0
+            self.auth_calls = 0
+
+    # --- query engine ------------------------------------------------------
+
+    def _filtered(self, table: str, params: list[tuple[str, str]]) -> list[dict]:
+        rows = self.table(table)
+        for key, value in params:
+            if key in ("select", "order", "limit", "offset", "on_conflict", "columns"):
+                continue
+            if key in ("or", "and"):
+                rows = [r for r in rows if _match_logic(r, value.strip("()"), key == "or")]
+            else:
+                rows = [r for r in rows if _match_op(r, key, value)]
+        return rows
+
+    def _embed(self, row: dict, name: str, columns: list[str]) -> Any:
+        # Many-to-one only: exercises(*) on a row with exercise_id, and so on
+        fk = row.get(f"{name[:-1]}_id") if name.endswith("s") else row.get(f"{name}_id")
+        if fk is None:
+            return None
+        target = next((r for r in self.table(name) if r.get("id") == fk), None)
+        return self._project(name, target, columns) if target else None
+
+    def _project(self, table: str, row: dict, select: Any) -> dict:
+        columns, embeds = _parse_select(select) if isinstance(select, str) else _parse_select(",".join(select))
+        if "*" in columns:
+            result = dict(row)
+        else:
+            result = {c.split(":")[-1].strip(): row.get(c.split(":")[-1].strip()) for c in columns if c}
+        for name, embed_columns in embeds.items():
+            result[name] = self._embed(row, name, embed_columns)
+        return result
+
+    def _ordered(self, rows: list[dict], order_params: list[str]) -> list[dict]:
+        terms = [t for value in order_params for t in value.split(",") if t]
+        for term in reversed(terms):
+            column, *modifiers = term.split(".")
+            desc = "desc" in modifiers
+            present = [r for r in rows if r.get(column) is not None]
+            missing = [r for r in rows if r.get(column) is None]
+            present.sort(key=lambda r: (isinstance(r[column], str), r[column]), reverse=desc)
+            rows = present + missing if not desc else missing + present
+        return rows
+
+    # --- HTTP handlers -----------------------------------------------------
+
+    async def _delay(self):
+        if self.latency_ms or self.jitter_ms:
+            await asyncio.sleep(max(0.0, self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000)
+
+    def _respond(self, request: Request, rows: list[dict], total: Optional[int] = None, status: int = 200) -> Response:
+        headers = {}
+        if "count=exact" in request.headers.get("prefer", ""):
+            count = len(rows) if total is None else total
+            headers["content-range"] = f"0-{max(len(rows) - 1, 0)}/{count}" if rows else f"*/{count}"
+        if "vnd.pgrst.object" in request.headers.get("accept", ""):
+            if len(rows) != 1:
+                return JSONResponse({
+                    "code": "PGRST116",
+                    "details": f"The result contains {len(rows)} rows",
+                    "hint": None,
+                    "message": "JSON object requested, multiple (or no) rows returned"
+                }, status_code=406, headers=headers)
+            return JSONResponse(rows[0], status_code=status, headers=headers)
+        if request.method == "HEAD":
+            return Response(status_code=status, headers=headers)
+        return JSONResponse(rows, status_code=status, headers=headers)
+
+    async def _rest(self, request: Request) -> Response:
+        await self._delay()
+        with self._lock:
+            self.rest_calls += 1
+        table = request.path_params["table"]
+        params = list(request.query_params.multi_items())
+        select = request.query_params.get("select", "*")
+        prefer = request.headers.get("prefer", "")
+
+        if request.method in ("GET", "HEAD"):
+            rows = self._ordered(self._filtered(table, params), request.query_params.getlist("order"))
+            total = len(rows)
+            offset = int(request.query_params.get("offset", 0))
+            limit = request.query_params.get("limit")
+            rows = rows[offset:offset + int(limit)] if limit is not None else rows[offset:]
+            return self._respond(request, [self._project(table, r, select) for r in rows], total)
+
+        if request.method == "POST":
+            body = await request.json()
+            items = body if isinstance(body, list) else [body]
+            upsert = "resolution=merge-duplicates" in prefer
+            conflict_columns = tuple((request.query_params.get("on_conflict") or "id").split(","))
+            written, inserted, updated = [], [], []
+            with self._lock:
+                for item in items:
+                    existing = None
+                    for key in [conflict_columns] + UNIQUE.get(table, []):
+                        if all(c in item for c in key):
+                            existing = next((r for r in self.table(table) if all(_text(r.get(c)) == _text(item[c]) for c in key)), None)
+                            if existing is not None and not (upsert and key == conflict_columns):
+                                return JSONResponse({"code": "23505", "message": "duplicate key value violates unique constraint",
+                                                     "details": None, "hint": None}, status_code=409)
+                            if existing is not None:
+                                break
+                    if existing is not None:
+                        existing.update(item)
+                        written.append(existing)
+                        updated.append(dict(existing))
+                    else:
+                        written.append(self.insert(table, item))
+                        inserted.append(dict(written[-1]))
+            await self._publish(table, "INSERT", inserted)
+            await self._publish(table, "UPDATE", updated)
+            return self._respond(request, [self._project(table, r, select) for r in written], status=201)
+
+        if request.method == "PATCH":
+            body = await request.json()
+            with self._lock:
+                rows = self._filtered(table, params)
+                for row in rows:
+                    row.update(body)
+                changed = [dict(r) for r in rows]
+            await self._publish(table, "UPDATE", changed)
+            return self._respond(request, [self._project(table, r, select) for r in rows])
+
+        # DELETE
+        with self._lock:
+            rows = self._filtered(table, params)
+            ids = {id(r) for r in rows}
+            self.tables[table] = [r for r in self.table(table) if id(r) not in ids]
+        await self._publish(table, "DELETE", rows)
+        return self._respond(request, [self._project(table, r, select) for r in rows])
+
+    async def _rpc(self, request: Request) -> Response:
+        await self._delay()
+        name = request.path_params["name"]
+        # Replica health probes run on a timer, not per request
+        if name != "replication_lag":
+            with self._lock:
+                self.rest_calls += 1
+        handler = self.rpcs.get(name)
+        if handler is None:
+            return JSONResponse({"code": "PGRST202", "message": "Could not find the function",
+                                 "details": None, "hint": None}, status_code=404)
+        body = await request.json() if await request.body() else dict(request.query_params)
+        with self._lock:
+            self._rpc_changes = []
+            try:
+                result = handler(self, body)
+            except RPCError as e:
+                return JSONResponse({"code": e.code, "message": e.message, "details": None, "hint": None},
+                                    status_code=e.status)
+            finally:
+                changes, self._rpc_changes = self._rpc_changes, []
+        for table, kind, rows in changes:
+            await self._publish(table, kind, rows)
+        return JSONResponse(result)
+
+    async def _auth(self, request: Request) -> Response:
+        await self._delay()
+        with self._lock:
+            self.auth_calls += 1
+        path = request.path_params["path"]
+        if path == "user" and request.method == "GET":
+            token = request.headers.get("authorization", "").removeprefix("Bearer ").strip()
+            user_id = self.tokens.get(token)
+            if not user_id:
+                return JSONResponse({"code": 401, "msg": "invalid JWT"}, status_code=401)
+            return JSONResponse(self.users[user_id])
+        if path.startswith("admin/users/") and request.method == "GET":
+            user = self.users.get(path.split("/")[-1])
+            return JSONResponse(user) if user else JSONResponse({"msg": "User not found"}, status_code=404)
+        return JSONResponse({"msg": f"{request.method} /auth/v1/{path} is not supported by the fake"}, status_code=501)
+
+    # --- Realtime ----------------------------------------------------------
+
+    async def _realtime(self, websocket: WebSocket):
+        """Just enough of the Phoenix channel protocol for postgres_changes subscriptions."""
+        await websocket.accept()
+        self._loop = asyncio.get_running_loop()
+        topics: dict[str, list[tuple[int, dict]]] = {}
+        self._subscribers[websocket] = topics
+        try:
+            while True:
+                message = json.loads(await websocket.receive_text())
+                topic, event = message.get("topic"), message.get("event")
+                response: dict = {}
+                if event == "phx_join":
+                    bindings = (message.get("payload") or {}).get("config", {}).get("postgres_changes") or []
+                    topics[topic] = [(i + 1, binding) for i, binding in enumerate(bindings)]
+                    response = {"postgres_changes": [{"id": i, **binding} for i, binding in topics[topic]]}
+                elif event == "phx_leave":
+                    topics.pop(topic, None)
+                await websocket.send_text(json.dumps({
+                    "topic": topic, "event": "phx_reply", "ref": message.get("ref"),
+                    "payload": {"status": "ok", "response": response}
+                }))
+        except WebSocketDisconnect:
+            pass
+        finally:
+            self._subscribers.pop(websocket, None)
+
+    async def _publish(self, table: str, kind: str, rows: list[dict]):
+        if not rows or not self._subscribers:
+            return
+        for websocket, topics in list(self._subscribers.items()):
+            for topic, bindings in list(topics.items()):
+                ids = [i for i, b in bindings
+                       if b.get("table") in (None, "*", table) and b.get("event") in ("*", kind)]
+                if not ids:
+                    continue
+                for row in rows:
+                    # Default replica identity: old_record only has the primary key
+                    data = {
+                        "schema": "public", "table": table, "type": kind, "errors": None, "columns": [],
+                        "commit_timestamp": datetime.utcnow().isoformat() + "Z",
+                        "record": row if kind != "DELETE" else {},
+                        "old_record": {"id": row.get("id")} if kind != "INSERT" else {}
+                    }
+                    try:
+                        await websocket.send_text(json.dumps({
+                            "topic": topic, "event": "postgres_changes", "ref": None,
+                            "payload": {"ids": ids, "data": data}
+                        }, default=str))
+                    except Exception:
+                        self._subscribers.pop(websocket, None)
+
+class FakeSupabaseServer:
+    """Serves a FakeSupabase on localhost from a background thread."""
+    def __init__(self, fake: FakeSupabase, port: int = 54321):
+        import uvicorn
+        self.fake = fake
+        self.port = port
+        self._server = uvicorn.Server(uvicorn.Config(fake.app, host="127.0.0.1", port=port, log_level="warning"))
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self):
+        self._thread.start()
+        while not self._server.started:
+            if not self._thread.is_alive():
+                raise RuntimeError(f"Fake Supabase failed to start on port {self.port}")
+            threading.Event().wait(0.05)
+
+    def stop(self):
+        self._server.should_exit = True
+        self._thread.join(timeout=5)
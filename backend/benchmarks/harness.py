@@ -0,0 +1,108 @@
+import os
+import sys
+import time
+import subprocess
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Optional
+import httpx
+from benchmarks.fake_supabase import FakeSupabase, FakeSupabaseServer
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@dataclass
+class Stack:
+    fake: FakeSupabase
+    base_url: str
+    process: subprocess.Popen
+
+    @property
+    def ws_url(self) -> str:
+        return self.base_url.replace("http://", "ws://", 1)
+
+    def rss_bytes(self) -> Optional[int]:
+        """Resident memory of the app worker (Linux only)."""
+        try:
+            with open(f"/proc/{self.process.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            return None
+        return None
+
+    async def metrics(self) -> dict[str, float]:
+        async with httpx.AsyncClient(base_url=self.base_url, timeout=10) as client:
+            resp = await client.get("/metrics")
+            resp.raise_for_status()
+            return parse_metrics(resp.text)
+
+def parse_metrics(text: str) -> dict[str, float]:
+    """Prometheus text -> metric name (labels dropped) -> value summed over series."""
+    totals: dict[str, float] = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        series, _, value = line.rpartition(" ")
+        name = series.split("{", 1)[0]
+        totals[name] = totals.get(name, 0.0) + float(value)
+    return totals
+
+def app_env(supabase_url: str, extra: Optional[dict[str, str]] = None) -> dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        "SUPABASE_URL": supabase_url,
+        # Only needs to look like a JWT to pass client-side validation
+        "SUPABASE_SERVICE_ROLE_KEY": "bench.bench.bench",
+        "LOG_LEVEL": "WARNING",
+        # Keep background jobs from adding their queries to the measurements
+        "SESSION_REAPER_INTERVAL_SECONDS": "3600",
+        "CALENDAR_SYNC_POLL_SECONDS": "3600",
+        "REDIS_URL": "",
+        "REMINDER_EMAILS_ENABLED": "false",
+        # The fake serves Realtime too, so caches run the way they do with the change feed on
+        "CDC_ENABLED": "true",
+        # The same fake under another host name, so GET handlers exercise replica routing
+        "READ_REPLICA_URLS": supabase_url.replace("127.0.0.1", "localhost"),
+    })
+    env.update(extra or {})
+    return env
+
+@contextmanager
+def running_stack(fake: FakeSupabase, app_port: int = 8765, fake_port: int = 54321,
+                  env: Optional[dict[str, str]] = None, workers: int = 1):
+    """
+    Serve `fake` in this process and main.app in a uvicorn subprocess pointed
+    at it, so the app's CPU time isn't shared with the load generator.
+    """
+    server = FakeSupabaseServer(fake, fake_port)
+    server.start()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(app_port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=app_env(server.url, env)
+    )
+    base_url = f"http://127.0.0.1:{app_port}"
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"App exited during startup with code {process.returncode}")
+            try:
+                # Any answer means it's serving; the health route sits behind the auth middleware
+                if httpx.get(f"{base_url}/api/v1/health", timeout=1).status_code < 500:
+                    break
+            except httpx.HTTPError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError("App did not become healthy within 30s")
+            time.sleep(0.2)
+        yield Stack(fake, base_url, process)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        server.stop()
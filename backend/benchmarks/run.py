@@ -0,0 +1,108 @@
+"""
+Benchmark the backend against an in-process Supabase stand-in.
+
+    cd backend
+    python -m benchmarks.run                              # all scenarios
+    python -m benchmarks.run -s doctor_dashboard -s live_session --latency-ms 20
+    python -m benchmarks.run --json results.json          # save a run
+    python -m benchmarks.run --baseline results.json      # exit 1 on regression
+    python -m benchmarks.run --strict-loop                # exit 1 if the event loop ever blocks
+
+Needs the backend requirements plus uvicorn and websockets; nothing talks to
+the real Supabase project.
+"""
+import sys
+import json
+import asyncio
+import argparse
+from benchmarks.fake_supabase import FakeSupabase
+from benchmarks.harness import running_stack
+from benchmarks.seed import seed
+from benchmarks.workloads import SCENARIOS
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Regressions against a saved run: slower p99 beyond tolerance, or more DB calls per op."""
+    problems = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        if previous.get("p99_ms") and current.get("p99_ms") and current["p99_ms"] > previous["p99_ms"] * (1 + tolerance):
+            problems.append(f"{name}: p99 {current['p99_ms']}ms vs baseline {previous['p99_ms']}ms")
+        if previous.get("db_calls_per_op") is not None and current.get("db_calls_per_op") is not None \
+                and current["db_calls_per_op"] > previous["db_calls_per_op"] * 1.05 + 0.05:
+            problems.append(f"{name}: {current['db_calls_per_op']} DB calls/op vs baseline {previous['db_calls_per_op']}")
+        if current.get("loop_blocks") and not previous.get("loop_blocks"):
+            problems.append(f"{name}: event loop blocked {current['loop_blocks']} times")
+        if current.get("errors") and not previous.get("errors"):
+            problems.append(f"{name}: {current['errors']} errors")
+    return problems
+
+def print_table(results: dict):
+    header = f"{'scenario':<18}{'ops':>8}{'err':>6}{'ops/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'db/op':>8}{'blocks':>8}"
+    print(header)
+    print("-" * len(header))
+    for name, r in results.items():
+        print(f"{name:<18}{r['ops']:>8}{r['errors']:>6}{r['throughput']:>10}"
+              f"{str(r['p50_ms']):>10}{str(r['p99_ms']):>10}{str(r['db_calls_per_op']):>8}{r['loop_blocks']:>8}")
+
+async def run_scenarios(stack, data, names: list[str], args) -> dict:
+    results = {}
+    for name in names:
+        kwargs = {}
+        if name == "live_session":
+            kwargs["fps"] = args.fps
+        elif name == "chat_burst":
+            kwargs["burst"] = args.burst
+        result = await SCENARIOS[name](stack, data, args.duration, args.concurrency, **kwargs)
+        results[name] = result.summary()
+    return results
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="PhysioCheck backend benchmarks")
+    parser.add_argument("-s", "--scenario", action="append", choices=sorted(SCENARIOS), help="Scenario to run (repeatable); default all")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per scenario")
+    parser.add_argument("--concurrency", type=int, default=10, help="Concurrent clients / socket pairs")
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="Injected latency per Supabase call")
+    parser.add_argument("--jitter-ms", type=float, default=1.0)
+    parser.add_argument("--doctors", type=int, default=5)
+    parser.add_argument("--patients-per-doctor", type=int, default=20)
+    parser.add_argument("--fps", type=int, default=15, help="exercise_data frames per second in live_session")
+    parser.add_argument("--burst", type=int, default=20, help="Messages per second per pair in chat_burst")
+    parser.add_argument("--app-port", type=int, default=8765)
+    parser.add_argument("--fake-port", type=int, default=54321)
+    parser.add_argument("--json", help="Write results to this file")
+    parser.add_argument("--baseline", help="Compare against results saved with --json")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed p99 slowdown vs baseline")
+    parser.add_argument("--strict-loop", action="store_true", help="Fail if the app's event loop blocks during any scenario")
+    parser.add_argument("--block-threshold-ms", type=float, default=100, help="Loop lag that counts as a block")
+    args = parser.parse_args(argv)
+
+    fake = FakeSupabase(args.latency_ms, args.jitter_ms)
+    data = seed(fake, args.doctors, args.patients_per_doctor)
+    env = {"LOOP_BLOCK_THRESHOLD_MS": str(args.block_threshold_ms)}
+    if args.strict_loop:
+        env["LOOP_MONITOR_STRICT"] = "true"
+    with running_stack(fake, args.app_port, args.fake_port, env) as stack:
+        results = asyncio.run(run_scenarios(stack, data, args.scenario or list(SCENARIOS), args))
+
+    print_table(results)
+    status = 0
+    if args.strict_loop:
+        for name, r in results.items():
+            if r["loop_blocks"]:
+                print(f"BLOCKED {name}: event loop blocked {r['loop_blocks']} times (see app log for stacks)")
+                status = 1
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            problems = compare(results, json.load(f), args.tolerance)
+        for problem in problems:
+            print(f"REGRESSION {problem}")
+        return 1 if problems else status
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
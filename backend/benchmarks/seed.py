@@ -0,0 +1,92 @@
+import random
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from benchmarks.fake_supabase import FakeSupabase
+
+FREQUENCIES = ["daily", "every_other_day", "specific_days", "weekly", "twice_weekly"]
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+@dataclass
+class Person:
+    auth_id: str
+    db_id: str
+    token: str
+
+@dataclass
+class SeedData:
+    doctors: list[Person] = field(default_factory=list)
+    # doctor db id -> that doctor's patients
+    patients: dict[str, list[Person]] = field(default_factory=dict)
+    exercise_ids: list[str] = field(default_factory=list)
+
+    def all_patients(self) -> list[Person]:
+        return [p for patients in self.patients.values() for p in patients]
+
+def seed(fake: FakeSupabase, doctors: int = 5, patients_per_doctor: int = 20, exercises: int = 12,
+         assignments_per_patient: int = 3, history_days: int = 30, rng_seed: int = 7) -> SeedData:
+    """Deterministic caseloads with assignment and session history shaped like production."""
+    rng = random.Random(rng_seed)
+    data = SeedData()
+    now = datetime.utcnow()
+
+    for i in range(exercises):
+        data.exercise_ids.append(fake.insert("exercises", {
+            "name": f"Exercise {i + 1}",
+            "description": "Benchmark exercise",
+            "difficulty": rng.choice(["beginner", "intermediate", "advanced"]),
+            "duration_minutes": rng.choice([10, 15, 20])
+        })["id"])
+
+    for d in range(doctors):
+        user, token = fake.add_user("doctor", full_name=f"Dr. Bench {d + 1}")
+        doctor = fake.insert("doctors", {"auth_user_id": user["id"]})
+        data.doctors.append(Person(user["id"], doctor["id"], token))
+        data.patients[doctor["id"]] = []
+
+        for p in range(patients_per_doctor):
+            p_user, p_token = fake.add_user("patient", full_name=f"Patient {d + 1}-{p + 1}")
+            patient = fake.insert("patients", {
+                "auth_user_id": p_user["id"],
+                "doctor_id": doctor["id"],
+                "full_name": f"Patient {d + 1}-{p + 1}",
+                "email": p_user["email"]
+            })
+            data.patients[doctor["id"]].append(Person(p_user["id"], patient["id"], p_token))
+
+            assigned = rng.sample(data.exercise_ids, assignments_per_patient)
+            for exercise_id in assigned:
+                fake.insert("assigned_exercises", {
+                    "patient_id": patient["id"],
+                    "exercise_id": exercise_id,
+                    "sets": 3,
+                    "reps": 10,
+                    "frequency": rng.choice(FREQUENCIES),
+                    "selected_days": rng.sample(WEEKDAYS, 3),
+                    "start_date": (now - timedelta(days=history_days)).date().isoformat(),
+                    "assigned_at": (now - timedelta(days=history_days)).isoformat()
+                })
+            for day in range(history_days):
+                if rng.random() < 0.6:
+                    done_at = now - timedelta(days=day, minutes=rng.randint(0, 600))
+                    fake.insert("exercise_sessions", {
+                        "patient_id": patient["id"],
+                        "exercise_id": rng.choice(assigned),
+                        "status": "completed",
+                        "duration_seconds": rng.randint(300, 1200),
+                        "repetitions": rng.randint(10, 40),
+                        "created_at": done_at.isoformat(),
+                        "started_at": done_at.isoformat(),
+                        "completed_at": done_at.isoformat()
+                    })
+
+        for slot, patient in enumerate(data.patients[doctor["id"]][:8]):
+            fake.insert("appointments", {
+                "patient_id": patient.db_id,
+                "doctor_id": doctor["id"],
+                "appointment_mode": "in_person",
+                "appointment_date": now.date().isoformat(),
+                "start_time": f"{9 + slot:02d}:00:00",
+                "end_time": f"{9 + slot:02d}:30:00",
+                "status": "scheduled"
+            })
+    return data
@@ -0,0 +1,277 @@
+"""
+Soak test for the live-session WebSockets: thousands of patient/doctor socket
+pairs against one app worker, for as long as you like.
+
+    cd backend
+    python -m benchmarks.soak --pairs 2000 --duration 14400 --jsonl soak.jsonl
+
+Each pair is a /ws/patient/session socket streaming exercise_data at --fps and
+the doctor's /ws/doctor/monitor/{session_id} socket; both sides also exchange
+WebRTC-style signal messages. Every --report-interval seconds a line reports
+patient->doctor and doctor->patient forwarding latency, ping round-trip,
+the server's own event-loop lag and block count (scraped from /metrics), app
+RSS per connection and message throughput. Auth goes to the in-process GoTrue stand-in.
+"""
+import sys
+import json
+import time
+import random
+import asyncio
+import resource
+import argparse
+import multiprocessing
+from typing import Optional
+import httpx
+import websockets
+from benchmarks.fake_supabase import FakeSupabase
+from benchmarks.harness import running_stack, parse_metrics
+from benchmarks.seed import seed
+from benchmarks.workloads import percentile, start_live_session
+
+SAMPLE_LIMIT = 5000
+
+class Reservoir:
+    """Fixed-size uniform sample, so hour-long runs don't keep every latency."""
+    def __init__(self, size: int = SAMPLE_LIMIT):
+        self.size = size
+        self.samples: list[float] = []
+        self.seen = 0
+
+    def add(self, value: float):
+        self.seen += 1
+        if len(self.samples) < self.size:
+            self.samples.append(value)
+        else:
+            i = random.randrange(self.seen)
+            if i < self.size:
+                self.samples[i] = value
+
+    def drain(self) -> list[float]:
+        samples, self.samples, self.seen = self.samples, [], 0
+        return samples
+
+def _raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+class WorkerStats:
+    def __init__(self):
+        self.exercise = Reservoir()
+        self.signal = Reservoir()
+        self.ping = Reservoir()
+        self.frames = 0
+        self.connected = 0
+        self.errors = 0
+
+    def snapshot(self) -> dict:
+        snap = {
+            "exercise": self.exercise.drain(),
+            "signal": self.signal.drain(),
+            "ping": self.ping.drain(),
+            "frames": self.frames,
+            "connected": self.connected,
+            "errors": self.errors
+        }
+        self.frames = 0
+        return snap
+
+async def _pair(ws_url: str, doctor_token: str, patient_token: str, session_id: str, args, stats: WorkerStats, deadline: float):
+    try:
+        async with websockets.connect(f"{ws_url}/api/v1/ws/doctor/monitor/{session_id}?token={doctor_token}", max_queue=None) as doctor_ws, \
+                   websockets.connect(f"{ws_url}/api/v1/ws/patient/session?token={patient_token}&session_id={session_id}", max_queue=None) as patient_ws:
+            stats.connected += 1
+            pings: dict[int, float] = {}
+
+            async def read_doctor():
+                async for raw in doctor_ws:
+                    message = json.loads(raw)
+                    if "bench_sent" in message and message.get("type") in ("exercise_update", "signal"):
+                        target = stats.exercise if message["type"] == "exercise_update" else stats.signal
+                        target.add(time.perf_counter() - message["bench_sent"])
+                    elif message.get("type") == "pong" and pings:
+                        stats.ping.add(time.perf_counter() - pings.pop(min(pings)))
+
+            async def read_patient():
+                async for raw in patient_ws:
+                    message = json.loads(raw)
+                    if message.get("type") == "signal" and "bench_sent" in message:
+                        stats.signal.add(time.perf_counter() - message["bench_sent"])
+
+            async def doctor_side():
+                seq = 0
+                while time.perf_counter() < deadline:
+                    await asyncio.sleep(args.signal_interval * random.uniform(0.5, 1.5))
+                    seq += 1
+                    pings[seq] = time.perf_counter()
+                    await doctor_ws.send(json.dumps({"type": "ping"}))
+                    await doctor_ws.send(json.dumps({"type": "signal", "bench_sent": time.perf_counter(),
+                                                     "candidate": "x" * args.signal_bytes}))
+
+            async def patient_side():
+                # Spread frames so pairs don't all fire on the same tick
+                await asyncio.sleep(random.random() / args.fps)
+                frame = 0
+                while time.perf_counter() < deadline:
+                    frame += 1
+                    await patient_ws.send(json.dumps({
+                        "type": "exercise_data",
+                        "bench_sent": time.perf_counter(),
+                        "frame": frame,
+                        "rep_count": frame // (args.fps * 3),
+                        "accuracy": random.randint(70, 100)
+                    }))
+                    stats.frames += 1
+                    if frame % (args.fps * args.signal_interval) == 0:
+                        await patient_ws.send(json.dumps({"type": "signal", "bench_sent": time.perf_counter(), "sdp": "y" * args.signal_bytes}))
+                    await asyncio.sleep(1 / args.fps)
+
+            readers = [asyncio.create_task(read_doctor()), asyncio.create_task(read_patient())]
+            try:
+                await asyncio.gather(doctor_side(), patient_side())
+                await patient_ws.send(json.dumps({"type": "session_ended"}))
+            finally:
+                for reader in readers:
+                    reader.cancel()
+                stats.connected -= 1
+    except (OSError, asyncio.TimeoutError, websockets.WebSocketException):
+        stats.errors += 1
+
+async def _run_worker(index: int, ws_url: str, pairs: list[tuple[str, str, str]], args, queue, ramp_per_second: float):
+    _raise_fd_limit()
+    stats = WorkerStats()
+    deadline = time.perf_counter() + args.duration
+    tasks = []
+
+    async def report():
+        while True:
+            await asyncio.sleep(args.report_interval)
+            queue.put({"worker": index, **stats.snapshot()})
+
+    reporter = asyncio.create_task(report())
+    for pair in pairs:
+        tasks.append(asyncio.create_task(_pair(ws_url, *pair, args, stats, deadline)))
+        await asyncio.sleep(1 / ramp_per_second)
+    await asyncio.gather(*tasks)
+    reporter.cancel()
+    queue.put({"worker": index, **stats.snapshot()})
+    queue.put(None)
+
+def _worker_main(index, ws_url, pairs, args, queue, ramp_per_second):
+    asyncio.run(_run_worker(index, ws_url, pairs, args, queue, ramp_per_second))
+
+def _summarize(elapsed: float, snapshots: list[dict], connected: int, rss: Optional[int], baseline_rss: Optional[int]) -> dict:
+    def ms(values, pct):
+        value = percentile(values, pct)
+        return round(value * 1000, 2) if value is not None else None
+    exercise = [v for s in snapshots for v in s["exercise"]]
+    signal = [v for s in snapshots for v in s["signal"]]
+    ping = [v for s in snapshots for v in s["ping"]]
+    sockets = connected * 2
+    return {
+        "elapsed_s": round(elapsed),
+        "pairs": connected,
+        "errors": sum(s["errors"] for s in snapshots),
+        "frames_per_s": round(sum(s["frames"] for s in snapshots) / max(elapsed, 1e-9), 1),
+        "exercise_p50_ms": ms(exercise, 50), "exercise_p99_ms": ms(exercise, 99), "exercise_max_ms": ms(exercise, 100),
+        "signal_p50_ms": ms(signal, 50), "signal_p99_ms": ms(signal, 99),
+        "ping_p50_ms": ms(ping, 50), "ping_p99_ms": ms(ping, 99),
+        "rss_mb": round(rss / 2**20, 1) if rss else None,
+        "bytes_per_socket": round((rss - baseline_rss) / sockets) if rss and baseline_rss and sockets else None
+    }
+
+def _loop_counters(base_url: str) -> Optional[dict[str, float]]:
+    try:
+        return parse_metrics(httpx.get(f"{base_url}/metrics", timeout=5).text)
+    except httpx.HTTPError:
+        return None
+
+def _loop_report(before: Optional[dict], after: Optional[dict]) -> dict:
+    """Mean loop lag and blocks over the interval, from the deltas of the app's counters."""
+    if not before or not after:
+        return {"loop_lag_mean_ms": None, "loop_blocks": None}
+    probes = after.get("event_loop_lag_seconds_count", 0) - before.get("event_loop_lag_seconds_count", 0)
+    lag = after.get("event_loop_lag_seconds_sum", 0) - before.get("event_loop_lag_seconds_sum", 0)
+    return {
+        "loop_lag_mean_ms": round(lag / probes * 1000, 2) if probes else None,
+        "loop_blocks": int(after.get("event_loop_blocked_total", 0) - before.get("event_loop_blocked_total", 0))
+    }
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="WebSocket soak test")
+    parser.add_argument("--pairs", type=int, default=1000, help="Concurrent patient/doctor socket pairs")
+    parser.add_argument("--duration", type=float, default=600, help="Seconds to stream after each pair connects")
+    parser.add_argument("--fps", type=int, default=5, help="exercise_data frames per second per patient")
+    parser.add_argument("--signal-interval", type=int, default=10, help="Seconds between signal messages per side")
+    parser.add_argument("--signal-bytes", type=int, default=512, help="Payload size of signal messages")
+    parser.add_argument("--ramp", type=float, default=100, help="New pairs per second while ramping up")
+    parser.add_argument("--processes", type=int, default=max(1, multiprocessing.cpu_count() // 2), help="Client processes")
+    parser.add_argument("--report-interval", type=float, default=30)
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="Injected latency per Supabase call")
+    parser.add_argument("--app-port", type=int, default=8765)
+    parser.add_argument("--fake-port", type=int, default=54321)
+    parser.add_argument("--jsonl", help="Append one JSON line per report to this file")
+    args = parser.parse_args(argv)
+    _raise_fd_limit()
+
+    fake = FakeSupabase(args.latency_ms)
+    patients_per_doctor = 10
+    data = seed(fake, doctors=-(-args.pairs // patients_per_doctor), patients_per_doctor=patients_per_doctor,
+                exercises=4, assignments_per_patient=1, history_days=0)
+    pairs = []
+    for doctor in data.doctors:
+        for patient in data.patients[doctor.db_id]:
+            if len(pairs) < args.pairs:
+                pairs.append((doctor.token, patient.token, start_live_session(fake, patient, data.exercise_ids[0])))
+
+    with running_stack(fake, args.app_port, args.fake_port) as stack:
+        baseline_rss = stack.rss_bytes()
+        counters = _loop_counters(stack.base_url)
+        queue = multiprocessing.Queue()
+        shards = [shard for shard in (pairs[i::args.processes] for i in range(args.processes)) if shard]
+        workers = [multiprocessing.Process(target=_worker_main, args=(i, stack.ws_url, shard, args, queue, args.ramp / len(shards)))
+                   for i, shard in enumerate(shards)]
+        for worker in workers:
+            worker.start()
+
+        start = time.monotonic()
+        last_report = start
+        pending: list[dict] = []
+        connected: dict[int, int] = {}
+        finished = 0
+        out = open(args.jsonl, "a") if args.jsonl else None
+        try:
+            while finished < len(workers):
+                try:
+                    snapshot = queue.get(timeout=1)
+                except Exception:
+                    snapshot = False
+                if snapshot is None:
+                    finished += 1
+                elif snapshot:
+                    pending.append(snapshot)
+                    connected[snapshot["worker"]] = snapshot["connected"]
+                now = time.monotonic()
+                if pending and now - last_report >= args.report_interval:
+                    line = _summarize(now - last_report, pending, sum(connected.values()), stack.rss_bytes(), baseline_rss)
+                    line["elapsed_s"] = round(now - start)
+                    latest = _loop_counters(stack.base_url)
+                    line.update(_loop_report(counters, latest))
+                    counters = latest
+                    print(json.dumps(line))
+                    if out:
+                        out.write(json.dumps(line) + "\n")
+                        out.flush()
+                    pending, last_report = [], now
+        except KeyboardInterrupt:
+            print("Interrupted; stopping workers")
+        finally:
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+            if out:
+                out.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
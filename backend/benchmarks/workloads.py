@@ -0,0 +1,274 @@
+import json
+import time
+import uuid
+import asyncio
+import itertools
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
+import httpx
+import websockets
+from benchmarks.fake_supabase import FakeSupabase
+from benchmarks.harness import Stack
+from benchmarks.seed import SeedData, Person
+
+def percentile(values: list[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+@dataclass
+class ScenarioResult:
+    name: str
+    elapsed: float = 0.0
+    errors: int = 0
+    db_calls: int = 0
+    # Event-loop stalls the app's loop monitor counted during the scenario
+    loop_blocks: int = 0
+    latencies: list[float] = field(default_factory=list)
+
+    @property
+    def ops(self) -> int:
+        return len(self.latencies)
+
+    def summary(self) -> dict:
+        def ms(value):
+            return round(value * 1000, 2) if value is not None else None
+        return {
+            "ops": self.ops,
+            "errors": self.errors,
+            "throughput": round(self.ops / self.elapsed, 1) if self.elapsed else 0.0,
+            "p50_ms": ms(percentile(self.latencies, 50)),
+            "p99_ms": ms(percentile(self.latencies, 99)),
+            "db_calls_per_op": round(self.db_calls / self.ops, 2) if self.ops else None,
+            "loop_blocks": self.loop_blocks
+        }
+
+def _auth(person: Person) -> dict[str, str]:
+    return {"Authorization": f"Bearer {person.token}"}
+
+async def _measure(stack: Stack, name: str, body: Callable[[ScenarioResult], Awaitable[None]]) -> ScenarioResult:
+    result = ScenarioResult(name)
+    blocks_before = (await stack.metrics()).get("event_loop_blocked_total", 0)
+    stack.fake.reset_counters()
+    start = time.perf_counter()
+    await body(result)
+    result.elapsed = time.perf_counter() - start
+    result.db_calls = stack.fake.rest_calls
+    result.loop_blocks = int((await stack.metrics()).get("event_loop_blocked_total", 0) - blocks_before)
+    return result
+
+async def http_loop(stack: Stack, name: str, duration: float, concurrency: int,
+                    make_request: Callable[[int], tuple[str, str, Person, Optional[dict], dict]]) -> ScenarioResult:
+    """Run `concurrency` clients issuing make_request(i) back to back for `duration` seconds."""
+    counter = itertools.count()
+
+    async def body(result: ScenarioResult):
+        deadline = time.perf_counter() + duration
+        async with httpx.AsyncClient(base_url=stack.base_url, timeout=30,
+                                     limits=httpx.Limits(max_connections=concurrency)) as client:
+            async def worker():
+                while time.perf_counter() < deadline:
+                    method, path, person, payload, headers = make_request(next(counter))
+                    sent = time.perf_counter()
+                    try:
+                        resp = await client.request(method, path, json=payload, headers={**_auth(person), **headers})
+                        if resp.status_code >= 400:
+                            result.errors += 1
+                            continue
+                    except httpx.HTTPError:
+                        result.errors += 1
+                        continue
+                    result.latencies.append(time.perf_counter() - sent)
+            await asyncio.gather(*[worker() for _ in range(concurrency)])
+
+    return await _measure(stack, name, body)
+
+async def doctor_dashboard(stack: Stack, data: SeedData, duration: float, concurrency: int) -> ScenarioResult:
+    return await http_loop(stack, "doctor_dashboard", duration, concurrency,
+                           lambda i: ("GET", "/api/v1/doctor/dashboard", data.doctors[i % len(data.doctors)], None, {}))
+
+async def doctor_patients(stack: Stack, data: SeedData, duration: float, concurrency: int) -> ScenarioResult:
+    return await http_loop(stack, "doctor_patients", duration, concurrency,
+                           lambda i: ("GET", "/api/v1/doctor/patients", data.doctors[i % len(data.doctors)], None, {}))
+
+async def patient_today(stack: Stack, data: SeedData, duration: float, concurrency: int) -> ScenarioResult:
+    patients = data.all_patients()
+    return await http_loop(stack, "patient_today", duration, concurrency,
+                           lambda i: ("GET", "/api/v1/patient/today", patients[i % len(patients)], None, {}))
+
+async def bulk_assignment(stack: Stack, data: SeedData, duration: float, concurrency: int) -> ScenarioResult:
+    """Doctors alternate their whole caseload between two prescriptions, so every call has a real diff."""
+    def make_request(i: int):
+        doctor = data.doctors[i % len(data.doctors)]
+        patients = data.patients[doctor.db_id]
+        variant = (i // len(data.doctors)) % 2
+        assignments = [{
+            "patient_id": p.db_id,
+            "exercise_id": exercise_id,
+            "sets": 3 + variant,
+            "reps": 10,
+            "frequency": "daily"
+        } for p in patients for exercise_id in data.exercise_ids[variant:variant + 3]]
+        payload = {"patient_ids": [p.db_id for p in patients], "assignments": assignments}
+        return "PUT", "/api/v1/doctor/assignments", doctor, payload, {"Idempotency-Key": str(uuid.uuid4())}
+    return await http_loop(stack, "bulk_assignment", duration, concurrency, make_request)
+
+async def _drain(ws, handler: Optional[Callable[[dict], None]] = None):
+    try:
+        async for raw in ws:
+            if handler:
+                handler(json.loads(raw))
+    except websockets.ConnectionClosed:
+        pass
+
+async def _wait_for(ws, message_type: str, timeout: float = 10.0) -> dict:
+    async def wait():
+        while True:
+            message = json.loads(await ws.recv())
+            if message.get("type") == message_type:
+                return message
+    return await asyncio.wait_for(wait(), timeout)
+
+def start_live_session(fake: FakeSupabase, patient: Person, exercise_id: str) -> str:
+    return fake.insert("exercise_sessions", {
+        "patient_id": patient.db_id,
+        "exercise_id": exercise_id,
+        "status": "in_progress"
+    })["id"]
+
+async def live_session(stack: Stack, data: SeedData, duration: float, concurrency: int, fps: int = 15) -> ScenarioResult:
+    """
+    `concurrency` patient sockets stream exercise_data at `fps`, each watched by
+    its doctor's monitor socket; latency is patient send -> doctor receive.
+    """
+    pairs = []
+    for i, patient in enumerate(data.all_patients()[:concurrency]):
+        doctor = next(d for d in data.doctors if patient in data.patients[d.db_id])
+        pairs.append((doctor, patient, start_live_session(stack.fake, patient, data.exercise_ids[i % len(data.exercise_ids)])))
+
+    async def body(result: ScenarioResult):
+        async def pair(doctor: Person, patient: Person, session_id: str):
+            try:
+                async with websockets.connect(f"{stack.ws_url}/api/v1/ws/doctor/monitor/{session_id}?token={doctor.token}") as doctor_ws, \
+                           websockets.connect(f"{stack.ws_url}/api/v1/ws/patient/session?token={patient.token}&session_id={session_id}") as patient_ws:
+                    await _wait_for(doctor_ws, "connected")
+                    await _wait_for(patient_ws, "connected")
+
+                    def on_doctor_message(message: dict):
+                        if message.get("type") == "exercise_update" and "bench_sent" in message:
+                            result.latencies.append(time.perf_counter() - message["bench_sent"])
+                    readers = [asyncio.create_task(_drain(doctor_ws, on_doctor_message)), asyncio.create_task(_drain(patient_ws))]
+
+                    deadline = time.perf_counter() + duration
+                    frame = 0
+                    while time.perf_counter() < deadline:
+                        frame += 1
+                        await patient_ws.send(json.dumps({
+                            "type": "exercise_data",
+                            "bench_sent": time.perf_counter(),
+                            "rep_count": frame // fps,
+                            "accuracy": 90,
+                            "frame": frame
+                        }))
+                        await asyncio.sleep(1 / fps)
+                    await patient_ws.send(json.dumps({"type": "session_ended"}))
+                    # Let in-flight frames arrive before closing
+                    await asyncio.sleep(0.5)
+                    for reader in readers:
+                        reader.cancel()
+            except (OSError, asyncio.TimeoutError, websockets.WebSocketException):
+                result.errors += 1
+        await asyncio.gather(*[pair(*p) for p in pairs])
+
+    return await _measure(stack, "live_session", body)
+
+async def chat_burst(stack: Stack, data: SeedData, duration: float, concurrency: int, burst: int = 20) -> ScenarioResult:
+    """Doctor->patient chat bursts; latency is send -> message_sent echo (after the DB write)."""
+    pairs = [(d, data.patients[d.db_id][i % len(data.patients[d.db_id])])
+             for i, d in zip(range(concurrency), itertools.cycle(data.doctors))]
+
+    async def body(result: ScenarioResult):
+        async def pair(doctor: Person, patient: Person):
+            pending: dict[str, float] = {}
+            try:
+                async with websockets.connect(f"{stack.ws_url}/api/v1/ws/chat?token={doctor.token}") as doctor_ws, \
+                           websockets.connect(f"{stack.ws_url}/api/v1/ws/chat?token={patient.token}") as patient_ws:
+                    def on_sent(message: dict):
+                        if message.get("type") == "message_sent":
+                            sent = pending.pop((message.get("message") or {}).get("content"), None)
+                            if sent is not None:
+                                result.latencies.append(time.perf_counter() - sent)
+                    readers = [asyncio.create_task(_drain(doctor_ws, on_sent)), asyncio.create_task(_drain(patient_ws))]
+                    deadline = time.perf_counter() + duration
+                    while time.perf_counter() < deadline:
+                        for _ in range(burst):
+                            content = f"bench {uuid.uuid4()}"
+                            pending[content] = time.perf_counter()
+                            await doctor_ws.send(json.dumps({"recipient_id": patient.auth_id, "content": content}))
+                        await asyncio.sleep(1.0)
+                    await asyncio.sleep(1.0)
+                    result.errors += len(pending)
+                    for reader in readers:
+                        reader.cancel()
+            except (OSError, websockets.WebSocketException):
+                result.errors += 1
+        await asyncio.gather(*[pair(d, p) for d, p in pairs])
+
+    return await _measure(stack, "chat_burst", body)
+
+async def cdc_invalidation(stack: Stack, data: SeedData, duration: float, concurrency: int) -> ScenarioResult:
+    """
+    Change a patient's prescription behind the API's back and time how long the
+    cached /patient/my_exercises takes to show it - the change feed round-trip.
+    """
+    patients = data.all_patients()[:concurrency]
+
+    async def body(result: ScenarioResult):
+        deadline = time.perf_counter() + duration
+        async with httpx.AsyncClient(base_url=stack.base_url, timeout=30) as client:
+            async def exercises(patient: Person) -> list[dict]:
+                resp = await client.get("/api/v1/patient/my_exercises", headers=_auth(patient))
+                resp.raise_for_status()
+                return resp.json()
+
+            async def worker(patient: Person):
+                while time.perf_counter() < deadline:
+                    try:
+                        rows = await exercises(patient)
+                        if not rows:
+                            return
+                        target = {"id": rows[0]["id"], "sets": rows[0]["sets"] + 1}
+                        await asyncio.to_thread(stack.fake.write_external, "assigned_exercises",
+                                                {"id": target["id"]}, {"sets": target["sets"]})
+                        written = time.perf_counter()
+                        while not any(r["id"] == target["id"] and r["sets"] == target["sets"] for r in await exercises(patient)):
+                            if time.perf_counter() - written > 5:
+                                raise TimeoutError("external write never showed up")
+                            await asyncio.sleep(0.005)
+                        result.latencies.append(time.perf_counter() - written)
+                    except (httpx.HTTPError, TimeoutError):
+                        result.errors += 1
+            await asyncio.gather(*[worker(p) for p in patients])
+
+    return await _measure(stack, "cdc_invalidation", body)
+
+async def session_start(stack: Stack, data: SeedData, duration: float, concurrency: int) -> ScenarioResult:
+    """Patients starting exercise sessions: POST /sessions, which also notifies their doctor."""
+    patients = data.all_patients()
+    return await http_loop(stack, "session_start", duration, concurrency,
+                           lambda i: ("POST", "/api/v1/sessions", patients[i % len(patients)],
+                                      {"exercise_id": data.exercise_ids[i % len(data.exercise_ids)]}, {}))
+
+SCENARIOS = {
+    "doctor_dashboard": doctor_dashboard,
+    "doctor_patients": doctor_patients,
+    "patient_today": patient_today,
+    "bulk_assignment": bulk_assignment,
+    "live_session": live_session,
+    "chat_burst": chat_burst,
+    "cdc_invalidation": cdc_invalidation,
+    # Last: every op adds session and notification rows the other scenarios would read
+    "session_start": session_start,
+}
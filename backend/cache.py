@@ -0,0 +1,278 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Iterable, Optional
+from instrumentation import Counter, Gauge, METRICS
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# "memory" (per worker LRU) or "redis" (shared by all workers; needs REDIS_URL)
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "memory").lower()
+# With the memory backend, a write only invalidates its own worker's entries;
+# other workers serve the old response until it expires
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "60"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000"))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+REDIS_URL = os.getenv("REDIS_URL")
+
+class TTLCache:
+    """
+    Small in-process cache with a per-entry time-to-live.
+    Used for hot read endpoints that are expensive to compute and
+    cheap to invalidate from the write handlers.
+    """
+    def __init__(self, ttl_seconds: float = 30.0):
+        self.ttl_seconds = ttl_seconds
+        self._entries: dict[str, tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if not entry:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            return value
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None):
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+
+    def invalidate(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_prefix(self, prefix: str):
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+# Doctor dashboard aggregates, keyed by "<doctor_db_id>:<variant>"
+dashboard_cache = TTLCache(ttl_seconds=30)
+
+# patient_id -> doctor_db_id, filled when a dashboard is built so that
+# patient-side writes can find the dashboard they affect without a query.
+_patient_doctor: dict[str, str] = {}
+# doctor auth_user_id -> doctor_db_id, for writes that only know the auth id (chat)
+_auth_doctor: dict[str, str] = {}
+
+def remember_patient_doctor(patient_id: str, doctor_id: str):
+    _patient_doctor[patient_id] = doctor_id
+
+def remember_doctor_auth(auth_user_id: str, doctor_id: str):
+    _auth_doctor[auth_user_id] = doctor_id
+
+def invalidate_dashboard(doctor_id: Optional[str] = None, patient_id: Optional[str] = None, auth_user_id: Optional[str] = None):
+    """
+    Drop cached dashboard data after a write.
+    The doctor's DB id, their auth id or one of their patients' ids can be given.
+    """
+    if not doctor_id and patient_id:
+        doctor_id = _patient_doctor.get(patient_id)
+    if not doctor_id and auth_user_id:
+        doctor_id = _auth_doctor.get(auth_user_id)
+    if doctor_id:
+        dashboard_cache.invalidate_prefix(f"{doctor_id}:")
+
+
+class LRUBackend:
+    """
+    Per-worker response store bounded by entry count and serialized size,
+    with a tag -> keys index so writes can drop everything they affect.
+    """
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES, max_bytes: int = RESPONSE_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        # key -> (expires_at, body, tags)
+        self._entries: "OrderedDict[str, tuple[float, bytes, tuple[str, ...]]]" = OrderedDict()
+        self._tags: dict[str, set[str]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.bytes -= len(entry[1])
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, body: bytes, ttl_seconds: float, tags: tuple[str, ...]):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = (time.monotonic() + ttl_seconds, body, tags)
+            self.bytes += len(body)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while self._entries and (len(self._entries) > self.max_entries or self.bytes > self.max_bytes):
+                self._drop(next(iter(self._entries)))
+
+    def invalidate_tags(self, tags: Iterable[str]) -> int:
+        with self._lock:
+            keys = set()
+            for tag in tags:
+                keys |= self._tags.get(tag, set())
+            for key in keys:
+                self._drop(key)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+            self.bytes = 0
+
+class RedisBackend:
+    """
+    Shared response store: every worker sees the same entries, and an
+    invalidation from any worker drops them for all. Tags are Redis sets of keys.
+    """
+    PREFIX = "physiocheck:resp:"
+    TAG_PREFIX = "physiocheck:resptag:"
+
+    def __init__(self, url: str):
+        self._redis = redis.Redis.from_url(url, socket_timeout=0.5)
+        self.bytes = 0
+
+    def __len__(self) -> int:
+        return 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self._redis.get(self.PREFIX + key)
+
+    def set(self, key: str, body: bytes, ttl_seconds: float, tags: tuple[str, ...]):
+        pipe = self._redis.pipeline()
+        pipe.set(self.PREFIX + key, body, ex=int(ttl_seconds))
+        for tag in tags:
+            pipe.sadd(self.TAG_PREFIX + tag, key)
+            # Tag sets outlive their entries by at most one TTL
+            pipe.expire(self.TAG_PREFIX + tag, int(ttl_seconds) * 2)
+        pipe.execute()
+
+    def invalidate_tags(self, tags: Iterable[str]) -> int:
+        tag_keys = [self.TAG_PREFIX + t for t in tags]
+        if not tag_keys:
+            return 0
+        keys = {k.decode() if isinstance(k, bytes) else k for k in self._redis.sunion(tag_keys)}
+        pipe = self._redis.pipeline()
+        if keys:
+            pipe.delete(*[self.PREFIX + k for k in keys])
+        pipe.delete(*tag_keys)
+        pipe.execute()
+        return len(keys)
+
+    def clear(self):
+        pass
+
+response_cache_requests = Counter(
+    "response_cache_requests_total", "Response cache lookups by namespace and result.", ("namespace", "result"))
+response_cache_invalidations = Counter(
+    "response_cache_invalidated_entries_total", "Entries dropped by tag invalidation, by tag kind.", ("kind",))
+
+class ResponseCache:
+    """
+    Cached endpoint results, stored as JSON and dropped by tag when the data
+    behind them is written. Keys are "<namespace>:<...>" and must include
+    whoever the response is for; tags name the rows it was built from, e.g.
+    "patient:<id>", "doctor:<id>", "exercise:<id>", "user:<auth id>".
+    Backend errors are logged and treated as misses, never as request failures.
+    """
+    def __init__(self, backend, ttl_seconds: float = RESPONSE_CACHE_TTL_SECONDS):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+
+    @staticmethod
+    def _tags(tags: Iterable[str]) -> tuple[str, ...]:
+        # A tag built from a missing id, e.g. "patient:None", would match unrelated entries
+        return tuple({t for t in tags if t and not t.endswith(":None")})
+
+    def get(self, key: str) -> Optional[Any]:
+        namespace = key.split(":", 1)[0]
+        try:
+            body = self.backend.get(key)
+        except Exception as e:
+            logger.warning(f"Response cache get failed: {e}")
+            body = None
+        response_cache_requests.inc((namespace, "hit" if body is not None else "miss"))
+        return json.loads(body) if body is not None else None
+
+    def set(self, key: str, value: Any, tags: Iterable[str], ttl_seconds: Optional[float] = None):
+        try:
+            body = json.dumps(value, default=str, separators=(",", ":")).encode()
+            self.backend.set(key, body, self.ttl_seconds if ttl_seconds is None else ttl_seconds, self._tags(tags))
+        except Exception as e:
+            logger.warning(f"Response cache set failed: {e}")
+
+    def invalidate(self, *tags: str):
+        tags = self._tags(tags)
+        if not tags:
+            return
+        try:
+            dropped = self.backend.invalidate_tags(tags)
+        except Exception as e:
+            logger.warning(f"Response cache invalidation failed: {e}", extra={"tags": tags})
+            return
+        if dropped:
+            response_cache_invalidations.inc((tags[0].split(":", 1)[0],), dropped)
+
+    def clear(self):
+        try:
+            self.backend.clear()
+        except Exception as e:
+            logger.warning(f"Response cache clear failed: {e}")
+
+def _response_backend():
+    if RESPONSE_CACHE_BACKEND == "redis":
+        if REDIS_URL and redis is not None:
+            try:
+                return RedisBackend(REDIS_URL)
+            except Exception as e:
+                logger.warning(f"Response cache: Redis unavailable, using local memory: {e}")
+        else:
+            logger.warning("RESPONSE_CACHE_BACKEND=redis needs REDIS_URL and the redis package; using local memory")
+    return LRUBackend()
+
+response_cache = ResponseCache(_response_backend())
+
+METRICS.extend([
+    response_cache_requests,
+    response_cache_invalidations,
+    Gauge("response_cache_entries", "Entries in this worker's response cache.", lambda: len(response_cache.backend)),
+    Gauge("response_cache_bytes", "Serialized size of this worker's response cache.", lambda: response_cache.backend.bytes),
+])
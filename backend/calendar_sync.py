@@ -0,0 +1,279 @@
+import os
+import asyncio
+from datetime import date, datetime, timedelta
+from typing import Optional
+from database import supabase
+from async_db import db
+from cache import response_cache
+from scheduling import parse_rrule, series_recurrence
+from google_calendar import (
+    create_google_calendar_event, create_google_calendar_series, update_google_calendar_event,
+    delete_google_calendar_event, instance_event_id, is_mock_event
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+CALENDAR_SYNC_POLL_SECONDS = int(os.getenv("CALENDAR_SYNC_POLL_SECONDS", "10"))
+CALENDAR_SYNC_BATCH_SIZE = 100
+CALENDAR_SYNC_MAX_ATTEMPTS = 8
+# Jobs stuck in 'processing' this long (worker died mid-batch) are picked up again
+CALENDAR_SYNC_LOCK_TIMEOUT = timedelta(minutes=5)
+
+# Set by enqueue() so the worker picks up new jobs without waiting a full poll
+_wake = asyncio.Event()
+_worker_loop: Optional[asyncio.AbstractEventLoop] = None
+
+def _notify_worker():
+    if _worker_loop is None:
+        return
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is _worker_loop:
+        _wake.set()
+    else:
+        # Called from a sync route running in the threadpool
+        _worker_loop.call_soon_threadsafe(_wake.set)
+
+def enqueue_calendar_sync(doctor_id: str, appointment_id: str, action: str, google_event_id: Optional[str] = None,
+                          series_id: Optional[str] = None):
+    """
+    Record a calendar change for the sync worker.
+    action is 'create', 'create_series', 'patch' or 'delete'. A create_series
+    job is keyed by the series' first appointment and carries series_id, which
+    is all it needs if that appointment is deleted first. Create and patch jobs
+    read the appointment row when they run, so they always sync its latest
+    state; delete jobs carry the event id since the row is gone by then.
+    """
+    try:
+        supabase.from_("calendar_sync_jobs").insert({
+            "doctor_id": doctor_id,
+            "appointment_id": appointment_id,
+            "action": action,
+            "google_event_id": google_event_id,
+            "series_id": series_id,
+            "status": "pending",
+            "attempts": 0,
+            "next_attempt_at": datetime.utcnow().isoformat()
+        }).execute()
+        _notify_worker()
+    except Exception as e:
+        logger.error(f"Failed to enqueue calendar sync ({action} {appointment_id}): {e}")
+
+def _claim_jobs() -> list[dict]:
+    now = datetime.utcnow()
+    due_res = supabase.from_("calendar_sync_jobs")\
+        .select("id")\
+        .or_(
+            f"and(status.eq.pending,next_attempt_at.lte.{now.isoformat()}),"
+            f"and(status.eq.processing,locked_at.lt.{(now - CALENDAR_SYNC_LOCK_TIMEOUT).isoformat()})"
+        )\
+        .order("created_at")\
+        .limit(CALENDAR_SYNC_BATCH_SIZE)\
+        .execute()
+    ids = [j["id"] for j in due_res.data or []]
+    if not ids:
+        return []
+    # The conditional update is the claim: another worker that read the
+    # same ids only gets back the rows it actually flipped.
+    claim_res = supabase.from_("calendar_sync_jobs")\
+        .update({"status": "processing", "locked_at": now.isoformat()})\
+        .in_("id", ids)\
+        .or_(f"status.eq.pending,locked_at.lt.{(now - CALENDAR_SYNC_LOCK_TIMEOUT).isoformat()}")\
+        .execute()
+    return claim_res.data or []
+
+def _load_appointments(appointment_ids: list[str]) -> dict[str, dict]:
+    if not appointment_ids:
+        return {}
+    res = supabase.from_("appointments")\
+        .select("*, patients(email)")\
+        .in_("id", appointment_ids)\
+        .execute()
+    return {a["id"]: a for a in res.data or []}
+
+def _finish_jobs(job_ids: list[str]):
+    supabase.from_("calendar_sync_jobs")\
+        .update({"status": "done", "locked_at": None})\
+        .in_("id", job_ids)\
+        .execute()
+
+def _retry_jobs(jobs: list[dict], error: str):
+    for job in jobs:
+        attempts = (job.get("attempts") or 0) + 1
+        delay = min(30 * 2 ** (attempts - 1), 3600)
+        supabase.from_("calendar_sync_jobs").update({
+            "status": "failed" if attempts >= CALENDAR_SYNC_MAX_ATTEMPTS else "pending",
+            "attempts": attempts,
+            "last_error": error[:500],
+            "locked_at": None,
+            "next_attempt_at": (datetime.utcnow() + timedelta(seconds=delay)).isoformat()
+        }).eq("id", job["id"]).execute()
+
+def _invalidate_lists(rows: list[dict]):
+    # Appointment lists show the Meet link
+    response_cache.invalidate(*{t for r in rows for t in (f"patient:{r.get('patient_id')}", f"doctor:{r.get('doctor_id')}")})
+
+def _write_back(appointment_id: str, event_id: Optional[str], meet_link: Optional[str]) -> bool:
+    res = supabase.from_("appointments")\
+        .update({"google_event_id": event_id, "google_meet_link": meet_link})\
+        .eq("id", appointment_id)\
+        .execute()
+    _invalidate_lists(res.data or [])
+    return bool(res.data)
+
+def _load_series(series_id: str) -> list[dict]:
+    res = supabase.from_("appointments")\
+        .select("*, patients(email)")\
+        .eq("series_id", series_id)\
+        .order("appointment_date")\
+        .execute()
+    return res.data or []
+
+def _write_back_series(rows: list[dict]):
+    # Full rows so the upsert's insert half satisfies NOT NULL columns;
+    # every row conflicts on id, so this is one bulk update.
+    supabase.from_("appointments").upsert(rows, on_conflict="id").execute()
+    _invalidate_lists(rows)
+
+async def _create_series_event(doctor_id: str, series_id: str) -> bool:
+    rows = await db.run(_load_series, series_id)
+    rows = [r for r in rows if not r.get("google_event_id")]
+    if not rows or not rows[0].get("recurrence_rule"):
+        return True
+    first = rows[0]
+    patient_email = (first.get("patients") or {}).get("email")
+    if not patient_email:
+        return True
+    # The stored RRULE describes the series as created; rows may have been
+    # deleted or moved since, so the event covers the rows as they are now
+    freq, interval = parse_rrule(first["recurrence_rule"])
+    recurrence, off_pattern = series_recurrence(
+        freq, interval, [date.fromisoformat(r["appointment_date"]) for r in rows], first["start_time"])
+    g_event = await create_google_calendar_series(doctor_id, first, patient_email, recurrence)
+    if not g_event:
+        return False
+    updates, singles = [], []
+    for row in rows:
+        row = {k: v for k, v in row.items() if k != "patients"}
+        if date.fromisoformat(row["appointment_date"]) in off_pattern:
+            singles.append(row)
+            continue
+        # Instance ids use the series' start time, even for an occurrence moved to another time
+        row["google_event_id"] = instance_event_id(g_event["id"], row["appointment_date"], first["start_time"])
+        row["google_meet_link"] = g_event.get("meet_link")
+        updates.append(row)
+    await db.run(_write_back_series, updates)
+    for row in updates:
+        # Occurrences cancelled before the event existed still come out of the RRULE
+        if row.get("status") == "cancelled":
+            await delete_google_calendar_event(doctor_id, row["google_event_id"])
+        elif (row["start_time"][:5], row["end_time"][:5]) != (first["start_time"][:5], first["end_time"][:5]):
+            await update_google_calendar_event(doctor_id, row["google_event_id"], row)
+    # Moved to a date the rule never produces: an event of their own
+    for row in singles:
+        if row.get("status") == "cancelled" or row.get("appointment_mode") != "virtual":
+            continue
+        g_single = await create_google_calendar_event(doctor_id, row, patient_email)
+        if g_single:
+            await db.run(_write_back, row["id"], g_single.get("id"), g_single.get("meet_link"))
+    return True
+
+async def _sync_appointment(doctor_id: str, appointment_id: str, jobs: list[dict], appointment: Optional[dict]) -> bool:
+    """Bring one appointment's calendar event in line with its current row."""
+    deleted_event_ids = {j["google_event_id"] for j in jobs if j["action"] == "delete" and j.get("google_event_id")}
+    for event_id in deleted_event_ids:
+        if not await delete_google_calendar_event(doctor_id, event_id):
+            return False
+    if appointment is None:
+        # Row deleted; any event it had is covered by the delete jobs above.
+        # The rest of its series may still be waiting for its recurring event.
+        series_id = next((j.get("series_id") for j in jobs if j["action"] == "create_series" and j.get("series_id")), None)
+        if series_id:
+            return await _create_series_event(doctor_id, series_id)
+        return True
+
+    event_id = appointment.get("google_event_id")
+    if appointment.get("series_id") and not event_id:
+        if any(j["action"] == "create_series" for j in jobs):
+            return await _create_series_event(doctor_id, appointment["series_id"])
+        # Occurrences get their event from the series' own job
+        return True
+
+    wants_event = appointment.get("appointment_mode") == "virtual" and appointment.get("status") != "cancelled"
+
+    if not wants_event:
+        if event_id:
+            if not await delete_google_calendar_event(doctor_id, event_id):
+                return False
+            await db.run(_write_back, appointment_id, None, None)
+        return True
+
+    if event_id:
+        return await update_google_calendar_event(doctor_id, event_id, appointment)
+
+    patient_email = (appointment.get("patients") or {}).get("email")
+    if not patient_email:
+        return True
+    g_event = await create_google_calendar_event(doctor_id, appointment, patient_email)
+    if not g_event:
+        return False
+    if not await db.run(_write_back, appointment_id, g_event.get("id"), g_event.get("meet_link")):
+        # Appointment was deleted while the event was being created
+        if not is_mock_event(g_event.get("id")):
+            await delete_google_calendar_event(doctor_id, g_event["id"])
+    return True
+
+async def _process_doctor(doctor_id: str, jobs: list[dict], appointments: dict[str, dict]):
+    # Jobs for the same appointment collapse into one sync of its latest state
+    by_appointment: dict[str, list[dict]] = {}
+    for job in jobs:
+        by_appointment.setdefault(job["appointment_id"], []).append(job)
+
+    for appointment_id, appt_jobs in by_appointment.items():
+        try:
+            ok = await _sync_appointment(doctor_id, appointment_id, appt_jobs, appointments.get(appointment_id))
+            error = "Google Calendar request failed"
+        except Exception as e:
+            ok, error = False, str(e)
+        if ok:
+            await db.run(_finish_jobs, [j["id"] for j in appt_jobs])
+        else:
+            logger.error(f"Calendar sync failed for appointment {appointment_id}: {error}")
+            await db.run(_retry_jobs, appt_jobs, error)
+
+async def process_calendar_sync_batch() -> int:
+    jobs = await db.run(_claim_jobs)
+    if not jobs:
+        return 0
+    appointments = await db.run(_load_appointments, list({j["appointment_id"] for j in jobs}))
+
+    by_doctor: dict[str, list[dict]] = {}
+    for job in jobs:
+        by_doctor.setdefault(job["doctor_id"], []).append(job)
+    # Doctors run concurrently; each one's jobs share a single cached access token
+    await asyncio.gather(*[
+        _process_doctor(doctor_id, doctor_jobs, appointments)
+        for doctor_id, doctor_jobs in by_doctor.items()
+    ])
+    return len(jobs)
+
+async def run_calendar_sync_worker():
+    """Background loop started with the app."""
+    global _worker_loop
+    _worker_loop = asyncio.get_running_loop()
+    while True:
+        _wake.clear()
+        try:
+            processed = await process_calendar_sync_batch()
+            if processed == CALENDAR_SYNC_BATCH_SIZE:
+                # Backlog left; go again immediately
+                continue
+        except Exception as e:
+            logger.error(f"Calendar sync worker error: {e}")
+        try:
+            await asyncio.wait_for(_wake.wait(), timeout=CALENDAR_SYNC_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
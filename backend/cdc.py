@@ -0,0 +1,291 @@
+import os
+import asyncio
+from datetime import datetime, timezone
+from typing import Callable, Optional
+from instrumentation import Histogram, Counter, Gauge, METRICS
+from cache import dashboard_cache, response_cache, remember_patient_doctor, invalidate_dashboard
+from compliance import compliance_cache, invalidate_compliance
+from daily_plan import daily_plans
+from scheduling import schedule_index
+from doctor import history_cache
+from exercises import catalog_cache
+from websocket import manager as session_manager
+from chat import manager as chat_manager
+from replicas import read_replicas, REPLICA_MAX_LAG_SECONDS
+from analytics import analytics
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    from realtime import AsyncRealtimeClient, RealtimeSubscribeStates
+except ImportError:
+    AsyncRealtimeClient = None
+
+# Off by default: the tables below must be in the supabase_realtime publication
+CDC_ENABLED = os.getenv("CDC_ENABLED", "false").lower() == "true"
+REALTIME_URL = os.getenv("REALTIME_URL") or f"{os.getenv('SUPABASE_URL', '')}/realtime/v1"
+# Cache TTLs while the change feed is connected; writes from anywhere invalidate, so these can be long
+CDC_CACHE_TTL_SECONDS = int(os.getenv("CDC_CACHE_TTL_SECONDS", "3600"))
+CDC_RECONNECT_MAX_SECONDS = float(os.getenv("CDC_RECONNECT_MAX_SECONDS", "30"))
+CDC_SUBSCRIBE_TIMEOUT_SECONDS = float(os.getenv("CDC_SUBSCRIBE_TIMEOUT_SECONDS", "10"))
+
+LAG_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Delayed second invalidations, kept until they finish since the loop only holds tasks weakly
+_reinvalidations: set[asyncio.Task] = set()
+
+cdc_events = Counter("cdc_events_total", "Row changes received from the change feed.", ("table", "type"))
+cdc_lag = Histogram("cdc_event_lag_seconds", "Commit to invalidation delay for change feed events.", (), LAG_BUCKETS)
+cdc_resyncs = Counter("cdc_resyncs_total", "Full cache flushes because the change feed connected or dropped.", ("reason",))
+
+# UPDATE and DELETE events carry only the primary key in old_record unless the
+# table has REPLICA IDENTITY FULL, so handlers read foreign keys from the new
+# record and treat old_record as best effort.
+
+def _patients(kind: str, record: dict, old: dict):
+    patient_id = record.get("id") or old.get("id")
+    doctor_ids = {record.get("doctor_id"), old.get("doctor_id")} - {None}
+    response_cache.invalidate(f"patient:{patient_id}", f"user:{record.get('auth_user_id')}",
+                              *[f"doctor:{d}" for d in doctor_ids])
+    for doctor_id in doctor_ids:
+        invalidate_dashboard(doctor_id=doctor_id)
+    if not doctor_ids:
+        invalidate_dashboard(patient_id=patient_id)
+    if record.get("doctor_id") and kind != "DELETE":
+        remember_patient_doctor(patient_id, record["doctor_id"])
+
+def _doctors(kind: str, record: dict, old: dict):
+    doctor_id = record.get("id") or old.get("id")
+    response_cache.invalidate(f"doctor:{doctor_id}", f"user:{record.get('auth_user_id')}")
+    invalidate_dashboard(doctor_id=doctor_id)
+
+def _patient_activity(kind: str, record: dict, old: dict):
+    """assigned_exercises and exercise_sessions: everything derived from one patient's activity."""
+    patient_id = record.get("patient_id") or old.get("patient_id")
+    if not patient_id:
+        # A DELETE without the full old row; nothing says whose data changed
+        resync("unattributed_delete")
+        return
+    invalidate_dashboard(patient_id=patient_id)
+    invalidate_compliance(patient_id)
+    daily_plans.invalidate(patient_id)
+    history_cache.invalidate(patient_id)
+    response_cache.invalidate(f"patient:{patient_id}", f"exercise:{record.get('exercise_id')}")
+
+def _exercise_sessions(kind: str, record: dict, old: dict):
+    # The reaper stamps last_seen_at on every live session each tick; none of
+    # the caches depend on it, so those updates must not flush them all
+    if kind == "UPDATE" and _heartbeat_only(record, old):
+        return
+    _patient_activity(kind, record, old)
+
+def _heartbeat_only(record: dict, old: dict) -> bool:
+    if "status" in old:
+        # REPLICA IDENTITY FULL: compare the rows
+        return {k for k, v in record.items() if old.get(k) != v} <= {"last_seen_at"}
+    # Only the key in old_record. Sessions never go back to in_progress, so
+    # the status didn't change; progress saved through update_session
+    # invalidates on its own
+    return record.get("status") == "in_progress"
+
+def _exercises(kind: str, record: dict, old: dict):
+    catalog_cache.invalidate("all")
+    response_cache.invalidate(f"exercise:{record.get('id') or old.get('id')}")
+
+def _appointments(kind: str, record: dict, old: dict):
+    appointment_id = record.get("id") or old.get("id")
+    if kind == "DELETE" or record.get("status") == "cancelled":
+        schedule_index.remove(appointment_id)
+    else:
+        schedule_index.add(record["doctor_id"], appointment_id, record["appointment_date"],
+                           record["start_time"], record["end_time"])
+    invalidate_dashboard(doctor_id=record.get("doctor_id") or old.get("doctor_id"))
+    if record.get("patient_id"):
+        daily_plans.invalidate(record["patient_id"])
+    # A delete with a key-only old_record names no one; deletes through the API invalidate themselves
+    response_cache.invalidate(f"patient:{record.get('patient_id') or old.get('patient_id')}",
+                              f"doctor:{record.get('doctor_id') or old.get('doctor_id')}")
+
+def _messages(kind: str, record: dict, old: dict):
+    invalidate_dashboard(auth_user_id=record.get("recipient_id"))
+    invalidate_dashboard(auth_user_id=record.get("sender_id"))
+
+INVALIDATORS: dict[str, Callable[[str, dict, dict], None]] = {
+    "patients": _patients,
+    "doctors": _doctors,
+    "assigned_exercises": _patient_activity,
+    "exercise_sessions": _exercise_sessions,
+    "exercises": _exercises,
+    "appointments": _appointments,
+    "messages": _messages,
+}
+
+async def _push_session(kind: str, record: dict, old: dict):
+    # Sessions ended by the reaper, another worker or an admin reach the doctors
+    # monitoring on this worker. update_session also pushes its own writes;
+    # session_update carries the row's state, so a repeat is harmless.
+    if kind == "UPDATE" and record.get("status") not in (None, "in_progress"):
+        await session_manager.signal_to_doctor(record["patient_id"], {
+            "type": "session_update",
+            "session_id": record["id"],
+            "status": record["status"],
+            "data": record
+        })
+
+async def _push_notification(kind: str, record: dict, old: dict):
+    if kind == "INSERT" and record.get("user_id"):
+        await chat_manager.send_personal_message({"type": "notification", "notification": record}, record["user_id"])
+
+PUSHES: dict[str, Callable[[str, dict, dict], object]] = {
+    "exercise_sessions": _push_session,
+    "notifications": _push_notification,
+}
+
+TABLES = tuple(dict.fromkeys([*INVALIDATORS, *PUSHES]))
+
+def resync(reason: str):
+    """Drop everything the change feed would otherwise keep current; events may have been missed."""
+    cdc_resyncs.inc((reason,))
+    dashboard_cache.clear()
+    compliance_cache.clear()
+    response_cache.clear()
+    daily_plans.clear()
+    schedule_index.clear()
+
+def _commit_lag(timestamp: Optional[str]) -> Optional[float]:
+    try:
+        committed = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    except (AttributeError, ValueError):
+        return None
+    if committed.tzinfo is None:
+        committed = committed.replace(tzinfo=timezone.utc)
+    return max(0.0, (datetime.now(timezone.utc) - committed).total_seconds())
+
+class ChangeFeed:
+    """
+    Subscribes to Supabase Realtime postgres_changes for the tables that back
+    our caches and turns each row change into invalidations (and, for some
+    tables, WebSocket pushes), so writes made outside this API - the dashboard,
+    SQL scripts, other workers - don't leave stale data behind.
+
+    While subscribed, dashboard and response caches use CDC_CACHE_TTL_SECONDS.
+    Caches are flushed whenever the feed connects or drops, since changes in
+    the gap were not seen, and fall back to their own TTLs while it is down.
+    """
+    def __init__(self, url: str = REALTIME_URL, tables: tuple[str, ...] = TABLES):
+        self.url = url
+        self.tables = tables
+        self.connected = False
+        self._queue: "asyncio.Queue[dict]" = asyncio.Queue()
+        self._default_ttls = (dashboard_cache.ttl_seconds, response_cache.ttl_seconds)
+
+    def _on_change(self, payload: dict):
+        # Called by the realtime client on the loop; handled in order by _consume
+        self._queue.put_nowait(payload["data"])
+
+    async def _consume(self):
+        while True:
+            change = await self._queue.get()
+            try:
+                await self.apply(change)
+            except Exception as e:
+                logger.exception(f"Failed to apply {change.get('type')} on {change.get('table')}: {e}")
+
+    async def apply(self, change: dict):
+        table, kind = change.get("table"), change.get("type")
+        record, old = change.get("record") or {}, change.get("old_record") or {}
+        cdc_events.inc((table, kind))
+        invalidate = INVALIDATORS.get(table)
+        if invalidate:
+            # Off the loop: the response cache may be backed by Redis
+            await asyncio.to_thread(invalidate, kind, record, old)
+            if read_replicas.replicas or analytics.replicas.replicas:
+                task = asyncio.create_task(self._invalidate_again(invalidate, kind, record, old))
+                _reinvalidations.add(task)
+                task.add_done_callback(_reinvalidations.discard)
+        lag = _commit_lag(change.get("commit_timestamp"))
+        if lag is not None:
+            cdc_lag.observe((), lag)
+        push = PUSHES.get(table)
+        if push:
+            await push(kind, record, old)
+
+    async def _invalidate_again(self, invalidate: Callable[[str, dict, dict], None], kind: str, record: dict, old: dict):
+        # A read served by a replica that hadn't replayed this change yet may
+        # have refilled a cache since; replicas over the max lag get no reads
+        await asyncio.sleep(REPLICA_MAX_LAG_SECONDS)
+        try:
+            await asyncio.to_thread(invalidate, kind, record, old)
+        except Exception as e:
+            logger.exception(f"Failed to re-apply invalidation for {kind}: {e}")
+
+    def _set_connected(self, connected: bool):
+        self.connected = connected
+        resync("connected" if connected else "disconnected")
+        dashboard_ttl, response_ttl = self._default_ttls
+        dashboard_cache.ttl_seconds = max(dashboard_ttl, CDC_CACHE_TTL_SECONDS) if connected else dashboard_ttl
+        response_cache.ttl_seconds = max(response_ttl, CDC_CACHE_TTL_SECONDS) if connected else response_ttl
+        log = logger.info if connected else logger.warning
+        log(f"Change feed {'subscribed' if connected else 'disconnected'}", extra={"tables": list(self.tables)})
+
+    async def _subscribe(self, client) -> asyncio.Task:
+        subscribed = asyncio.get_running_loop().create_future()
+
+        def on_state(state, error):
+            if not subscribed.done():
+                if state == RealtimeSubscribeStates.SUBSCRIBED:
+                    subscribed.set_result(None)
+                else:
+                    subscribed.set_exception(error or RuntimeError(f"Change feed subscription {state}"))
+
+        channel = client.channel("physiocheck-cdc")
+        for table in self.tables:
+            channel.on_postgres_changes("*", self._on_change, table=table, schema="public")
+        await channel.subscribe(on_state)
+        await asyncio.wait_for(subscribed, CDC_SUBSCRIBE_TIMEOUT_SECONDS)
+        # The client's reader task ends when the socket closes; it has no public hook for that
+        return client._listen_task
+
+    async def run(self):
+        """Background task started with the app; reconnects with backoff for as long as it runs."""
+        if not CDC_ENABLED:
+            return
+        if AsyncRealtimeClient is None:
+            logger.warning("CDC_ENABLED is set but the realtime package is not installed")
+            return
+        from database import SUPABASE_SERVICE_ROLE_KEY
+        consumer = asyncio.create_task(self._consume())
+        backoff = 1.0
+        try:
+            while True:
+                client = AsyncRealtimeClient(self.url, SUPABASE_SERVICE_ROLE_KEY, auto_reconnect=False, max_retries=1)
+                try:
+                    reader = await self._subscribe(client)
+                    self._set_connected(True)
+                    backoff = 1.0
+                    await reader
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.warning(f"Change feed connection failed: {e}")
+                finally:
+                    if self.connected:
+                        self._set_connected(False)
+                    try:
+                        await client.close()
+                    except Exception:
+                        pass
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, CDC_RECONNECT_MAX_SECONDS)
+        finally:
+            consumer.cancel()
+
+change_feed = ChangeFeed()
+
+METRICS.extend([
+    cdc_events,
+    cdc_lag,
+    cdc_resyncs,
+    Gauge("cdc_connected", "1 while the change feed is subscribed.", lambda: int(change_feed.connected)),
+])
@@ -1,19 +1,16 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query, HTTPException, UploadFile, File
 from typing import Optional, List, Dict
-from database import supabase
+from async_db import db
 from schemas import MessageCreate, Message
+from cache import invalidate_dashboard
 import json
 from datetime import datetime
 import uuid
 import logging
-import sys
 
-# Configure logging explicitly for this module
-logger = logging.getLogger("chat_module")
-logger.setLevel(logging.DEBUG)
-handler = logging.FileHandler('chat_debug.log')
-handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(message)s'))
-logger.addHandler(handler)
+logger = logging.getLogger(__name__)
+# Per-message events; sampled (see LOG_SAMPLE_RATES)
+event_logger = logging.getLogger("chat.events")
 
 router = APIRouter(tags=["Chat"])
 
@@ -27,7 +24,7 @@ class ChatConnectionManager:
         if user_id not in self.active_connections:
             self.active_connections[user_id] = []
         self.active_connections[user_id].append(websocket)
-        logger.debug(f"DEBUG: User {user_id} connected to chat. Active sessions: {len(self.active_connections[user_id])}")
+        logger.debug("Chat connected", extra={"user_id": user_id, "connections": len(self.active_connections[user_id])})
 
     def disconnect(self, user_id: str, websocket: WebSocket):
         if user_id in self.active_connections:
@@ -35,7 +32,7 @@ class ChatConnectionManager:
                 self.active_connections[user_id].remove(websocket)
             if not self.active_connections[user_id]:
                 del self.active_connections[user_id]
-        logger.debug(f"DEBUG: User {user_id} disconnected from chat.")
+        logger.debug("Chat disconnected", extra={"user_id": user_id})
 
     async def send_personal_message(self, message: dict, user_id: str):
         if user_id in self.active_connections:
@@ -43,7 +40,7 @@ class ChatConnectionManager:
                 try:
                     await connection.send_json(message)
                 except Exception as e:
-                    logger.debug(f"Error sending message to {user_id}: {e}")
+                    logger.warning(f"Error sending message to {user_id}: {e}")
 
 manager = ChatConnectionManager()
 
@@ -62,7 +59,7 @@ async def websocket_endpoint(
 
     try:
         # Verify token
-        user = supabase.auth.get_user(token)
+        user = await db.get_user(token)
         if not user or not user.user:
             await websocket.close(code=1008, reason="Invalid authentication token")
             return
@@ -83,7 +80,6 @@ async def websocket_endpoint(
                 message_data = json.loads(data)
                 
                 # Expecting: { recipient_id: str, content: str, type: 'text'|'attachment', ... }
-                logger.debug(f"DEBUG: Received chat message from {user_id}: {message_data}")
                 
                 start_time = datetime.utcnow()
                 
@@ -92,7 +88,7 @@ async def websocket_endpoint(
                 content = message_data.get("content")
                 
                 if not recipient_id:
-                     logger.debug("DEBUG: Missing recipient_id")
+                     logger.warning("Chat message without recipient_id", extra={"user_id": user_id})
                      continue
 
                 new_msg = {
@@ -104,20 +100,18 @@ async def websocket_endpoint(
                     "created_at": start_time.isoformat()
                 }
 
-                logger.debug(f"DEBUG: Attempting to insert msg: {new_msg}")
-
                 # Save to Supabase
                 try:
-                    db_res = supabase.from_("messages").insert(new_msg).execute()
-                    logger.debug(f"DEBUG: Insert result: {db_res}")
+                    db_res = await db.from_("messages").insert(new_msg).execute()
                 except Exception as db_err:
-                    logger.debug(f"DEBUG: Database insert error: {db_err}")
+                    logger.error(f"Chat message insert failed: {db_err}")
                     # If table doesn't exist or policy fails
                     continue
                 
                 if db_res.data:
                     saved_msg = db_res.data[0]
-                    logger.debug(f"DEBUG: Message saved, broadcasting to {recipient_id}")
+                    invalidate_dashboard(auth_user_id=recipient_id)
+                    event_logger.debug("Chat message saved", extra={"sender_id": user_id, "recipient_id": recipient_id})
                     
                     # 2. Forward to Recipient
                     await manager.send_personal_message({
@@ -131,16 +125,16 @@ async def websocket_endpoint(
                         "message": saved_msg
                     }, user_id)
                 else:
-                    logger.debug("DEBUG: No data returned from insert")
+                    logger.error("Chat message insert returned no data")
 
         except WebSocketDisconnect:
             manager.disconnect(user_id, websocket)
         except Exception as e:
-            logger.debug(f"Error in chat loop: {e}")
+            logger.error(f"Error in chat loop: {e}")
             manager.disconnect(user_id, websocket)
             
     except Exception as e:
-        logger.debug(f"Chat Auth Error: {e}")
+        logger.warning(f"Chat auth error: {e}")
         await websocket.close(code=1008, reason="Authentication failed")
 
 @router.get("/chat/history/{other_user_id}")
@@ -148,7 +142,7 @@ async def get_chat_history(other_user_id: str, token: str = Query(...)):
     """
     Fetch chat history between current user and other_user_id
     """
-    user = supabase.auth.get_user(token)
+    user = await db.get_user(token)
     if not user or not user.user:
         raise HTTPException(status_code=401, detail="Unauthorized")
     
@@ -160,14 +154,14 @@ async def get_chat_history(other_user_id: str, token: str = Query(...)):
     
     try:
         # Fetch sent messages
-        sent_res = supabase.from_("messages")\
+        sent_res = await db.from_("messages")\
             .select("*")\
             .eq("sender_id", current_user_id)\
             .eq("recipient_id", other_user_id)\
             .execute()
             
         # Fetch received messages
-        received_res = supabase.from_("messages")\
+        received_res = await db.from_("messages")\
             .select("*")\
             .eq("sender_id", other_user_id)\
             .eq("recipient_id", current_user_id)\
@@ -179,7 +173,7 @@ async def get_chat_history(other_user_id: str, token: str = Query(...)):
         
         return all_messages
     except Exception as e:
-        logger.debug(f"Error fetching history: {e}")
+        logger.error(f"Error fetching chat history: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch chat history")
 
 @router.post("/chat/upload")
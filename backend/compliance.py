@@ -0,0 +1,164 @@
+from datetime import date, datetime
+from typing import Optional, Iterable
+from database import supabase
+from cache import TTLCache
+from replicas import primary_reads
+
+WEEKDAY_NAMES = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+# Frequencies prescribed as "N times a week" rather than on fixed dates
+WEEKLY_QUOTAS = {"weekly": 1, "twice_weekly": 2}
+
+# Per-patient compliance, keyed by "<patient_id>:<weeks>:<today>"
+compliance_cache = TTLCache(ttl_seconds=600)
+
+def invalidate_compliance(patient_id: str):
+    compliance_cache.invalidate_prefix(f"{patient_id}:")
+
+def _ordinal(value) -> Optional[int]:
+    if not value:
+        return None
+    return date.fromisoformat(str(value)[:10]).toordinal()
+
+def _week_start(ordinal: int) -> int:
+    # date.fromordinal(1) is a Monday, so weeks start on Monday
+    return ordinal - (ordinal - 1) % 7
+
+def expected_dates(assignment: dict, lo: int, hi: int) -> Optional[Iterable[int]]:
+    """
+    Ordinals on which an assignment is due within [lo, hi], built from stride
+    ranges rather than walking day by day. Returns None for weekly-quota
+    frequencies, which are matched per week instead of per date.
+    """
+    frequency = (assignment.get("frequency") or "daily").lower()
+    if frequency in WEEKLY_QUOTAS:
+        return None
+    anchor = _ordinal(assignment.get("start_date")) or _ordinal(assignment.get("assigned_at")) or lo
+    start = max(anchor, lo)
+    end = min(_ordinal(assignment.get("end_date")) or hi, hi)
+    if start > end:
+        return []
+
+    if frequency == "every_other_day":
+        first = start + (anchor - start) % 2
+        return range(first, end + 1, 2)
+    if frequency == "specific_days":
+        weekdays = {WEEKDAY_NAMES.index(d.lower()) for d in assignment.get("selected_days") or [] if d.lower() in WEEKDAY_NAMES}
+        ranges = []
+        for weekday in weekdays:
+            first = start + (weekday - (start - 1) % 7) % 7
+            ranges.append(range(first, end + 1, 7))
+        return [o for r in ranges for o in r]
+    return range(start, end + 1)
+
+def compute_compliance(assignments: list[dict], sessions: list[dict], today: date, weeks: int) -> dict[str, dict]:
+    """
+    Match prescribed occurrences against completed sessions for any number of
+    patients at once. Returns patient_id -> weekly and overall compliance over
+    the last `weeks` weeks (current week included, future days excluded).
+    """
+    hi = today.toordinal()
+    lo = _week_start(hi) - 7 * (weeks - 1)
+
+    # (patient_id, exercise_id) -> set of ordinals with a completed session
+    done: dict[tuple[str, str], set[int]] = {}
+    for s in sessions:
+        if s.get("status") != "completed":
+            continue
+        day = _ordinal(s.get("completed_at") or s.get("created_at"))
+        if day is not None and lo <= day <= hi:
+            done.setdefault((s["patient_id"], s["exercise_id"]), set()).add(day)
+
+    # patient_id -> week_start -> [expected, completed]
+    buckets: dict[str, dict[int, list[int]]] = {}
+    for a in assignments:
+        patient_weeks = buckets.setdefault(a["patient_id"], {})
+        completed_days = done.get((a["patient_id"], a["exercise_id"]), set())
+        due = expected_dates(a, lo, hi)
+
+        if due is None:
+            quota = WEEKLY_QUOTAS[(a.get("frequency") or "").lower()]
+            start = max(_ordinal(a.get("start_date")) or _ordinal(a.get("assigned_at")) or lo, lo)
+            end = min(_ordinal(a.get("end_date")) or hi, hi)
+            for week in range(_week_start(start), end + 1, 7):
+                days_in_range = min(week + 6, end) - max(week, start) + 1
+                expected = min(quota, days_in_range)
+                if expected <= 0:
+                    continue
+                hits = sum(1 for d in completed_days if week <= d <= week + 6)
+                bucket = patient_weeks.setdefault(week, [0, 0])
+                bucket[0] += expected
+                bucket[1] += min(hits, expected)
+            continue
+
+        for day in due:
+            bucket = patient_weeks.setdefault(_week_start(day), [0, 0])
+            bucket[0] += 1
+            if day in completed_days:
+                bucket[1] += 1
+
+    results = {}
+    for patient_id, patient_weeks in buckets.items():
+        expected_total = sum(b[0] for b in patient_weeks.values())
+        completed_total = sum(b[1] for b in patient_weeks.values())
+        results[patient_id] = {
+            "patient_id": patient_id,
+            "expected": expected_total,
+            "completed": completed_total,
+            "compliance": round(completed_total / expected_total * 100) if expected_total else None,
+            "weeks": [{
+                "week_start": date.fromordinal(week).isoformat(),
+                "expected": b[0],
+                "completed": b[1],
+                "compliance": round(b[1] / b[0] * 100) if b[0] else None
+            } for week, b in sorted(patient_weeks.items())]
+        }
+    return results
+
+def _empty(patient_id: str) -> dict:
+    return {"patient_id": patient_id, "expected": 0, "completed": 0, "compliance": None, "weeks": []}
+
+def compliance_window_start(weeks: int) -> str:
+    """First date (a Monday) covered by a `weeks`-week compliance window."""
+    today = datetime.utcnow().date()
+    return date.fromordinal(_week_start(today.toordinal()) - 7 * (weeks - 1)).isoformat()
+
+@primary_reads()
+def caseload_compliance(patient_ids: list[str], weeks: int = 4, sessions: Optional[list[dict]] = None) -> dict[str, dict]:
+    """
+    Compliance for many patients in one bulk computation: one assignments query
+    and (unless the caller already has them) one sessions query for all
+    uncached patients together. Cached patients cost nothing.
+    """
+    today = datetime.utcnow().date()
+    results: dict[str, dict] = {}
+    missing = []
+    for pid in patient_ids:
+        cached = compliance_cache.get(f"{pid}:{weeks}:{today}")
+        if cached is not None:
+            results[pid] = cached
+        else:
+            missing.append(pid)
+    if not missing:
+        return results
+
+    since = compliance_window_start(weeks)
+    assignments_res = supabase.from_("assigned_exercises")\
+        .select("patient_id, exercise_id, frequency, selected_days, start_date, end_date, assigned_at")\
+        .in_("patient_id", missing)\
+        .eq("status", "active")\
+        .execute()
+    if sessions is None:
+        sessions_res = supabase.from_("exercise_sessions")\
+            .select("patient_id, exercise_id, status, created_at, completed_at")\
+            .in_("patient_id", missing)\
+            .eq("status", "completed")\
+            .gte("created_at", since)\
+            .execute()
+        sessions = sessions_res.data or []
+
+    computed = compute_compliance(assignments_res.data or [], sessions, today, weeks)
+    for pid in missing:
+        result = computed.get(pid) or _empty(pid)
+        compliance_cache.set(f"{pid}:{weeks}:{today}", result)
+        results[pid] = result
+    return results
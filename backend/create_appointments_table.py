@@ -1,58 +0,0 @@
-
-import os
-import asyncio
-from database import supabase
-
-async def create_appointments_table():
-    print("Creating appointments table...")
-    
-    sql = """
-    CREATE TABLE IF NOT EXISTS appointments (
-      id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
-      patient_id UUID NOT NULL REFERENCES patients(id) ON DELETE CASCADE,
-      doctor_id UUID NOT NULL REFERENCES doctors(id) ON DELETE CASCADE,
-      appointment_mode TEXT CHECK (appointment_mode IN ('virtual', 'in_clinic')) NOT NULL,
-      appointment_date DATE NOT NULL,
-      start_time TIME NOT NULL,
-      end_time TIME NOT NULL,
-      google_event_id TEXT,
-      google_meet_link TEXT,
-      status TEXT DEFAULT 'scheduled' CHECK (status IN ('scheduled', 'completed', 'cancelled')),
-      notes TEXT,
-      created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
-      updated_at TIMESTAMP WITH TIME ZONE DEFAULT now()
-    );
-
-    CREATE INDEX IF NOT EXISTS idx_appointments_patient ON appointments(patient_id);
-    CREATE INDEX IF NOT EXISTS idx_appointments_doctor ON appointments(doctor_id);
-    CREATE INDEX IF NOT EXISTS idx_appointments_date ON appointments(appointment_date);
-    """
-    
-    try:
-        # Supabase-py doesn't support raw SQL easily without RPC or specific setup, 
-        # but the project seems to use postgrest-py (via supabase-py).
-        # Often user has a 'rpc' function to run sql, or we might need to use a different approach.
-        # Checking `database.py` usage in previous turns... 
-        # Wait, usually for Supabase direct SQL via client is not direct unless via rpc.
-        # But let's check if there is an rpc 'exec_sql' or similar, or I might need to use `psycopg2` if I had the connection string.
-        # However, the user provided `database.py` which just exports `supabase`.
-        # I will try to use a direct SQL execution via a hypothetical RPC if it exists, OR better:
-        # Since I cannot easily run raw SQL via the JS/Python client without an RPC, 
-        # I should check if there is a 'exec' or 'query' method or if I can use the Rest interface.
-        # Actually, standard supabase client doesn't do raw SQL.
-        
-        # Let's check if there are other scripts doing this.
-        # I saw `schema.sql`. Maybe I can't run it from here easily without the dashboard.
-        # BUT, the request said: "Create a new table called: appointments".
-        # If I can't run SQL, I might have to ask the user or assume it's done? 
-        # No, I should try to find a way.
-        
-        # Let's look at `database.py` again.
-        pass
-    except Exception as e:
-        print(f"Error: {e}")
-
-# Re-reading: The user provided a SQL block. 
-# "Create a new table called: appointments" 
-# If I can't run it, I will simulate it or try to use a standard migration pattern if one exists.
-# Let's look at `check_patients_db.py` to see how they interact.
@@ -0,0 +1,229 @@
+import asyncio
+import threading
+from datetime import datetime, date, timedelta
+from typing import Optional
+from database import supabase
+from async_db import db
+from compliance import expected_dates, WEEKLY_QUOTAS
+from replicas import primary_reads
+import logging
+
+logger = logging.getLogger(__name__)
+
+def _today() -> date:
+    return datetime.utcnow().date()
+
+def _session_day(session: dict) -> Optional[date]:
+    value = session.get("completed_at") or session.get("created_at")
+    return date.fromisoformat(str(value)[:10]) if value else None
+
+# Days of history behind the streak counter
+STREAK_LOOKBACK_DAYS = 90
+
+def _streak(active_days: set[date], day: date) -> int:
+    """Consecutive days with a completed session, ending today or yesterday."""
+    current = day if day in active_days else day - timedelta(days=1)
+    streak = 0
+    while current in active_days:
+        streak += 1
+        current -= timedelta(days=1)
+    return streak
+
+def _is_due(assignment: dict, day: date, done_this_week: int) -> bool:
+    due = expected_dates(assignment, day.toordinal(), day.toordinal())
+    if due is None:
+        # Weekly quota: due until this week's sessions are in
+        start, end = assignment.get("start_date"), assignment.get("end_date")
+        if (start and str(start)[:10] > day.isoformat()) or (end and str(end)[:10] < day.isoformat()):
+            return False
+        return done_this_week < WEEKLY_QUOTAS[(assignment.get("frequency") or "").lower()]
+    return len(due) > 0
+
+class DailyPlanStore:
+    """
+    Per-patient plan for the current UTC day: due exercises with their
+    completion state and the next appointment.
+
+    Plans are built in bulk (one query per table for any number of patients)
+    when the day rolls over, and patched in place by session writes.
+    Assignment and appointment writes drop the plan so the next read rebuilds it.
+    """
+    def __init__(self):
+        self._day: date = _today()
+        self._plans: dict[str, dict] = {}
+        self._carried_over: list[str] = []
+        self._generations: dict[str, int] = {}
+        # patient auth_user_id -> patient_id, so reads skip the patients lookup
+        self._patient_ids: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def patient_id_for(self, auth_user_id: str) -> Optional[str]:
+        patient_id = self._patient_ids.get(auth_user_id)
+        if patient_id:
+            return patient_id
+        res = supabase.from_("patients").select("id").eq("auth_user_id", auth_user_id).limit(1).execute()
+        if not res.data:
+            return None
+        self._patient_ids[auth_user_id] = res.data[0]["id"]
+        return res.data[0]["id"]
+
+    @primary_reads()
+    def _build(self, patient_ids: list[str], day: date) -> dict[str, dict]:
+        week_start = day - timedelta(days=day.weekday())
+        assignments_res = supabase.from_("assigned_exercises")\
+            .select("*, exercises(*)")\
+            .in_("patient_id", patient_ids)\
+            .eq("status", "active")\
+            .execute()
+        sessions_res = supabase.from_("exercise_sessions")\
+            .select("patient_id, exercise_id, status, created_at, completed_at")\
+            .in_("patient_id", patient_ids)\
+            .in_("status", ["completed", "in_progress"])\
+            .gte("created_at", min(week_start, day - timedelta(days=STREAK_LOOKBACK_DAYS)).isoformat())\
+            .execute()
+        appts_res = supabase.from_("appointments")\
+            .select("id, patient_id, appointment_date, start_time, end_time, appointment_mode, google_meet_link, status")\
+            .in_("patient_id", patient_ids)\
+            .eq("status", "scheduled")\
+            .gte("appointment_date", day.isoformat())\
+            .order("appointment_date")\
+            .order("start_time")\
+            .execute()
+
+        # (patient_id, exercise_id) -> [completed today, completed this week, in progress]
+        progress: dict[tuple[str, str], list] = {}
+        active_days: dict[str, set[date]] = {}
+        for s in sessions_res.data or []:
+            if s.get("status") == "in_progress":
+                if _session_day(s) == day:
+                    progress.setdefault((s["patient_id"], s["exercise_id"]), [0, 0, False])[2] = True
+                continue
+            completed_on = _session_day(s)
+            if completed_on:
+                active_days.setdefault(s["patient_id"], set()).add(completed_on)
+            if not completed_on or completed_on < week_start:
+                continue
+            entry = progress.setdefault((s["patient_id"], s["exercise_id"]), [0, 0, False])
+            if completed_on == day:
+                entry[0] += 1
+            entry[1] += 1
+
+        plans = {pid: {
+            "patient_id": pid,
+            "date": day.isoformat(),
+            "exercises": [],
+            "next_appointment": None,
+            "streak": _streak(active_days.get(pid, set()), day),
+            "active_today": day in active_days.get(pid, set())
+        } for pid in patient_ids}
+        for a in assignments_res.data or []:
+            today_count, week_count, in_progress = progress.get((a["patient_id"], a["exercise_id"]), [0, 0, False])
+            if not _is_due(a, day, week_count) and not today_count:
+                continue
+            plans[a["patient_id"]]["exercises"].append({
+                "assignment_id": a["id"],
+                "exercise_id": a["exercise_id"],
+                "exercise": a.get("exercises"),
+                "sets": a.get("sets"),
+                "reps": a.get("reps"),
+                "frequency": a.get("frequency"),
+                "notes": a.get("notes"),
+                "completed_sessions": today_count,
+                "completed": today_count > 0,
+                "in_progress": in_progress
+            })
+        for appt in appts_res.data or []:
+            plan = plans[appt["patient_id"]]
+            if plan["next_appointment"] is None:
+                plan["next_appointment"] = appt
+        return plans
+
+    def get(self, patient_id: str) -> dict:
+        self._check_rollover()
+        with self._lock:
+            plan = self._plans.get(patient_id)
+            day, generation = self._day, self._generations.get(patient_id, 0)
+        if plan is None:
+            plan = self._build([patient_id], day)[patient_id]
+            with self._lock:
+                # Don't keep a plan that a write invalidated while it was being built
+                if self._day == day and self._generations.get(patient_id, 0) == generation:
+                    self._plans[patient_id] = plan
+        with self._lock:
+            # Copy so session patches don't race the response serialization
+            return {**plan, "exercises": [dict(item) for item in plan["exercises"]]}
+
+    def invalidate(self, patient_id: str):
+        with self._lock:
+            self._plans.pop(patient_id, None)
+            self._generations[patient_id] = self._generations.get(patient_id, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            for patient_id in self._plans:
+                self._generations[patient_id] = self._generations.get(patient_id, 0) + 1
+            self._plans = {}
+
+    def record_session(self, patient_id: str, exercise_id: str, status: str):
+        """Patch a held plan after a session write instead of rebuilding it."""
+        with self._lock:
+            plan = self._plans.get(patient_id)
+            if plan is not None and status == "completed" and not plan["active_today"]:
+                plan["streak"] += 1
+                plan["active_today"] = True
+            if plan is None:
+                # A read may be building it right now from pre-write data
+                self._generations[patient_id] = self._generations.get(patient_id, 0) + 1
+                return
+            for item in plan["exercises"]:
+                if item["exercise_id"] != exercise_id:
+                    continue
+                item["in_progress"] = status == "in_progress"
+                if status == "completed":
+                    item["completed_sessions"] += 1
+                    item["completed"] = True
+                return
+        if status == "completed":
+            # Practising something not due today; rebuild so it shows up as done
+            self.invalidate(patient_id)
+
+    def _check_rollover(self):
+        if _today() != self._day:
+            with self._lock:
+                if _today() != self._day:
+                    self._day = _today()
+                    # Remembered so the scheduled rollover still precomputes them
+                    self._carried_over = list(self._plans.keys())
+                    self._plans = {}
+
+    def rollover(self):
+        """Rebuild yesterday's plans for the new day in one bulk pass."""
+        day = _today()
+        with self._lock:
+            patient_ids = list(self._plans.keys()) if day != self._day else self._carried_over
+            self._carried_over = []
+            patient_ids = [pid for pid in patient_ids if day != self._day or pid not in self._plans]
+        if not patient_ids:
+            self._check_rollover()
+            return
+        plans = self._build(patient_ids, day)
+        with self._lock:
+            if self._day != day:
+                self._day = day
+                self._plans = {}
+            for pid, plan in plans.items():
+                # Plans built by reads in the meantime are at least as fresh
+                self._plans.setdefault(pid, plan)
+
+    async def run_rollover(self):
+        """Background loop started with the app; rebuilds plans just after midnight UTC."""
+        while True:
+            now = datetime.utcnow()
+            next_day = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+            await asyncio.sleep((next_day - now).total_seconds() + 1)
+            try:
+                await db.run(self.rollover)
+            except Exception as e:
+                logger.error(f"Daily plan rollover failed: {e}")
+
+daily_plans = DailyPlanStore()
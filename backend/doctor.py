@@ -1,13 +1,30 @@
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, HTTPException, Request, Header
 from pydantic import BaseModel, EmailStr
 from typing import Optional, List
 from database import supabase
+from resilience import StaleCache, UpstreamUnavailable
+from analytics import analytics, run_from_thread
+from replicas import primary_reads
 from email_service import send_email
-from notifications import create_notification
+from notifications import create_notifications
+from live_sessions import live_sessions
+from daily_plan import daily_plans
+from compliance import caseload_compliance, compliance_window_start, invalidate_compliance
+from assignments import (
+    fetch_active_assignments, diff_assignments, apply_assignment_diff, changed_patient_ids, idempotency_cache
+)
+from cache import dashboard_cache, remember_patient_doctor, remember_doctor_auth, invalidate_dashboard, response_cache
+from datetime import datetime, timedelta
 import secrets
+import logging
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/doctor", tags=["Doctor"])
 
+# Last-known-good session histories, served while Supabase is failing
+history_cache = StaleCache("patient_history")
+
 class CreatePatientPayload(BaseModel):
     email: EmailStr
     full_name: str
@@ -34,6 +51,129 @@ class AssignExercisePayload(BaseModel):
     selected_days: Optional[List[str]] = []
     notes: Optional[str] = None
 
+class AssignmentItem(BaseModel):
+    patient_id: str
+    exercise_id: str
+    sets: int
+    reps: int
+    frequency: str
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+    selected_days: Optional[List[str]] = []
+    notes: Optional[str] = None
+
+class BulkAssignmentPayload(BaseModel):
+    # Patients whose active assignments are replaced by `assignments`
+    patient_ids: List[str]
+    assignments: List[AssignmentItem]
+
+# Weeks of prescription history behind compliance figures
+COMPLIANCE_WEEKS = 4
+
+@primary_reads()
+def build_dashboard(doctor_db_id: str, doctor_auth_id: str, active_days: int = 7) -> dict:
+    """
+    Aggregate everything the doctor dashboard shows in a fixed number of queries:
+    patients, recent sessions, today's appointments, unread messages and
+    assignments (for compliance). Live sessions are read from the WebSocket index on every call.
+    """
+    cache_key = f"{doctor_db_id}:{active_days}"
+    cached = dashboard_cache.get(cache_key)
+    if cached is not None:
+        # Live sessions come from the in-memory index and are never cached
+        return {**cached, "liveSessions": live_sessions.for_doctor(doctor_db_id)}
+    remember_doctor_auth(doctor_auth_id, doctor_db_id)
+
+    now = datetime.utcnow()
+    active_since = (now - timedelta(days=active_days)).isoformat()
+    # One sessions fetch covers both the activity window and the compliance window
+    since = min(active_since, compliance_window_start(COMPLIANCE_WEEKS))
+    today = now.date().isoformat()
+
+    # 1. Patient ids (no full rows needed)
+    patients_res = supabase.from_("patients")\
+        .select("id, full_name")\
+        .eq("doctor_id", doctor_db_id)\
+        .execute()
+    patients = patients_res.data or []
+    patient_names = {p["id"]: p.get("full_name") for p in patients}
+    for pid in patient_names:
+        remember_patient_doctor(pid, doctor_db_id)
+
+    # 2. Sessions in the activity/compliance window for those patients
+    sessions = []
+    if patient_names:
+        sessions_res = supabase.from_("exercise_sessions")\
+            .select("patient_id, exercise_id, status, created_at, completed_at")\
+            .in_("patient_id", list(patient_names.keys()))\
+            .gte("created_at", since)\
+            .execute()
+        sessions = sessions_res.data or []
+
+    # 3. Today's appointments
+    appts_res = supabase.from_("appointments")\
+        .select("id, patient_id, appointment_mode, start_time, end_time, status, google_meet_link, patients(full_name)")\
+        .eq("doctor_id", doctor_db_id)\
+        .eq("appointment_date", today)\
+        .order("start_time")\
+        .execute()
+
+    # 4. Unread messages (count only)
+    unread_res = supabase.from_("messages")\
+        .select("id", count="exact")\
+        .eq("recipient_id", doctor_auth_id)\
+        .eq("is_read", False)\
+        .limit(1)\
+        .execute()
+
+    active_patients = {s["patient_id"] for s in sessions if s.get("created_at", "") >= active_since}
+
+    # 5. Prescription-based compliance for the whole caseload in one bulk pass
+    compliance = {"high": 0, "medium": 0, "low": 0, "none": 0}
+    if patient_names:
+        for result in caseload_compliance(list(patient_names.keys()), COMPLIANCE_WEEKS, sessions).values():
+            rate = result["compliance"]
+            if rate is None:
+                compliance["none"] += 1
+            elif rate >= 80:
+                compliance["high"] += 1
+            elif rate >= 50:
+                compliance["medium"] += 1
+            else:
+                compliance["low"] += 1
+
+    result = {
+        "totalPatients": len(patient_names),
+        "activePatients": len(active_patients),
+        "activeWindowDays": active_days,
+        "todayAppointments": appts_res.data or [],
+        "unreadMessages": unread_res.count or 0,
+        "compliance": compliance,
+        "generatedAt": now.isoformat()
+    }
+    dashboard_cache.set(cache_key, result)
+    return {**result, "liveSessions": live_sessions.for_doctor(doctor_db_id)}
+
+@router.get("/dashboard")
+def get_dashboard(request: Request, active_days: int = 7):
+    try:
+        doctor = request.state.user
+
+        # Verify doctor role
+        if doctor.user_metadata.get("role") != "doctor":
+            raise HTTPException(status_code=403, detail="Only doctors can view the dashboard")
+
+        doc_res = supabase.from_("doctors").select("id").eq("auth_user_id", doctor.id).execute()
+        if not doc_res.data or len(doc_res.data) == 0:
+            raise HTTPException(status_code=404, detail="Doctor profile not found")
+
+        return build_dashboard(doc_res.data[0]["id"], doctor.id, max(1, min(active_days, 90)))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching dashboard: {e}")
+        raise HTTPException(status_code=500, detail="Failed to fetch dashboard")
+
 @router.get("/dashboard/stats")
 def get_dashboard_stats(request: Request):
     try:
@@ -44,8 +184,10 @@ def get_dashboard_stats(request: Request):
             raise HTTPException(status_code=403, detail="Only doctors can view stats")
 
         # Get doctor's database ID
-        # Using execute() directly allows checking data length safely
-        doc_res = supabase.from_("doctors").select("id").eq("auth_user_id", doctor.id).execute()
+        # Using execute() directly allows checking data length safely.
+        # From the primary: a replica missing the row would make us insert a duplicate.
+        with primary_reads():
+            doc_res = supabase.from_("doctors").select("id").eq("auth_user_id", doctor.id).execute()
         
         if not doc_res.data or len(doc_res.data) == 0:
             # Try to auto-create if missing (failsafe)
@@ -60,21 +202,15 @@ def get_dashboard_stats(request: Request):
         else:
             doc_id = doc_res.data[0]["id"]
             
-        # Get patient counts
-        # We'll just count all patients for "total" and "active" for now
-        patients = supabase.from_("patients")\
-            .select("*", count="exact")\
-            .eq("doctor_id", doc_id)\
-            .execute()
-            
-        count = patients.count if patients.count is not None else 0
+        # Served from the consolidated (cached) dashboard aggregate
+        dashboard = build_dashboard(doc_id, doctor.id)
         
         return {
-            "activePatients": count,
-            "totalPatients": count
+            "activePatients": dashboard["activePatients"],
+            "totalPatients": dashboard["totalPatients"]
         }
     except Exception as e:
-        print(f"Error fetching stats: {e}")
+        logger.error(f"Error fetching stats: {e}")
         return {"activePatients": 0, "totalPatients": 0}
 
 @router.post("/create_patient")
@@ -92,14 +228,14 @@ def create_patient(payload: CreatePatientPayload, request: Request):
         if not doctor_res.data or len(doctor_res.data) == 0:
             # Auto-create failsafe
             try:
-                print(f"Doctor profile missing for {doctor.id}, attempting auto-create...")
+                logger.warning(f"Doctor profile missing for {doctor.id}, attempting auto-create...")
                 new_doc = supabase.from_("doctors").insert({"auth_user_id": doctor.id}).execute()
                 if new_doc.data:
                     doctor_db_id = new_doc.data[0]["id"]
                 else:
                      raise HTTPException(status_code=404, detail="Doctor profile not found and could not be created")
             except Exception as e:
-                print(f"Auto-create failed: {e}")
+                logger.error(f"Auto-create failed: {e}")
                 raise HTTPException(status_code=404, detail="Doctor profile not found")
         else:
             doctor_db_id = doctor_res.data[0]["id"]
@@ -127,7 +263,7 @@ def create_patient(payload: CreatePatientPayload, request: Request):
                 }
             })
         except Exception as e:
-            print(f"Error creating auth user: {e}")
+            logger.error(f"Error creating auth user: {e}")
             raise HTTPException(status_code=400, detail="Failed to create user account. Email may already be in use.")
 
         if not auth_res or not auth_res.user:
@@ -153,22 +289,23 @@ def create_patient(payload: CreatePatientPayload, request: Request):
         }
 
         try:
-            print(f"Inserting into patients table: {patient_data}")
+            logger.debug("Inserting patient record", extra={"doctor_id": doctor_db_id})
             patient_res = supabase.from_("patients").insert(patient_data).execute()
             
             if not patient_res.data:
-                print("Insert returned no data")
+                logger.error("Patient insert returned no data")
                 raise Exception("Failed to insert patient record - no data returned")
                 
-            print(f"Patient inserted successfully: {patient_res.data}")    
+            logger.info("Patient created", extra={"patient_id": patient_res.data[0]["id"]})
+            invalidate_dashboard(doctor_id=doctor_db_id)
         except Exception as e:
             # Rollback: delete the auth user
             try:
                 # Note: You'll need admin privileges or service role to delete users
-                print(f"Rolling back: Failed to create patient - {e}")
+                logger.error(f"Rolling back: Failed to create patient - {e}")
             except:
                 pass
-            print(f"Error inserting patient: {e}")
+            logger.error(f"Error inserting patient: {e}")
             raise HTTPException(status_code=500, detail="Failed to create patient record")
 
         # 3. Send email (if enabled)
@@ -194,7 +331,7 @@ PhysioCheck Team
 """
                 )
             except Exception as e:
-                print(f"Warning: Failed to send email: {e}")
+                logger.warning(f"Failed to send email: {e}")
                 # Don't fail the entire operation if email fails
 
         return {
@@ -206,9 +343,7 @@ PhysioCheck Team
     except HTTPException:
         raise
     except Exception as e:
-        import traceback
-        print(f"Create patient failed: {e}")
-        traceback.print_exc()
+        logger.exception(f"Create patient failed: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to create patient: {str(e)}")
 
 @router.get("/patients")
@@ -236,9 +371,14 @@ def list_patients(request: Request):
             .execute()
         
         patient_list = patients.data or []
+        # One GROUP BY query when a direct database connection is configured
+        db_stats = run_from_thread(analytics.patient_list_stats, [p["id"] for p in patient_list]) if patient_list else None
         
         # Enrich with stats
         for p in patient_list:
+             if db_stats is not None:
+                 p.update(db_stats.get(p["id"]) or {"last_session_at": None, "total_duration": 0, "assigned_exercises_count": 0})
+                 continue
              try:
                  # Last Session
                  last_session_res = supabase.from_("exercise_sessions")\
@@ -264,24 +404,32 @@ def list_patients(request: Request):
                  assigned_res = supabase.from_("assigned_exercises")\
                      .select("id", count="exact")\
                      .eq("patient_id", p["id"])\
+                     .eq("status", "active")\
                      .execute()
                  p["assigned_exercises_count"] = assigned_res.count or 0
                  
-                 # Compliance (rough calc from stats endpoint logic)
-                 # Keeping it simple for list view
-                 p["compliance"] = 0 # Placeholder or fetch if needed
              except Exception:
                  p["last_session_at"] = None
                  p["assigned_exercises_count"] = 0
 
+        # Compliance for the whole list in one bulk computation
+        try:
+            compliance = caseload_compliance([p["id"] for p in patient_list], COMPLIANCE_WEEKS)
+            for p in patient_list:
+                p["compliance"] = compliance.get(p["id"], {}).get("compliance") or 0
+        except Exception as e:
+            logger.error(f"Error computing compliance: {e}")
+            for p in patient_list:
+                p["compliance"] = 0
+
         return patient_list
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error fetching patients: {e}")
+        logger.error(f"Error fetching patients: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch patients")
 
-        print(f"Error fetching patient: {e}")
+        logger.error(f"Error fetching patient: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch patient details")
 
 @router.get("/patients/{patient_id}/stats")
@@ -293,6 +441,18 @@ def get_patient_stats(patient_id: str, request: Request):
         if doctor.user_metadata.get("role") != "doctor":
              raise HTTPException(status_code=403, detail="Only doctors can view stats")
 
+        db_stats = run_from_thread(analytics.patient_stats, patient_id)
+        if db_stats is not None:
+            compliance = caseload_compliance([patient_id], COMPLIANCE_WEEKS)[patient_id]["compliance"] or 0
+            return {
+                "totalSessions": db_stats["total_sessions"],
+                "avgAccuracy": db_stats["avg_accuracy"],
+                "totalDuration": round(db_stats["total_duration"] / 60),
+                "compliance": compliance,
+                "lastSession": db_stats["last_session"],
+                "nextAppointment": None
+            }
+
         # Get sessions
         sessions_res = supabase.from_("exercise_sessions")\
             .select("*")\
@@ -305,11 +465,8 @@ def get_patient_stats(patient_id: str, request: Request):
         
         # Calculate totals
         total_duration = sum([int(s.get("duration_seconds") or 0) for s in sessions])
-        completed_sessions = [s for s in sessions if s.get("status") == "completed"]
-        
-        # Compliance logic (simplified): completed vs total started or just a placeholder logic if we don't track adherence strictly yet.
-        # Let's say compliance is % of sessions that are marked completed vs total sessions attempted
-        compliance = round((len(completed_sessions) / total_sessions * 100) if total_sessions > 0 else 0)
+        # Compliance: prescribed occurrences matched against completed sessions
+        compliance = caseload_compliance([patient_id], COMPLIANCE_WEEKS, sessions)[patient_id]["compliance"] or 0
 
         # Accuracy average
         accuracies = []
@@ -334,7 +491,7 @@ def get_patient_stats(patient_id: str, request: Request):
             "nextAppointment": None # Future feature
         }
     except Exception as e:
-        print(f"Error fetching stats for {patient_id}: {e}")
+        logger.error(f"Error fetching stats for {patient_id}: {e}")
         return {
             "totalSessions": 0,
             "avgAccuracy": 0,
@@ -344,6 +501,43 @@ def get_patient_stats(patient_id: str, request: Request):
             "nextAppointment": None
         }
 
+@router.get("/compliance")
+def get_caseload_compliance(request: Request, weeks: int = COMPLIANCE_WEEKS):
+    try:
+        doctor = request.state.user
+        if doctor.user_metadata.get("role") != "doctor":
+            raise HTTPException(status_code=403, detail="Only doctors can view compliance")
+
+        doctor_res = supabase.from_("doctors").select("id").eq("auth_user_id", doctor.id).execute()
+        if not doctor_res.data or len(doctor_res.data) == 0:
+            return []
+
+        patients_res = supabase.from_("patients").select("id").eq("doctor_id", doctor_res.data[0]["id"]).execute()
+        patient_ids = [p["id"] for p in (patients_res.data or [])]
+        if not patient_ids:
+            return []
+
+        return list(caseload_compliance(patient_ids, max(1, min(weeks, 26))).values())
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching compliance: {e}")
+        raise HTTPException(status_code=500, detail="Failed to fetch compliance")
+
+@router.get("/patients/{patient_id}/compliance")
+def get_patient_compliance(patient_id: str, request: Request, weeks: int = COMPLIANCE_WEEKS):
+    try:
+        doctor = request.state.user
+        if doctor.user_metadata.get("role") != "doctor":
+            raise HTTPException(status_code=403, detail="Only doctors can view compliance")
+
+        return caseload_compliance([patient_id], max(1, min(weeks, 26)))[patient_id]
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching compliance for {patient_id}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to fetch compliance")
+
 @router.get("/patients/{patient_id}/history")
 def get_patient_history(patient_id: str, request: Request):
     try:
@@ -351,37 +545,52 @@ def get_patient_history(patient_id: str, request: Request):
         if doctor.user_metadata.get("role") != "doctor":
              raise HTTPException(status_code=403, detail="Only doctors can view history")
 
-        sessions = supabase.from_("exercise_sessions")\
-            .select("*, exercises(*)")\
-            .eq("patient_id", patient_id)\
-            .order("created_at", desc=True)\
-            .execute()
-            
-        return sessions.data or []
+        def fetch():
+            sessions = supabase.from_("exercise_sessions")\
+                .select("*, exercises(*)")\
+                .eq("patient_id", patient_id)\
+                .order("created_at", desc=True)\
+                .execute()
+            return sessions.data or []
+        return history_cache.read(patient_id, fetch, "exercise_sessions")
+    except UpstreamUnavailable:
+        raise HTTPException(status_code=503, detail="Session history temporarily unavailable")
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error fetching history: {e}")
+        logger.error(f"Error fetching history: {e}")
         return []
 
 @router.get("/patients/{patient_id}/exercises")
+@primary_reads()
 def get_patient_exercises(patient_id: str, request: Request):
     try:
         doctor = request.state.user
         if doctor.user_metadata.get("role") != "doctor":
             raise HTTPException(status_code=403, detail="Only doctors can view patient exercises")
 
+        cache_key = f"patient_exercises:{patient_id}"
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
         # Get exercises assigned to this patient
         exercises = supabase.from_("assigned_exercises")\
             .select("*, exercises(*)")\
             .eq("patient_id", patient_id)\
+            .eq("status", "active")\
             .order("assigned_at", desc=True)\
             .execute()
         
+        response_cache.set(cache_key, exercises.data or [], tags=[f"patient:{patient_id}"] +
+                           [f"exercise:{ex['exercise_id']}" for ex in exercises.data or [] if ex.get("exercise_id")])
         return exercises.data or []
     except Exception as e:
-        print(f"Error fetching patient exercises: {e}")
+        logger.error(f"Error fetching patient exercises: {e}")
         return []
 
 @router.get("/patients/{patient_id}")
+@primary_reads()
 def get_patient(patient_id: str, request: Request):
     try:
         doctor = request.state.user
@@ -389,6 +598,11 @@ def get_patient(patient_id: str, request: Request):
         # Verify doctor role
         if doctor.user_metadata.get("role") != "doctor":
             raise HTTPException(status_code=403, detail="Only doctors can view patient details")
+
+        cache_key = f"doctor_patient:{doctor.id}:{patient_id}"
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return cached
         
         # Get doctor's database ID
         doctor_res = supabase.from_("doctors").select("id").eq("auth_user_id", doctor.id).execute()
@@ -408,11 +622,12 @@ def get_patient(patient_id: str, request: Request):
         if not patient_res.data or len(patient_res.data) == 0:
             raise HTTPException(status_code=404, detail="Patient not found")
         
+        response_cache.set(cache_key, patient_res.data[0], tags=[f"patient:{patient_id}", f"doctor:{doctor_db_id}"])
         return patient_res.data[0]
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error fetching patient: {e}")
+        logger.error(f"Error fetching patient: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch patient details")
 
 @router.get("/sessions/active")
@@ -430,57 +645,26 @@ def get_active_sessions(request: Request):
         if not doctor_res.data or len(doctor_res.data) == 0:
             return []
             
-        # 2. Get sessions (FOR DEMO: showing ALL sessions regardless of doctor assignment)
-        # Manual fetch strategy to avoid join crashes
-        sessions_res = supabase.from_("exercise_sessions")\
-            .select("*")\
-            .eq("status", "in_progress")\
-            .order("created_at", desc=True)\
-            .limit(20)\
-            .execute()
-            
-        sessions = sessions_res.data or []
-        
-        if not sessions:
-            return []
-            
-        # Collect IDs
-        patient_ids = list(set([s["patient_id"] for s in sessions if s.get("patient_id")]))
-        exercise_ids = list(set([s["exercise_id"] for s in sessions if s.get("exercise_id")]))
-        
-        # Fetch related data
-        patients_map = {}
-        if patient_ids:
-            p_res = supabase.from_("patients").select("id, full_name").in_("id", patient_ids).execute()
-            if p_res.data:
-                patients_map = {p["id"]: p for p in p_res.data}
-                
-        exercises_map = {}
-        if exercise_ids:
-            # Column is 'name' not 'title' based on exercises.py
-            e_res = supabase.from_("exercises").select("id, name").in_("id", exercise_ids).execute()
-            if e_res.data:
-                exercises_map = {e["id"]: e for e in e_res.data}
-        
-        # Merge data
-        enriched_sessions = []
-        for s in sessions:
-            s["patients"] = patients_map.get(s["patient_id"], {"full_name": "Unknown"})
-            # Mapping 'name' to 'title' for frontend compatibility if frontend expects title,
-            # OR just pass 'name' and update frontend.
-            # Frontend doctor/sessions/page.tsx: exerciseName: item.exercises?.title || ...
-            # I should provide 'title' key locally or update frontend.
-            # Let's map it here to keep frontend happy.
-            ex_data = exercises_map.get(s["exercise_id"], {"name": "Unknown"})
-            s["exercises"] = {"title": ex_data.get("name", "Unknown")} 
-            enriched_sessions.append(s)
-            
-        return enriched_sessions
+        # Sessions come from the live WebSocket index, which only holds this
+        # doctor's own patients - no exercise_sessions scan needed.
+        live = live_sessions.for_doctor(doctor_res.data[0]["id"])
+        
+        # Keep the exercise_sessions row shape the frontend already consumes
+        return [{
+            "id": entry["session_id"],
+            "patient_id": entry["patient_id"],
+            "exercise_id": entry.get("exercise_id"),
+            "status": "in_progress",
+            "created_at": entry.get("started_at"),
+            "metrics": entry.get("metrics") or {},
+            "patients": {"full_name": entry.get("patient_name") or "Unknown"},
+            "exercises": {"title": entry.get("exercise_name") or "Unknown"}
+        } for entry in sorted(live, key=lambda e: e.get("started_at") or "", reverse=True)]
         
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error fetching active sessions: {e}")
+        logger.error(f"Error fetching active sessions: {e}")
         return []
 
 @router.get("/sessions/history")
@@ -500,6 +684,10 @@ def get_session_history(request: Request):
             
         doctor_db_id = doctor_res.data[0]["id"]
 
+        history = run_from_thread(analytics.session_history, doctor_db_id, 50)
+        if history is not None:
+            return history
+
         # 1. Get patients IDs for this doctor
         patients_res = supabase.from_("patients").select("id").eq("doctor_id", doctor_db_id).execute()
         patient_ids = [p["id"] for p in (patients_res.data or [])]
@@ -551,14 +739,36 @@ def get_session_history(request: Request):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error fetching session history: {e}")
+        logger.error(f"Error fetching session history: {e}")
         return []
     except Exception as e:
-        import traceback
-        print(f"Error checking active sessions: {e}")
-        traceback.print_exc()
+        logger.exception(f"Error checking active sessions: {e}")
         return []
 
+def _notify_assigned(patient_ids: set[str]):
+    """One notification per patient whose prescription actually changed."""
+    if not patient_ids:
+        return
+    try:
+        # We need auth_user_ids for notifications table policy
+        p_res = supabase.from_("patients").select("id, auth_user_id").in_("id", list(patient_ids)).execute()
+        create_notifications([{
+            "user_id": p["auth_user_id"],
+            "title": "New Exercise Assigned",
+            "message": "Your therapist has assigned you new exercises.",
+            "type": "info"
+        } for p in p_res.data or [] if p.get("auth_user_id")])
+    except Exception as e:
+        logger.error(f"Failed to notify patients: {e}")
+
+def _after_assignment_change(patient_ids: set[str]):
+    for pid in patient_ids:
+        invalidate_dashboard(patient_id=pid)
+        invalidate_compliance(pid)
+        daily_plans.invalidate(pid)
+        response_cache.invalidate(f"patient:{pid}")
+    _notify_assigned(patient_ids)
+
 @router.post("/assignments")
 def assign_exercise(payload: AssignExercisePayload, request: Request):
     try:
@@ -566,44 +776,88 @@ def assign_exercise(payload: AssignExercisePayload, request: Request):
         if doctor.user_metadata.get("role") != "doctor":
             raise HTTPException(status_code=403, detail="Only doctors can assign exercises")
 
-        # Prepare records for insertion
-        records = []
-        for pid in payload.patient_ids:
-            records.append({
-                "patient_id": pid,
-                "exercise_id": payload.exercise_id,
-                "sets": payload.sets,
-                "reps": payload.reps,
-                "frequency": payload.frequency,
-                "start_date": payload.start_date,
-                "end_date": payload.end_date,
-                "selected_days": payload.selected_days,
-                "notes": payload.notes
-            })
-            
-        if not records:
+        if not payload.patient_ids:
              raise HTTPException(status_code=400, detail="No patients selected")
 
-        # Bulk insert
-        res = supabase.from_("assigned_exercises").insert(records).execute()
-        
-        # Notify Patients
-        try:
-            # We need auth_user_ids for notifications table policy
-            p_res = supabase.from_("patients").select("id, auth_user_id").in_("id", payload.patient_ids).execute()
-            if p_res.data:
-                for p in p_res.data:
-                    create_notification(
-                        user_id=p["auth_user_id"], 
-                        title="New Exercise Assigned",
-                        message="Your therapist has assigned you new exercises.",
-                        type="info"
-                    )
-        except Exception as e:
-            print(f"Failed to notify patients: {e}")
-        
-        return {"status": "success", "message": f"Assigned to {len(records)} patients"}
+        records = [{
+            "patient_id": pid,
+            "exercise_id": payload.exercise_id,
+            "sets": payload.sets,
+            "reps": payload.reps,
+            "frequency": payload.frequency,
+            "start_date": payload.start_date,
+            "end_date": payload.end_date,
+            "selected_days": payload.selected_days,
+            "notes": payload.notes
+        } for pid in payload.patient_ids]
+
+        # Reassigning updates the existing prescription instead of duplicating it;
+        # other exercises of these patients are left alone.
+        existing = fetch_active_assignments(payload.patient_ids, [payload.exercise_id])
+        diff = diff_assignments(records, existing, archive_missing=False)
+        summary = apply_assignment_diff(diff)
+        _after_assignment_change(changed_patient_ids(diff))
+
+        return {"status": "success", "message": f"Assigned to {len(records)} patients", "summary": summary}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error assigning exercises: {e}")
+        raise HTTPException(status_code=500, detail="Failed to assign exercises")
+
+@router.put("/assignments")
+def bulk_update_assignments(payload: BulkAssignmentPayload, request: Request,
+                            idempotency_key: Optional[str] = Header(None)):
+    """
+    Replace the active assignments of `patient_ids` with `assignments`.
+    Identical rows are left untouched, changed rows are updated, new ones
+    inserted and the rest archived. Retrying with the same Idempotency-Key
+    returns the original summary without touching the database.
+    """
+    try:
+        doctor = request.state.user
+        if doctor.user_metadata.get("role") != "doctor":
+            raise HTTPException(status_code=403, detail="Only doctors can assign exercises")
+
+        fingerprint = payload.json()
+        cache_key = f"{doctor.id}:{idempotency_key}" if idempotency_key else None
+        if cache_key:
+            previous = idempotency_cache.get(cache_key)
+            if previous is not None:
+                if previous[0] != fingerprint:
+                    raise HTTPException(status_code=409, detail="Idempotency-Key was already used with a different request")
+                return previous[1]
+
+        patient_ids = list(dict.fromkeys(payload.patient_ids))
+        if not patient_ids:
+            raise HTTPException(status_code=400, detail="No patients selected")
+        if any(a.patient_id not in patient_ids for a in payload.assignments):
+            raise HTTPException(status_code=400, detail="Every assignment's patient must be listed in patient_ids")
 
+        doctor_res = supabase.from_("doctors").select("id").eq("auth_user_id", doctor.id).execute()
+        if not doctor_res.data:
+            raise HTTPException(status_code=404, detail="Doctor profile not found")
+        owned_res = supabase.from_("patients")\
+            .select("id")\
+            .eq("doctor_id", doctor_res.data[0]["id"])\
+            .in_("id", patient_ids)\
+            .execute()
+        if len(owned_res.data or []) != len(patient_ids):
+            raise HTTPException(status_code=403, detail="Some patients are not under your care")
+
+        existing = fetch_active_assignments(patient_ids)
+        diff = diff_assignments([a.dict() for a in payload.assignments], existing, archive_missing=True)
+        summary = apply_assignment_diff(diff)
+        _after_assignment_change(changed_patient_ids(diff))
+
+        response = {"status": "success", "summary": summary}
+        if cache_key:
+            idempotency_cache.set(cache_key, (fingerprint, response))
+        return response
+
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error assigning exercises: {e}")
-        raise HTTPException(status_code=500, detail="Failed to assign exercises")
\ No newline at end of file
+        logger.error(f"Error updating assignments: {e}")
+        raise HTTPException(status_code=500, detail="Failed to update assignments")
@@ -1,6 +1,9 @@
 import smtplib
 from email.message import EmailMessage
 import os
+import logging
+
+logger = logging.getLogger(__name__)
 
 def send_email(to: str, subject: str, content: str):
     """
@@ -16,7 +19,7 @@ def send_email(to: str, subject: str, content: str):
         smtp_from = os.getenv("SMTP_FROM")
         
         if not all([smtp_host, smtp_port, smtp_user, smtp_pass, smtp_from]):
-            print("Warning: SMTP settings not fully configured. Skipping email.")
+            logger.warning("SMTP settings not fully configured. Skipping email.")
             return False
         
         msg = EmailMessage()
@@ -30,12 +33,12 @@ def send_email(to: str, subject: str, content: str):
             server.login(smtp_user, smtp_pass)
             server.send_message(msg)
         
-        print(f"Email sent successfully to {to}")
+        logger.info(f"Email sent successfully to {to}")
         return True
         
     except smtplib.SMTPException as e:
-        print(f"SMTP error sending email to {to}: {e}")
+        logger.error(f"SMTP error sending email to {to}: {e}")
         raise Exception(f"Failed to send email: {str(e)}")
     except Exception as e:
-        print(f"Error sending email to {to}: {e}")
+        logger.error(f"Error sending email to {to}: {e}")
         raise Exception(f"Failed to send email: {str(e)}")
\ No newline at end of file
@@ -1,20 +1,32 @@
 from fastapi import APIRouter, HTTPException, Request
 from database import supabase
+from resilience import StaleCache, UpstreamUnavailable
+import logging
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/exercises", tags=["Exercises"])
 
+# The catalog is edited in Supabase directly, never through the API
+catalog_cache = StaleCache("exercise_catalog")
+
+def _fetch_catalog() -> list:
+    exercises = supabase.from_("exercises")\
+        .select("*")\
+        .order("name")\
+        .execute()
+    return exercises.data or []
+
 @router.get("")
 def list_exercises(request: Request):
     """Get all available exercises"""
     try:
-        exercises = supabase.from_("exercises")\
-            .select("*")\
-            .order("name")\
-            .execute()
-        
-        return exercises.data or []
+        return catalog_cache.read("all", _fetch_catalog, "exercises",
+                                  fresh_seconds=60, revalidate_seconds=600, stale_if_error_seconds=86400)
+    except UpstreamUnavailable:
+        raise HTTPException(503, "Exercise catalog temporarily unavailable")
     except Exception as e:
-        print(f"Error fetching exercises: {e}")
+        logger.error(f"Error fetching exercises: {e}")
         raise HTTPException(500, "Failed to fetch exercises")
 
 @router.get("/{id}")
@@ -34,5 +46,5 @@ def exercise_details(id: str, request: Request):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error fetching exercise details: {e}")
+        logger.error(f"Error fetching exercise details: {e}")
         raise HTTPException(500, "Failed to fetch exercise details")
\ No newline at end of file
@@ -0,0 +1,295 @@
+import os
+import time
+import asyncio
+import datetime
+from typing import Optional
+import httpx
+from async_db import db
+from instrumentation import HTTP_EVENT_HOOKS
+import logging
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
+GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
+GOOGLE_REDIRECT_URI = os.getenv("GOOGLE_REDIRECT_URI", "http://localhost:3000/oauth2/callback")
+
+# Overridable so a local stand-in can replace Google in tests and benchmarks
+GOOGLE_OAUTH_BASE_URL = os.getenv("GOOGLE_OAUTH_BASE_URL", "https://oauth2.googleapis.com").rstrip("/")
+GOOGLE_API_BASE_URL = os.getenv("GOOGLE_API_BASE_URL", "https://www.googleapis.com").rstrip("/")
+
+# Refresh a little before Google's expiry so a token never dies mid-request
+TOKEN_EXPIRY_MARGIN_SECONDS = 60
+# A doctor without a refresh token may link Google on any worker; look again after this
+MISSING_REFRESH_TOKEN_TTL_SECONDS = int(os.getenv("MISSING_REFRESH_TOKEN_TTL_SECONDS", "60"))
+
+# Returned for doctors without a linked Google account
+MOCK_EVENT = {"id": "mock_event_id", "meet_link": "https://meet.google.com/mock-link-abc-def"}
+
+_client: Optional[httpx.AsyncClient] = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """Long-lived pooled client shared by all Google calls on this worker."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(10.0, connect=5.0),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+            event_hooks=HTTP_EVENT_HOOKS
+        )
+    return _client
+
+async def close_http_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+class AccessTokenCache:
+    """
+    Per-doctor Google access tokens, valid until their expires_in runs out.
+    Concurrent requests for the same doctor share a single refresh call.
+    Refresh tokens are cached too so the doctors row is read once per worker;
+    a missing one is remembered only for MISSING_REFRESH_TOKEN_TTL_SECONDS.
+    """
+    def __init__(self):
+        self._tokens: dict[str, tuple[str, float]] = {}
+        self._refresh_tokens: dict[str, str] = {}
+        # doctor_id -> when to read the doctors row again
+        self._missing: dict[str, float] = {}
+        self._in_flight: dict[str, asyncio.Task] = {}
+
+    def store(self, doctor_id: str, access_token: str, expires_in: int):
+        expires_at = time.monotonic() + max(0, int(expires_in) - TOKEN_EXPIRY_MARGIN_SECONDS)
+        self._tokens[doctor_id] = (access_token, expires_at)
+
+    def store_refresh_token(self, doctor_id: str, refresh_token: Optional[str]):
+        self._missing.pop(doctor_id, None)
+        if refresh_token:
+            self._refresh_tokens[doctor_id] = refresh_token
+        else:
+            self._refresh_tokens.pop(doctor_id, None)
+
+    def invalidate(self, doctor_id: str):
+        self._tokens.pop(doctor_id, None)
+
+    async def get_refresh_token(self, doctor_id: str) -> Optional[str]:
+        if doctor_id in self._refresh_tokens:
+            return self._refresh_tokens[doctor_id]
+        if self._missing.get(doctor_id, 0) > time.monotonic():
+            return None
+        # NOTE: This assumes the 'doctors' table has 'google_refresh_token'.
+        doc_res = await db.from_("doctors").select("google_refresh_token").eq("id", doctor_id).limit(1).execute()
+        row = doc_res.data[0] if doc_res.data else {}
+        refresh_token = row.get("google_refresh_token")
+        if refresh_token:
+            self._refresh_tokens[doctor_id] = refresh_token
+            self._missing.pop(doctor_id, None)
+        else:
+            self._missing[doctor_id] = time.monotonic() + MISSING_REFRESH_TOKEN_TTL_SECONDS
+        return refresh_token
+
+    async def get(self, doctor_id: str) -> Optional[str]:
+        cached = self._tokens.get(doctor_id)
+        if cached and cached[1] > time.monotonic():
+            return cached[0]
+        task = self._in_flight.get(doctor_id)
+        if task is None:
+            task = asyncio.create_task(self._refresh(doctor_id))
+            self._in_flight[doctor_id] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(doctor_id, None))
+        return await asyncio.shield(task)
+
+    async def _refresh(self, doctor_id: str) -> Optional[str]:
+        refresh_token = await self.get_refresh_token(doctor_id)
+        if not refresh_token:
+            return None
+        resp = await get_http_client().post(f"{GOOGLE_OAUTH_BASE_URL}/token", data={
+            "client_id": GOOGLE_CLIENT_ID,
+            "client_secret": GOOGLE_CLIENT_SECRET,
+            "refresh_token": refresh_token,
+            "grant_type": "refresh_token"
+        })
+        if resp.status_code != 200:
+            logger.error(f"Failed to refresh token: {resp.text}")
+            if _oauth_error(resp) == "invalid_grant":
+                # Revoked or expired; re-read the row in case the doctor has re-linked
+                self._refresh_tokens.pop(doctor_id, None)
+            return None
+        tokens = resp.json()
+        self.store(doctor_id, tokens["access_token"], tokens.get("expires_in", 3600))
+        return tokens["access_token"]
+
+def _oauth_error(resp: httpx.Response) -> Optional[str]:
+    try:
+        return resp.json().get("error")
+    except ValueError:
+        return None
+
+token_cache = AccessTokenCache()
+
+async def exchange_code(code: str) -> Optional[dict]:
+    """Trade an OAuth authorization code for access and refresh tokens."""
+    resp = await get_http_client().post(f"{GOOGLE_OAUTH_BASE_URL}/token", data={
+        "code": code,
+        "client_id": GOOGLE_CLIENT_ID,
+        "client_secret": GOOGLE_CLIENT_SECRET,
+        "redirect_uri": GOOGLE_REDIRECT_URI,
+        "grant_type": "authorization_code"
+    })
+    if resp.status_code != 200:
+        logger.error(f"Token exchange failed: {resp.text}")
+        return None
+    return resp.json()
+
+async def calendar_request(doctor_id: str, method: str, path: str, **kwargs) -> Optional[httpx.Response]:
+    """
+    Authorized call to the Calendar API for a doctor.
+    A 401 drops the cached token and retries once with a fresh one.
+    Returns None when the doctor has no usable Google credentials.
+    """
+    extra_headers = kwargs.pop("headers", {})
+    for attempt in range(2):
+        access_token = await token_cache.get(doctor_id)
+        if not access_token:
+            return None
+        headers = {"Authorization": f"Bearer {access_token}", **extra_headers}
+        resp = await get_http_client().request(method, f"{GOOGLE_API_BASE_URL}/calendar/v3{path}", headers=headers, **kwargs)
+        if resp.status_code != 401 or attempt == 1:
+            return resp
+        token_cache.invalidate(doctor_id)
+    return None
+
+def _event_details(appointment: dict) -> dict:
+    # DB rows carry HH:MM:SS, payloads HH:MM
+    start_datetime = f"{appointment['appointment_date']}T{appointment['start_time'][:5]}:00"
+    end_datetime = f"{appointment['appointment_date']}T{appointment['end_time'][:5]}:00"
+    return {
+        "summary": "PhysioCheck Appointment",
+        "description": f"Appointment with patient. Notes: {appointment.get('notes') or ''}",
+        "start": {
+            "dateTime": start_datetime,
+            "timeZone": "UTC" # Should ideally be doctor's timezone
+        },
+        "end": {
+            "dateTime": end_datetime,
+            "timeZone": "UTC"
+        }
+    }
+
+def is_mock_event(event_id: Optional[str]) -> bool:
+    return not event_id or event_id == MOCK_EVENT["id"]
+
+async def create_google_calendar_event(doctor_id: str, appointment: dict, patient_email: str):
+    """
+    Creates a Google Calendar event with Meet link.
+    Requires doctor to have a stored refresh_token.
+    """
+    try:
+        if not await token_cache.get_refresh_token(doctor_id):
+            logger.warning(f"No Google refresh token found for doctor {doctor_id}")
+            # We will generate a mock link if no token is found, to allow testing without real auth.
+            # In production, this should raise an error.
+            return dict(MOCK_EVENT)
+
+        event_body = {
+            **_event_details(appointment),
+            "attendees": [
+                {"email": patient_email}
+            ],
+            "conferenceData": {
+                "createRequest": {
+                    "requestId": f"meet-{appointment['patient_id']}-{datetime.datetime.now().timestamp()}",
+                    "conferenceSolutionKey": {"type": "hangoutsMeet"}
+                }
+            }
+        }
+
+        resp = await calendar_request(
+            doctor_id, "POST", "/calendars/primary/events",
+            params={"conferenceDataVersion": 1}, json=event_body
+        )
+        if resp is None or resp.status_code != 200:
+            logger.error(f"Failed to create event: {resp.text if resp is not None else 'no access token'}")
+            return None
+
+        event_data = resp.json()
+        return {
+            "id": event_data["id"],
+            "meet_link": event_data.get("conferenceData", {}).get("entryPoints", [{}])[0].get("uri")
+        }
+
+    except Exception as e:
+        logger.error(f"Google Calendar Error: {e}")
+        return None
+
+async def create_google_calendar_series(doctor_id: str, first_appointment: dict, patient_email: str, recurrence: list[str]):
+    """
+    Creates one recurring event (with a single Meet link) for a whole series.
+    first_appointment must be the earliest occurrence; it becomes DTSTART.
+    recurrence: RRULE and EXDATE lines.
+    """
+    if not await token_cache.get_refresh_token(doctor_id):
+        return dict(MOCK_EVENT)
+    event_body = {
+        **_event_details(first_appointment),
+        "recurrence": recurrence,
+        "attendees": [
+            {"email": patient_email}
+        ],
+        "conferenceData": {
+            "createRequest": {
+                "requestId": f"meet-series-{first_appointment['series_id']}",
+                "conferenceSolutionKey": {"type": "hangoutsMeet"}
+            }
+        }
+    }
+    try:
+        resp = await calendar_request(
+            doctor_id, "POST", "/calendars/primary/events",
+            params={"conferenceDataVersion": 1}, json=event_body
+        )
+    except Exception as e:
+        logger.error(f"Google Calendar Error: {e}")
+        return None
+    if resp is None or resp.status_code != 200:
+        logger.error(f"Failed to create recurring event: {resp.text if resp is not None else 'no access token'}")
+        return None
+    event_data = resp.json()
+    return {
+        "id": event_data["id"],
+        "meet_link": event_data.get("conferenceData", {}).get("entryPoints", [{}])[0].get("uri")
+    }
+
+def instance_event_id(event_id: str, appointment_date: str, start_time: str) -> str:
+    """
+    Id of one occurrence of a recurring event, per Google's
+    <eventId>_<originalStartTime in UTC> convention. Storing it per row lets
+    single occurrences be moved or deleted without touching the series.
+    """
+    if is_mock_event(event_id):
+        return event_id
+    return f"{event_id}_{appointment_date.replace('-', '')}T{start_time[:5].replace(':', '')}00Z"
+
+async def update_google_calendar_event(doctor_id: str, event_id: str, appointment: dict) -> bool:
+    """Move an existing event to the appointment's current date, times and notes."""
+    if is_mock_event(event_id):
+        return True
+    resp = await calendar_request(
+        doctor_id, "PATCH", f"/calendars/primary/events/{event_id}",
+        json=_event_details(appointment)
+    )
+    if resp is None or resp.status_code != 200:
+        logger.error(f"Failed to update event {event_id}: {resp.text if resp is not None else 'no access token'}")
+        return False
+    return True
+
+async def delete_google_calendar_event(doctor_id: str, event_id: str) -> bool:
+    """Remove an event. Events that are already gone count as deleted."""
+    if is_mock_event(event_id):
+        return True
+    resp = await calendar_request(doctor_id, "DELETE", f"/calendars/primary/events/{event_id}")
+    if resp is None or resp.status_code not in (200, 204, 404, 410):
+        logger.error(f"Failed to delete event {event_id}: {resp.text if resp is not None else 'no access token'}")
+        return False
+    return True
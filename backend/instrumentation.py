@@ -0,0 +1,255 @@
+import os
+import time
+import random
+import asyncio
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Optional
+from urllib.parse import urlparse
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Optional: pyinstrument for flame graphs of slow requests
+try:
+    from pyinstrument import Profiler
+except ImportError:
+    Profiler = None
+
+# Opt-in profiler: a fraction of requests is profiled and the slow ones are saved
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0.05"))
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "500"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+# If set, /metrics requires "Authorization: Bearer <token>"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+COMPONENTS = ("auth", "db", "serialization", "http")
+
+class Histogram:
+    """Prometheus-style cumulative histogram keyed by a tuple of label values."""
+    def __init__(self, name: str, help_text: str, label_names: tuple[str, ...], buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        # labels -> [bucket counts..., sum, count]
+        self._series: dict[tuple[str, ...], list[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: tuple[str, ...], value: float):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted(self._series.items())
+        for labels, series in items:
+            base = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.label_names, labels))
+            sep = "," if base else ""
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{base}{sep}le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{base}{sep}le="+Inf"}} {series[-1]}')
+            lines.append(f"{self.name}_sum{{{base}}} {series[-2]}")
+            lines.append(f"{self.name}_count{{{base}}} {series[-1]}")
+        return lines
+
+class Counter:
+    """Prometheus-style monotonic counter keyed by a tuple of label values."""
+    def __init__(self, name: str, help_text: str, label_names: tuple[str, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._series: dict[tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: tuple[str, ...], amount: float = 1):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._series.items())
+        for labels, value in items:
+            base = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.label_names, labels))
+            lines.append(f"{self.name}{{{base}}} {value}")
+        return lines
+
+class Gauge:
+    """Unlabelled gauge whose value is read from `read()` at scrape time."""
+    def __init__(self, name: str, help_text: str, read):
+        self.name = name
+        self.help_text = help_text
+        self.read = read
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge", f"{self.name} {self.read()}"]
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+request_duration = Histogram(
+    "http_request_duration_seconds", "End-to-end request latency by route.", ("method", "route", "status"))
+component_duration = Histogram(
+    "http_request_component_seconds", "Time per request spent in auth, db, serialization and external http.", ("route", "component"))
+db_calls_per_request = Histogram(
+    "http_request_db_calls", "Database round-trips per request; high counts point at N+1 queries.", ("route",), COUNT_BUCKETS)
+db_duration = Histogram(
+    "db_query_duration_seconds", "PostgREST round-trip latency by table and method.", ("table", "method"))
+http_duration = Histogram(
+    "external_http_duration_seconds", "Outbound HTTP latency by host.", ("host", "status"))
+METRICS = [request_duration, component_duration, db_calls_per_request, db_duration, http_duration]
+
+class RequestStats:
+    def __init__(self):
+        self.times = dict.fromkeys(COMPONENTS, 0.0)
+        self.db_calls = 0
+        self._lock = threading.Lock()
+
+    def add(self, component: str, seconds: float):
+        with self._lock:
+            self.times[component] += seconds
+            if component == "db":
+                self.db_calls += 1
+
+# Shared by reference with to_thread / threadpool work started by the request
+_current: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar("request_stats", default=None)
+
+def _record(component: str, seconds: float):
+    stats = _current.get()
+    if stats is not None:
+        stats.add(component, seconds)
+
+@contextmanager
+def timed(component: str):
+    """Attribute the enclosed block to one of COMPONENTS of the current request."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record(component, time.perf_counter() - start)
+
+def builder_request(builder):
+    """Method, path, params and headers live on builder.request in postgrest 1.x+ and on the builder before that."""
+    return getattr(builder, "request", builder)
+
+def builder_table(builder) -> str:
+    # path is "/table" in older postgrest and the full ".../rest/v1/table" URL in newer
+    path = str(getattr(builder_request(builder), "path", "") or "").split("?")[0].rstrip("/")
+    return path.rsplit("/", 1)[-1] or "unknown"
+
+def builder_method(builder) -> str:
+    return str(getattr(builder_request(builder), "http_method", "") or "").upper()
+
+def instrument_postgrest():
+    """
+    Time every PostgREST round-trip made through database.supabase by wrapping
+    the request builders' execute(). Safe to call more than once.
+    """
+    try:
+        from postgrest._sync import request_builder
+    except ImportError:
+        return
+    for cls in vars(request_builder).values():
+        if not isinstance(cls, type) or "execute" not in vars(cls) or getattr(cls.execute, "_instrumented", False):
+            continue
+        original = cls.execute
+
+        def execute(self, _original=original):
+            start = time.perf_counter()
+            try:
+                return _original(self)
+            finally:
+                elapsed = time.perf_counter() - start
+                db_duration.observe((builder_table(self), builder_method(self)), elapsed)
+                _record("db", elapsed)
+
+        execute._instrumented = True
+        cls.execute = execute
+
+async def _on_http_request(request):
+    request.extensions["instrumentation_start"] = time.perf_counter()
+
+async def _on_http_response(response):
+    start = response.request.extensions.get("instrumentation_start")
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    http_duration.observe((urlparse(str(response.request.url)).hostname or "unknown", str(response.status_code)), elapsed)
+    _record("http", elapsed)
+
+# Pass as httpx.AsyncClient(event_hooks=...) to time outbound calls
+HTTP_EVENT_HOOKS = {"request": [_on_http_request], "response": [_on_http_response]}
+
+class InstrumentedJSONResponse(JSONResponse):
+    """Default response class; times JSON rendering as serialization."""
+    def render(self, content) -> bytes:
+        with timed("serialization"):
+            return super().render(content)
+
+def _save_profile(profiler, route: str, elapsed_ms: float):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = f"{int(time.time())}_{route.strip('/').replace('/', '_').replace('{', '').replace('}', '') or 'root'}_{int(elapsed_ms)}ms.html"
+    with open(os.path.join(PROFILE_DIR, name), "w") as f:
+        f.write(profiler.output_html())
+
+async def instrumentation_middleware(request: Request, call_next):
+    if request.url.path == "/metrics":
+        return await call_next(request)
+
+    stats = RequestStats()
+    token = _current.set(stats)
+    profiler = None
+    if PROFILING_ENABLED and Profiler is not None and (
+        request.headers.get("X-Profile") == "1" or random.random() < PROFILE_SAMPLE_RATE
+    ):
+        profiler = Profiler(async_mode="enabled")
+        profiler.start()
+
+    start = time.perf_counter()
+    status = "500"
+    try:
+        response = await call_next(request)
+        status = str(response.status_code)
+        return response
+    finally:
+        elapsed = time.perf_counter() - start
+        _current.reset(token)
+        # Route template, so /patients/{patient_id} is one series
+        route = getattr(request.scope.get("route"), "path", None) or "unmatched"
+        request_duration.observe((request.method, route, status), elapsed)
+        for component, seconds in stats.times.items():
+            component_duration.observe((route, component), seconds)
+        db_calls_per_request.observe((route,), stats.db_calls)
+        if profiler is not None:
+            profiler.stop()
+            if elapsed * 1000 >= PROFILE_SLOW_MS:
+                try:
+                    await asyncio.to_thread(_save_profile, profiler, route, elapsed * 1000)
+                except Exception as e:
+                    logger.error(f"Failed to save profile: {e}")
+
+def metrics_endpoint(request: Request):
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        return JSONResponse(status_code=401, content={"detail": "Invalid metrics token"})
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return Response("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+if PROFILING_ENABLED and Profiler is None:
+    logger.warning("PROFILING_ENABLED is set but pyinstrument is not installed; profiling disabled")
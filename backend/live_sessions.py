@@ -0,0 +1,173 @@
+import os
+import json
+import time
+import asyncio
+import threading
+import uuid
+from typing import Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+REDIS_URL = os.getenv("REDIS_URL")
+REDIS_KEY_PREFIX = "physiocheck:live:"
+# Per-doctor hashes expire once none of their entries has been written for this long
+REDIS_ENTRY_TTL_SECONDS = 6 * 60 * 60
+# Live metrics are mirrored to Redis at most this often per session
+REDIS_METRICS_INTERVAL_SECONDS = 5.0
+# A shared entry not rewritten for this long belongs to a worker that died
+# without unregistering it; same cutoff the session reaper uses
+LIVE_ENTRY_STALE_SECONDS = int(os.getenv("SESSION_STALE_AFTER_SECONDS", "600"))
+
+# Delete a patient's shared entry only if it still belongs to the given connection
+_DELETE_IF_OWNED = """
+local raw = redis.call('HGET', KEYS[1], ARGV[1])
+if raw and cjson.decode(raw)['connection_id'] == ARGV[2] then
+    return redis.call('HDEL', KEYS[1], ARGV[1])
+end
+return 0
+"""
+
+class LiveSessionIndex:
+    """
+    Index of patients currently streaming a session over /ws/patient/session.
+    Maps doctor_db_id -> patient_id -> live session entry, so "who is exercising
+    right now" for a doctor is a dictionary lookup instead of a DB scan.
+
+    Entries live in process memory. When REDIS_URL is set (and the redis
+    package is installed) they are mirrored to a per-doctor Redis hash so that
+    every worker sees sessions connected to any other worker.
+
+    Each registration gets a connection id, and unregister() only removes the
+    entry if it still carries that id, so a socket closing after the patient
+    reconnected doesn't remove the new connection's entry.
+    """
+    def __init__(self, redis_url: Optional[str] = None):
+        self._by_doctor: dict[str, dict[str, dict]] = {}
+        self._doctor_of: dict[str, str] = {}
+        self._last_mirrored: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._redis = None
+        if redis_url and redis is not None:
+            try:
+                client = redis.Redis.from_url(redis_url, socket_timeout=0.5, decode_responses=True)
+                self._delete_if_owned = client.register_script(_DELETE_IF_OWNED)
+                self._redis = client
+            except Exception as e:
+                logger.warning(f"Live session index: Redis unavailable, using local memory only: {e}")
+
+    async def register(self, doctor_id: str, patient_id: str, entry: dict) -> str:
+        """Add or replace the patient's entry; returns the connection id to unregister with."""
+        connection_id = uuid.uuid4().hex
+        entry = {**entry, "patient_id": patient_id, "doctor_id": doctor_id,
+                 "connection_id": connection_id, "updated_at": time.time()}
+        with self._lock:
+            previous = self._doctor_of.get(patient_id)
+            if previous and previous != doctor_id:
+                self._by_doctor.get(previous, {}).pop(patient_id, None)
+            self._by_doctor.setdefault(doctor_id, {})[patient_id] = entry
+            self._doctor_of[patient_id] = doctor_id
+            self._last_mirrored[patient_id] = time.monotonic()
+        await self._mirror_set(doctor_id, patient_id, entry)
+        return connection_id
+
+    async def update_metrics(self, patient_id: str, metrics: dict):
+        with self._lock:
+            doctor_id = self._doctor_of.get(patient_id)
+            if not doctor_id:
+                return
+            entry = self._by_doctor.get(doctor_id, {}).get(patient_id)
+            if entry is None:
+                return
+            if metrics:
+                entry["metrics"] = {**(entry.get("metrics") or {}), **metrics}
+            entry["updated_at"] = time.time()
+            snapshot = dict(entry)
+            now = time.monotonic()
+            due = now - self._last_mirrored.get(patient_id, 0) >= REDIS_METRICS_INTERVAL_SECONDS
+            if due:
+                self._last_mirrored[patient_id] = now
+        if due:
+            await self._mirror_set(doctor_id, patient_id, snapshot)
+
+    async def touch(self, patient_id: str):
+        """Keep the shared entry fresh while the socket is open but sending no metrics."""
+        await self.update_metrics(patient_id, {})
+
+    async def unregister(self, patient_id: str, connection_id: Optional[str], doctor_id: Optional[str] = None):
+        """
+        Remove the patient's entry if it still belongs to connection_id.
+        doctor_id finds the shared entry when this worker holds none for the patient.
+        """
+        if not connection_id:
+            return
+        with self._lock:
+            entry = self._by_doctor.get(self._doctor_of.get(patient_id), {}).get(patient_id)
+            if entry is not None and entry.get("connection_id") == connection_id:
+                doctor_id = self._doctor_of.pop(patient_id)
+                self._last_mirrored.pop(patient_id, None)
+                del self._by_doctor[doctor_id][patient_id]
+                if not self._by_doctor[doctor_id]:
+                    del self._by_doctor[doctor_id]
+        if doctor_id and self._redis is not None:
+            try:
+                await asyncio.to_thread(self._delete_shared, doctor_id, patient_id, connection_id)
+            except Exception as e:
+                logger.error(f"Live session index: Redis delete failed: {e}")
+
+    def _delete_shared(self, doctor_id: str, patient_id: str, connection_id: str):
+        self._delete_if_owned(keys=[REDIS_KEY_PREFIX + doctor_id], args=[patient_id, connection_id])
+
+    def get(self, patient_id: str) -> Optional[dict]:
+        with self._lock:
+            doctor_id = self._doctor_of.get(patient_id)
+            if doctor_id:
+                entry = self._by_doctor.get(doctor_id, {}).get(patient_id)
+                return dict(entry) if entry else None
+        return None
+
+    def for_doctor(self, doctor_id: str) -> list[dict]:
+        """
+        Live sessions of one doctor's patients.
+        Local entries win over the shared copy since they carry fresher metrics;
+        shared entries not rewritten within LIVE_ENTRY_STALE_SECONDS are dropped.
+        """
+        with self._lock:
+            entries = {pid: dict(e) for pid, e in self._by_doctor.get(doctor_id, {}).items()}
+        if self._redis is not None:
+            try:
+                shared = self._redis.hgetall(REDIS_KEY_PREFIX + doctor_id) or {}
+                cutoff = time.time() - LIVE_ENTRY_STALE_SECONDS
+                for pid, raw in shared.items():
+                    if pid in entries:
+                        continue
+                    entry = json.loads(raw)
+                    if (entry.get("updated_at") or 0) < cutoff:
+                        self._delete_shared(doctor_id, pid, entry.get("connection_id") or "")
+                        continue
+                    entries[pid] = entry
+            except Exception as e:
+                logger.error(f"Live session index: Redis read failed: {e}")
+        return list(entries.values())
+
+    async def _mirror_set(self, doctor_id: str, patient_id: str, entry: dict):
+        if self._redis is None:
+            return
+        key = REDIS_KEY_PREFIX + doctor_id
+        try:
+            await asyncio.to_thread(self._write_shared, key, patient_id, json.dumps(entry, default=str))
+        except Exception as e:
+            logger.error(f"Live session index: Redis write failed: {e}")
+
+    def _write_shared(self, key: str, patient_id: str, value: str):
+        pipe = self._redis.pipeline()
+        pipe.hset(key, patient_id, value)
+        pipe.expire(key, REDIS_ENTRY_TTL_SECONDS)
+        pipe.execute()
+
+live_sessions = LiveSessionIndex(REDIS_URL)
@@ -0,0 +1,110 @@
+import os
+import sys
+import copy
+import json
+import queue
+import random
+import logging
+import logging.handlers
+from datetime import datetime, timezone
+from typing import Optional
+
+# Root level plus per-logger overrides, e.g. LOG_LEVELS="chat=WARNING,websocket=DEBUG"
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+# "json" for log shippers, "text" for reading locally
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+# Optional file sink; written by the listener thread, never by request handlers
+LOG_FILE = os.getenv("LOG_FILE")
+# Fraction of records below WARNING kept from high-frequency loggers,
+# e.g. LOG_SAMPLE_RATES="websocket.events=0.01,chat.events=0.1"
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "websocket.events=0.01,chat.events=0.01")
+
+# LogRecord attributes that are not user-supplied `extra` fields
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; `extra={...}` fields become top-level keys."""
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage()
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+class SamplingFilter(logging.Filter):
+    """Keeps a random `rate` share of records below WARNING; warnings and errors always pass."""
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Keep msg and traceback as separate fields for the JSON formatter,
+        # instead of the stock handler folding them into one string.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+def _parse_pairs(value: str) -> dict[str, str]:
+    pairs = {}
+    for item in value.split(","):
+        if "=" in item:
+            name, setting = item.split("=", 1)
+            pairs[name.strip()] = setting.strip()
+    return pairs
+
+def setup_logging():
+    """
+    Route all logging through an in-memory queue drained by a background
+    listener thread, so a log call on the event loop never touches stdout or disk.
+    Safe to call more than once.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    formatter = JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+    sinks: list[logging.Handler] = [logging.StreamHandler(sys.stdout)]
+    if LOG_FILE:
+        sinks.append(logging.handlers.WatchedFileHandler(LOG_FILE))
+    for sink in sinks:
+        sink.setFormatter(formatter)
+
+    log_queue: queue.Queue = queue.Queue(-1)
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_QueueHandler(log_queue))
+    root.setLevel(LOG_LEVEL)
+
+    for name, level in _parse_pairs(LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level.upper())
+    for name, rate in _parse_pairs(LOG_SAMPLE_RATES).items():
+        logging.getLogger(name).addFilter(SamplingFilter(float(rate)))
+
+    _listener = logging.handlers.QueueListener(log_queue, *sinks, respect_handler_level=True)
+    _listener.start()
+
+def stop_logging():
+    """Flush what is queued; called on shutdown."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
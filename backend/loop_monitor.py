@@ -0,0 +1,126 @@
+import os
+import sys
+import time
+import asyncio
+import threading
+import traceback
+from typing import Optional
+from instrumentation import Histogram, Counter, METRICS
+import logging
+
+logger = logging.getLogger(__name__)
+
+LOOP_MONITOR_ENABLED = os.getenv("LOOP_MONITOR_ENABLED", "true").lower() == "true"
+# How often the loop is probed; lag is how late the probe wakes up
+LOOP_MONITOR_INTERVAL_MS = float(os.getenv("LOOP_MONITOR_INTERVAL_MS", "100"))
+# A probe this late counts as a blocked loop and gets its stack logged
+LOOP_BLOCK_THRESHOLD_MS = float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", "100"))
+# Strict: blocks are logged as errors and stop() raises BlockingCallError, for tests and benchmarks
+LOOP_MONITOR_STRICT = os.getenv("LOOP_MONITOR_STRICT", "false").lower() == "true"
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+loop_lag = Histogram(
+    "event_loop_lag_seconds", "How late a periodic probe runs on the event loop.", (), LAG_BUCKETS)
+loop_blocked = Counter(
+    "event_loop_blocked_total", "Event loop stalls beyond the block threshold, by the app code that was running.", ("location",))
+METRICS.extend([loop_lag, loop_blocked])
+
+class BlockingCallError(RuntimeError):
+    pass
+
+def _location(frame) -> str:
+    """Innermost frame in our own code, e.g. 'doctor.py:212 get_dashboard'."""
+    found = "unknown"
+    for summary in traceback.extract_stack(frame):
+        path = os.path.abspath(summary.filename)
+        if path.startswith(BACKEND_DIR) and "site-packages" not in path and path != os.path.abspath(__file__):
+            found = f"{os.path.relpath(path, BACKEND_DIR)}:{summary.lineno} {summary.name}"
+    return found
+
+class LoopMonitor:
+    """
+    Measures event-loop lag with a probe task and, from a watchdog thread,
+    grabs the loop thread's stack while it is stalled, so a sync Supabase call
+    made from an async handler shows up with the line that made it.
+    """
+    def __init__(self, interval_ms: float = LOOP_MONITOR_INTERVAL_MS,
+                 threshold_ms: float = LOOP_BLOCK_THRESHOLD_MS, strict: bool = LOOP_MONITOR_STRICT):
+        self.interval = interval_ms / 1000
+        self.threshold = threshold_ms / 1000
+        self.strict = strict
+        self.violations: list[dict] = []
+        self._loop_thread: Optional[int] = None
+        # When the probe is due to wake up; written by the loop, read by the watchdog
+        self._due = 0.0
+        self._stall: Optional[tuple[float, str, str]] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+
+    def _watch(self):
+        poll = min(self.interval, self.threshold) / 2
+        while not self._stop.wait(poll):
+            due = self._due
+            if not due or time.monotonic() - due < self.threshold:
+                continue
+            with self._lock:
+                if self._stall and self._stall[0] == due:
+                    continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            stall = (due, _location(frame), "".join(traceback.format_stack(frame)))
+            with self._lock:
+                self._stall = stall
+
+    def _take_stall(self, due: float) -> tuple[str, str]:
+        with self._lock:
+            stall, self._stall = self._stall, None
+        if stall and stall[0] == due:
+            return stall[1], stall[2]
+        # Stall was shorter than a watchdog poll, or the stack was taken too late
+        return "unknown", ""
+
+    def _on_block(self, lag: float, location: str, stack: str):
+        loop_blocked.inc((location,))
+        log = logger.error if self.strict else logger.warning
+        log(f"Event loop blocked for {lag * 1000:.0f}ms at {location}",
+            extra={"lag_ms": round(lag * 1000), "location": location, "stack": stack})
+        if self.strict:
+            self.violations.append({"lag_ms": round(lag * 1000), "location": location, "stack": stack})
+
+    async def run(self):
+        if not LOOP_MONITOR_ENABLED:
+            return
+        self._loop_thread = threading.get_ident()
+        self._stop.clear()
+        self._watchdog = threading.Thread(target=self._watch, name="loop-monitor", daemon=True)
+        self._watchdog.start()
+        try:
+            while True:
+                due = time.monotonic() + self.interval
+                self._due = due
+                await asyncio.sleep(self.interval)
+                lag = max(0.0, time.monotonic() - due)
+                loop_lag.observe((), lag)
+                if lag >= self.threshold:
+                    self._on_block(lag, *self._take_stall(due))
+        finally:
+            self._due = 0.0
+            self._stop.set()
+
+    def check(self):
+        """Raise BlockingCallError if any block was seen in strict mode."""
+        if self.violations:
+            worst = max(self.violations, key=lambda v: v["lag_ms"])
+            raise BlockingCallError(
+                f"{len(self.violations)} event loop block(s); worst {worst['lag_ms']}ms at {worst['location']}\n{worst['stack']}")
+
+    def stop(self):
+        self._stop.set()
+        if self.strict:
+            self.check()
+
+loop_monitor = LoopMonitor()
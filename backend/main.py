@@ -1,7 +1,16 @@
+import asyncio
+from logging_config import setup_logging, stop_logging
+
+# Before the app modules are imported, so their import-time logging is queued too
+setup_logging()
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from middleware import supabase_auth_middleware
+from instrumentation import (
+    instrumentation_middleware, instrument_postgrest, metrics_endpoint, InstrumentedJSONResponse
+)
 from auth import router as auth_router
 from doctor import router as doctor_router
 from patients import router as patient_router
@@ -11,16 +20,41 @@ from websocket import router as websocket_router
 from profile import router as profile_router
 from notifications import router as notifications_router
 from chat import router as chat_router
+from session_reaper import run_reaper
+from google_calendar import close_http_client
+from calendar_sync import run_calendar_sync_worker
+from reminders import reminder_scheduler
+from daily_plan import daily_plans
+from loop_monitor import loop_monitor
+from async_db import db_executor
+from singleflight import install_postgrest_singleflight
+from resilience import install_postgrest_breakers
+from cdc import change_feed
+from analytics import analytics
+from replicas import read_replicas, read_routing_middleware, install_postgrest_replicas
+from replicas import open_http_client as open_replica_client, close_http_client as close_replica_client
 
 app = FastAPI(
     title="PhysioCheck Backend",
     docs_url="/api/v1/docs",
-    openapi_url="/api/v1/openapi.json"
+    openapi_url="/api/v1/openapi.json",
+    default_response_class=InstrumentedJSONResponse
 )
 
+# Replica routing runs inside auth so it knows the user
+app.middleware("http")(read_routing_middleware)
+
 # Auth middleware
 app.middleware("http")(supabase_auth_middleware)
 
+# Request metrics; registered after auth so it wraps it and sees auth time
+install_postgrest_replicas()
+instrument_postgrest()
+install_postgrest_breakers()
+install_postgrest_singleflight()
+app.middleware("http")(instrumentation_middleware)
+app.add_api_route("/metrics", metrics_endpoint, methods=["GET"], include_in_schema=False)
+
 # CORS Configuration
 origins = [
     "http://localhost:3000",
@@ -52,6 +86,33 @@ app.include_router(chat_router, prefix="/api/v1")
 from appointments import router as appointments_router
 app.include_router(appointments_router, prefix="/api/v1")
 
+background_tasks: list[asyncio.Task] = []
+
+@app.on_event("startup")
+async def start_background_tasks():
+    background_tasks.append(asyncio.create_task(run_reaper()))
+    background_tasks.append(asyncio.create_task(run_calendar_sync_worker()))
+    background_tasks.append(asyncio.create_task(reminder_scheduler.run()))
+    background_tasks.append(asyncio.create_task(daily_plans.run_rollover()))
+    background_tasks.append(asyncio.create_task(loop_monitor.run()))
+    background_tasks.append(asyncio.create_task(change_feed.run()))
+    await open_replica_client()
+    background_tasks.append(asyncio.create_task(read_replicas.run()))
+    background_tasks.append(asyncio.create_task(analytics.replicas.run()))
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    for task in background_tasks:
+        task.cancel()
+    await close_http_client()
+    await analytics.close()
+    await close_replica_client()
+    db_executor.shutdown()
+    try:
+        loop_monitor.stop()
+    finally:
+        stop_logging()
+
 @app.get("/")
 def root():
     return {"status": "PhysioCheck backend running"}
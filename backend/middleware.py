@@ -1,6 +1,10 @@
 from fastapi import Request, HTTPException
 from fastapi.responses import JSONResponse
-from database import supabase
+from async_db import db
+from instrumentation import timed
+import logging
+
+logger = logging.getLogger(__name__)
 
 async def supabase_auth_middleware(request: Request, call_next):
     # Skip auth for public routes
@@ -11,7 +15,8 @@ async def supabase_auth_middleware(request: Request, call_next):
         "/api/v1/register",
         "/api/v1/exercises",  # Add this if exercises should be public
         "/api/v1/ws", # WebSocket handshake handles its own auth via query param
-        "/favicon.ico"
+        "/favicon.ico",
+        "/metrics" # Checks METRICS_TOKEN itself
     ]
     
     # Allow OPTIONS requests for CORS preflight
@@ -25,8 +30,6 @@ async def supabase_auth_middleware(request: Request, call_next):
     if is_public:
         return await call_next(request)
         
-    print(f"MIDDLEWARE AUTH CHECK: {request.method} {request.url.path} (Public: {is_public})")
-    
     # Check Authorization header
     auth_header = request.headers.get("Authorization")
     if not auth_header or not auth_header.startswith("Bearer "):
@@ -36,7 +39,8 @@ async def supabase_auth_middleware(request: Request, call_next):
     
     try:
         # Verify token with Supabase
-        user_data = supabase.auth.get_user(token)
+        with timed("auth"):
+            user_data = await db.get_user(token)
         
         if not user_data or not user_data.user:
             return JSONResponse(status_code=401, content={"detail": "Invalid token"})
@@ -45,9 +49,7 @@ async def supabase_auth_middleware(request: Request, call_next):
         request.state.user = user_data.user
         
     except Exception as e:
-        with open("debug_auth.log", "a") as f:
-            f.write(f"Auth error: {str(e)}\nToken start: {token[:10] if token else 'None'}\n")
-        print(f"Auth middleware error: {e}")
+        logger.warning(f"Auth middleware error: {e}", extra={"path": request.url.path})
         return JSONResponse(status_code=401, content={"detail": f"Authentication failed: {str(e)}"})
     
     response = await call_next(request)
@@ -0,0 +1,261 @@
+"""
+Versioned schema migrations for the Supabase Postgres database.
+
+    python migrate.py up      # apply pending files from migrations/ in order
+    python migrate.py status  # list applied and pending migrations
+    python migrate.py check   # fail on pending or edited migrations, or on a
+                              # hot path whose query plan doesn't use its index
+
+Connects with DATABASE_URL (or --dsn): a direct or session pooler connection
+string, not the transaction pooler, since no-transaction migrations run
+statements one at a time on the same connection.
+
+Migrations are NNNN_name.sql files. Each runs in a transaction and is
+recorded in schema_migrations with a checksum; applied files must not be
+edited, add a new one instead. A file whose first line is
+`-- migrate: no-transaction` runs statement by statement (statements end with
+`;` at the end of a line), for CREATE INDEX CONCURRENTLY; keep those
+re-runnable, since a failure part way through leaves earlier statements applied.
+"""
+import os
+import re
+import sys
+import json
+import asyncio
+import hashlib
+import argparse
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+try:
+    import asyncpg
+except ImportError:
+    asyncpg = None
+
+DATABASE_URL = os.getenv("DATABASE_URL") or os.getenv("ANALYTICS_DATABASE_URL")
+MIGRATIONS_DIR = Path(__file__).parent / "migrations"
+NO_TRANSACTION = "-- migrate: no-transaction"
+# Held for the whole run so two deploys can't apply migrations at once
+ADVISORY_LOCK_ID = 720_184_001
+
+SCHEMA_MIGRATIONS = """
+CREATE TABLE IF NOT EXISTS public.schema_migrations (
+    version INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    checksum TEXT NOT NULL,
+    applied_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+);
+-- No policies: only the service role and direct connections can read it
+ALTER TABLE public.schema_migrations ENABLE ROW LEVEL SECURITY;
+"""
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    sql: str
+
+    @property
+    def checksum(self) -> str:
+        return hashlib.sha256(self.sql.encode()).hexdigest()
+
+    @property
+    def transactional(self) -> bool:
+        return not self.sql.lstrip().startswith(NO_TRANSACTION)
+
+    def statements(self) -> list[str]:
+        statements, current = [], []
+        for line in self.sql.splitlines():
+            current.append(line)
+            if line.rstrip().endswith(";"):
+                statements.append("\n".join(current))
+                current = []
+        statements.append("\n".join(current))
+        return [s for s in statements if _strip_comments(s)]
+
+    def __str__(self):
+        return f"{self.version:04d}_{self.name}"
+
+def _strip_comments(sql: str) -> str:
+    return "\n".join(line.split("--", 1)[0] for line in sql.splitlines()).strip()
+
+def load_migrations(directory: Path = MIGRATIONS_DIR) -> list[Migration]:
+    migrations = {}
+    for path in sorted(directory.glob("*.sql")):
+        match = re.fullmatch(r"(\d{4})_(\w+)\.sql", path.name)
+        if not match:
+            raise SystemExit(f"{path.name}: migration files are named NNNN_name.sql")
+        version = int(match.group(1))
+        if version in migrations:
+            raise SystemExit(f"{path.name}: version {version} is used by {migrations[version]} too")
+        migrations[version] = Migration(version, match.group(2), path.read_text())
+    return [migrations[v] for v in sorted(migrations)]
+
+@dataclass(frozen=True)
+class HotPath:
+    """A query an endpoint runs on every request and the index it relies on."""
+    endpoint: str
+    table: str
+    # Leading key columns of the index the plan must use
+    columns: tuple[str, ...]
+    query: str
+
+# Any id will do; with sequential scans disabled the plan shape doesn't depend on it
+SAMPLE_ID = "'00000000-0000-0000-0000-000000000000'"
+
+HOT_PATHS = [
+    HotPath("GET /api/v1/patient/session/history", "exercise_sessions", ("patient_id", "created_at"),
+            f"SELECT * FROM exercise_sessions WHERE patient_id = {SAMPLE_ID} ORDER BY created_at DESC"),
+    HotPath("GET /api/v1/patient/dashboard/stats", "exercise_sessions", ("patient_id",),
+            f"SELECT * FROM exercise_sessions WHERE patient_id = {SAMPLE_ID} AND status = 'completed'"),
+    HotPath("session reaper", "exercise_sessions", ("last_seen_at",),
+            "SELECT id, patient_id FROM exercise_sessions WHERE status = 'in_progress' "
+            "AND (last_seen_at < now() OR (last_seen_at IS NULL AND started_at < now()))"),
+    HotPath("GET /api/v1/patient/my_exercises", "assigned_exercises", ("patient_id",),
+            f"SELECT * FROM assigned_exercises WHERE patient_id = {SAMPLE_ID} AND status = 'active'"),
+    HotPath("GET /api/v1/chat/history/{other_user_id}", "messages", ("sender_id", "recipient_id"),
+            f"SELECT * FROM messages WHERE sender_id = {SAMPLE_ID} AND recipient_id = {SAMPLE_ID}"),
+    HotPath("GET /api/v1/notifications", "notifications", ("user_id", "created_at"),
+            f"SELECT * FROM notifications WHERE user_id = {SAMPLE_ID} ORDER BY created_at DESC"),
+    HotPath("GET /api/v1/patient/today (unread counts)", "notifications", ("user_id",),
+            f"SELECT count(*) FROM notifications WHERE user_id = {SAMPLE_ID} AND is_read = false"),
+    HotPath("patient requests (profile lookup)", "patients", ("auth_user_id",),
+            f"SELECT id, doctor_id FROM patients WHERE auth_user_id = {SAMPLE_ID}"),
+    HotPath("GET /api/v1/doctor/patients", "patients", ("doctor_id",),
+            f"SELECT * FROM patients WHERE doctor_id = {SAMPLE_ID}"),
+    HotPath("doctor requests (profile lookup)", "doctors", ("auth_user_id",),
+            f"SELECT id FROM doctors WHERE auth_user_id = {SAMPLE_ID}"),
+]
+
+INDEX_COLUMNS = """
+SELECT c.relname AS index_name, i.indisvalid AS valid,
+       array_agg(a.attname ORDER BY k.ord) AS columns
+FROM pg_index i
+JOIN pg_class c ON c.oid = i.indexrelid
+CROSS JOIN LATERAL unnest(i.indkey) WITH ORDINALITY AS k(attnum, ord)
+JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = k.attnum
+WHERE i.indrelid = $1::regclass
+GROUP BY c.relname, i.indisvalid
+"""
+
+def _plan_indexes(node: dict) -> set[str]:
+    names = {node["Index Name"]} if "Index Name" in node else set()
+    for child in node.get("Plans", []):
+        names |= _plan_indexes(child)
+    return names
+
+async def applied_migrations(conn, create: bool = False) -> dict[int, str]:
+    if create:
+        await conn.execute(SCHEMA_MIGRATIONS)
+    elif await conn.fetchval("SELECT to_regclass('public.schema_migrations')") is None:
+        return {}
+    rows = await conn.fetch("SELECT version, checksum FROM public.schema_migrations")
+    return {r["version"]: r["checksum"] for r in rows}
+
+def drifted(migrations: list[Migration], applied: dict[int, str]) -> list[Migration]:
+    return [m for m in migrations if m.version in applied and applied[m.version] != m.checksum]
+
+async def apply(conn, migration: Migration):
+    record = ("INSERT INTO public.schema_migrations (version, name, checksum) VALUES ($1, $2, $3)",
+              migration.version, migration.name, migration.checksum)
+    if migration.transactional:
+        async with conn.transaction():
+            await conn.execute(migration.sql)
+            await conn.execute(*record)
+        return
+    for statement in migration.statements():
+        await conn.execute(statement)
+    await conn.execute(*record)
+
+async def up(conn, migrations: list[Migration]) -> int:
+    await conn.execute("SELECT pg_advisory_lock($1)", ADVISORY_LOCK_ID)
+    try:
+        applied = await applied_migrations(conn, create=True)
+        changed = drifted(migrations, applied)
+        if changed:
+            for m in changed:
+                print(f"{m} was edited after it was applied; add a new migration instead")
+            return 1
+        pending = [m for m in migrations if m.version not in applied]
+        for m in pending:
+            print(f"Applying {m}...")
+            await apply(conn, m)
+        print(f"{len(pending)} migration(s) applied" if pending else "Schema is up to date")
+        return 0
+    finally:
+        await conn.execute("SELECT pg_advisory_unlock($1)", ADVISORY_LOCK_ID)
+
+async def status(conn, migrations: list[Migration]) -> int:
+    applied = await applied_migrations(conn)
+    for m in migrations:
+        if m.version not in applied:
+            state = "pending"
+        elif applied[m.version] != m.checksum:
+            state = "edited since applied"
+        else:
+            state = "applied"
+        print(f"{m}: {state}")
+    return 0
+
+async def check_hot_path(conn, path: HotPath) -> Optional[str]:
+    """None when the plan uses a valid index on path.table leading with path.columns, else why not."""
+    try:
+        async with conn.transaction():
+            # Empty or tiny tables are always cheaper to scan; ask which index it would use
+            await conn.execute("SET LOCAL enable_seqscan = off")
+            plan = json.loads(await conn.fetchval(f"EXPLAIN (FORMAT JSON) {path.query}"))[0]["Plan"]
+    except asyncpg.UndefinedTableError:
+        return f"table {path.table} does not exist"
+    indexes = {r["index_name"]: r for r in await conn.fetch(INDEX_COLUMNS, f"public.{path.table}")}
+    used = _plan_indexes(plan) & indexes.keys()
+    for name in used:
+        index = indexes[name]
+        if index["valid"] and tuple(index["columns"][:len(path.columns)]) == path.columns:
+            return None
+    wanted = f"{path.table}({', '.join(path.columns)})"
+    invalid = [n for n, r in indexes.items() if not r["valid"]]
+    if invalid:
+        return f"no usable index on {wanted}; invalid (failed concurrent build, drop and re-run up): {', '.join(invalid)}"
+    return f"no index on {wanted} in the plan (uses: {', '.join(sorted(used)) or 'none'})"
+
+async def check(conn, migrations: list[Migration]) -> int:
+    failures = 0
+    applied = await applied_migrations(conn)
+    for m in migrations:
+        if m.version not in applied:
+            print(f"FAIL {m} is pending")
+            failures += 1
+    for m in drifted(migrations, applied):
+        print(f"FAIL {m} was edited after it was applied")
+        failures += 1
+    for path in HOT_PATHS:
+        problem = await check_hot_path(conn, path)
+        if problem:
+            print(f"FAIL {path.endpoint}: {problem}")
+            failures += 1
+        else:
+            print(f"ok   {path.endpoint}")
+    print(f"{failures} problem(s)" if failures else "Schema and hot-path indexes are in place")
+    return 1 if failures else 0
+
+COMMANDS = {"up": up, "status": status, "check": check}
+
+async def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Apply and verify schema migrations.")
+    parser.add_argument("command", choices=COMMANDS)
+    parser.add_argument("--dsn", default=DATABASE_URL, help="Postgres connection string (default: $DATABASE_URL)")
+    args = parser.parse_args(argv)
+    if asyncpg is None:
+        raise SystemExit("asyncpg is not installed")
+    if not args.dsn:
+        raise SystemExit("Set DATABASE_URL or pass --dsn")
+    migrations = load_migrations()
+    conn = await asyncpg.connect(args.dsn, statement_cache_size=0)
+    try:
+        return await COMMANDS[args.command](conn, migrations)
+    finally:
+        await conn.close()
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
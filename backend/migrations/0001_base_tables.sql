@@ -0,0 +1,76 @@
+-- Tables the API was first built on. They were created in the Supabase
+-- dashboard before schema changes were kept in files, so IF NOT EXISTS makes
+-- this a no-op there; on a fresh or local Postgres it creates them with the
+-- columns the API reads and writes.
+
+-- Supabase provides auth.uid() for RLS policies; plain Postgres doesn't.
+CREATE SCHEMA IF NOT EXISTS auth;
+DO $$
+BEGIN
+    IF to_regprocedure('auth.uid()') IS NULL THEN
+        CREATE FUNCTION auth.uid() RETURNS UUID LANGUAGE sql STABLE
+            AS $fn$ SELECT nullif(current_setting('request.jwt.claim.sub', true), '')::uuid $fn$;
+    END IF;
+END $$;
+
+CREATE TABLE IF NOT EXISTS public.doctors (
+    id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+    auth_user_id UUID NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS public.patients (
+    id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+    auth_user_id UUID,
+    doctor_id UUID REFERENCES doctors(id) ON DELETE SET NULL,
+    full_name TEXT NOT NULL,
+    email TEXT,
+    phone TEXT,
+    date_of_birth DATE,
+    age INTEGER,
+    conditions TEXT[] DEFAULT '{}',
+    allergies TEXT[] DEFAULT '{}',
+    medications TEXT[] DEFAULT '{}',
+    emergency_contact_name TEXT,
+    emergency_contact_phone TEXT,
+    notes TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS public.exercises (
+    id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+    name TEXT NOT NULL,
+    description TEXT,
+    video_url TEXT,
+    duration_seconds INTEGER,
+    repetitions INTEGER,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS public.assigned_exercises (
+    id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+    patient_id UUID NOT NULL REFERENCES patients(id) ON DELETE CASCADE,
+    exercise_id UUID NOT NULL REFERENCES exercises(id) ON DELETE CASCADE,
+    sets INTEGER,
+    reps INTEGER,
+    frequency TEXT,
+    selected_days TEXT[],
+    start_date DATE,
+    end_date DATE,
+    notes TEXT,
+    assigned_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS public.exercise_sessions (
+    id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+    patient_id UUID NOT NULL REFERENCES patients(id) ON DELETE CASCADE,
+    exercise_id UUID REFERENCES exercises(id) ON DELETE SET NULL,
+    status TEXT DEFAULT 'in_progress',
+    duration_seconds INTEGER,
+    repetitions INTEGER,
+    notes TEXT,
+    metrics JSONB DEFAULT '{}'::jsonb,
+    started_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+    completed_at TIMESTAMP WITH TIME ZONE,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+);
@@ -16,6 +16,7 @@ CREATE TABLE IF NOT EXISTS public.messages (
 ALTER TABLE public.messages ENABLE ROW LEVEL SECURITY;
 
 -- Policy: Users can see messages sent by them or sent to them
+DROP POLICY IF EXISTS "Users can view their own messages" ON public.messages;
 CREATE POLICY "Users can view their own messages" ON public.messages
     FOR SELECT
     USING (
@@ -23,6 +24,7 @@ CREATE POLICY "Users can view their own messages" ON public.messages
     );
 
 -- Policy: Users can insert messages where they are the sender
+DROP POLICY IF EXISTS "Users can send messages" ON public.messages;
 CREATE POLICY "Users can send messages" ON public.messages
     FOR INSERT
     WITH CHECK (
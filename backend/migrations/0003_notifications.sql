@@ -13,10 +13,12 @@ CREATE TABLE IF NOT EXISTS public.notifications (
 -- RLS
 ALTER TABLE public.notifications ENABLE ROW LEVEL SECURITY;
 
+DROP POLICY IF EXISTS "Users can view their notifications" ON public.notifications;
 CREATE POLICY "Users can view their notifications" ON public.notifications
     FOR SELECT
     USING (auth.uid() = user_id);
 
+DROP POLICY IF EXISTS "Users can update their notifications" ON public.notifications;
 CREATE POLICY "Users can update their notifications" ON public.notifications
     FOR UPDATE
     USING (auth.uid() = user_id);
@@ -26,6 +28,7 @@ CREATE POLICY "Users can update their notifications" ON public.notifications
 -- Creating notification usually via backend function which bypasses RLS if using service key, 
 -- or uses authenticated user if triggered by them. 
 -- For now, let's allow insert if user=user_id
+DROP POLICY IF EXISTS "Users can insert their own notifications" ON public.notifications;
 CREATE POLICY "Users can insert their own notifications" ON public.notifications
     FOR INSERT
     WITH CHECK (auth.uid() = user_id);
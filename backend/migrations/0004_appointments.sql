@@ -1,4 +1,4 @@
-
+-- Appointments, looked up by patient, by doctor and by date
 CREATE TABLE IF NOT EXISTS appointments (
   id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
   patient_id UUID NOT NULL REFERENCES patients(id) ON DELETE CASCADE,
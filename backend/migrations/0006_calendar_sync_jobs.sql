@@ -0,0 +1,21 @@
+-- Durable queue of Google Calendar changes, drained by calendar_sync.py.
+-- Appointment writes commit immediately and add a row here; the worker
+-- creates/patches/deletes the event and writes google_event_id and
+-- google_meet_link back to the appointment.
+CREATE TABLE IF NOT EXISTS public.calendar_sync_jobs (
+    id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+    doctor_id UUID NOT NULL REFERENCES doctors(id) ON DELETE CASCADE,
+    appointment_id UUID NOT NULL, -- no FK: delete jobs outlive their appointment
+    action TEXT NOT NULL CHECK (action IN ('create', 'patch', 'delete')),
+    google_event_id TEXT,
+    status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'processing', 'done', 'failed')),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    next_attempt_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+    locked_at TIMESTAMP WITH TIME ZONE,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_calendar_sync_jobs_due
+    ON public.calendar_sync_jobs(next_attempt_at)
+    WHERE status IN ('pending', 'processing');
@@ -0,0 +1,9 @@
+-- One row per reminder sent, so reminders.py never sends the same one twice
+-- across restarts or workers. Rows are cleared when an appointment moves.
+CREATE TABLE IF NOT EXISTS public.appointment_reminders (
+    id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+    appointment_id UUID NOT NULL REFERENCES appointments(id) ON DELETE CASCADE,
+    offset_minutes INTEGER NOT NULL,
+    sent_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+    UNIQUE (appointment_id, offset_minutes)
+);
@@ -0,0 +1,18 @@
+-- Recurring appointment series: every occurrence row shares a series_id and
+-- the RRULE it was expanded from, so one recurring calendar event can cover it.
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name = 'appointments' AND column_name = 'series_id') THEN
+        ALTER TABLE public.appointments ADD COLUMN series_id UUID;
+    END IF;
+    IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name = 'appointments' AND column_name = 'recurrence_rule') THEN
+        ALTER TABLE public.appointments ADD COLUMN recurrence_rule TEXT;
+    END IF;
+END $$;
+
+CREATE INDEX IF NOT EXISTS idx_appointments_series ON public.appointments(series_id) WHERE series_id IS NOT NULL;
+
+-- Calendar sync jobs can create one recurring event for a whole series
+ALTER TABLE public.calendar_sync_jobs DROP CONSTRAINT IF EXISTS calendar_sync_jobs_action_check;
+ALTER TABLE public.calendar_sync_jobs ADD CONSTRAINT calendar_sync_jobs_action_check
+    CHECK (action IN ('create', 'create_series', 'patch', 'delete'));
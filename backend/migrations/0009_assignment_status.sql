@@ -0,0 +1,27 @@
+-- Assignment lifecycle for diff-based bulk assignment.
+-- Assignments removed by a bulk update are archived rather than deleted,
+-- so past sessions keep their prescription.
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name = 'assigned_exercises' AND column_name = 'status') THEN
+        ALTER TABLE public.assigned_exercises ADD COLUMN status TEXT NOT NULL DEFAULT 'active';
+        ALTER TABLE public.assigned_exercises ADD CONSTRAINT assigned_exercises_status_check CHECK (status IN ('active', 'archived'));
+    END IF;
+END $$;
+
+-- Repeated assignments used to insert duplicate rows; keep the newest one active
+UPDATE public.assigned_exercises a
+SET status = 'archived'
+WHERE a.status = 'active'
+  AND EXISTS (
+      SELECT 1 FROM public.assigned_exercises b
+      WHERE b.patient_id = a.patient_id
+        AND b.exercise_id = a.exercise_id
+        AND b.status = 'active'
+        AND (b.assigned_at, b.id) > (a.assigned_at, a.id)
+  );
+
+-- One active prescription per patient and exercise
+CREATE UNIQUE INDEX IF NOT EXISTS idx_assigned_exercises_active_pair
+    ON public.assigned_exercises(patient_id, exercise_id)
+    WHERE status = 'active';
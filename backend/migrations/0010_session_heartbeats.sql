@@ -0,0 +1,14 @@
+-- Heartbeat tracking for live exercise sessions.
+-- last_seen_at is refreshed by the session reaper from WebSocket heartbeats;
+-- in_progress sessions that go quiet are moved to status 'abandoned'.
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name = 'exercise_sessions' AND column_name = 'last_seen_at') THEN
+        ALTER TABLE public.exercise_sessions ADD COLUMN last_seen_at TIMESTAMP WITH TIME ZONE;
+    END IF;
+END $$;
+
+-- The reaper only ever scans in_progress rows
+CREATE INDEX IF NOT EXISTS idx_exercise_sessions_in_progress_last_seen
+    ON public.exercise_sessions(last_seen_at)
+    WHERE status = 'in_progress';
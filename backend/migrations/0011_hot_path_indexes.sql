@@ -0,0 +1,30 @@
+-- migrate: no-transaction
+-- Indexes behind the filters every page load runs (see HOT_PATHS in
+-- migrate.py, which `python migrate.py check` verifies with EXPLAIN).
+-- CONCURRENTLY keeps the tables writable while these build on a live
+-- database, which is why this file runs outside a transaction.
+
+-- Session history, dashboard stats, daily plan and compliance: one patient's
+-- sessions, newest first
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_exercise_sessions_patient_created
+    ON public.exercise_sessions(patient_id, created_at);
+
+-- Chat history reads each direction of a conversation separately
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_messages_conversation
+    ON public.messages(sender_id, recipient_id, created_at);
+
+-- Notification list and unread counts
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_notifications_user_created
+    ON public.notifications(user_id, created_at);
+
+-- Every authenticated patient request resolves its patient row by auth user
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_patients_auth_user_id
+    ON public.patients(auth_user_id);
+
+-- A doctor's caseload
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_patients_doctor_id
+    ON public.patients(doctor_id);
+
+-- Doctors resolve their row by auth user the same way
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_doctors_auth_user_id
+    ON public.doctors(auth_user_id);
@@ -0,0 +1,21 @@
+-- How far a read replica is behind the primary, polled by replicas.py to
+-- decide which replicas take reads. Always 0 on the primary.
+CREATE OR REPLACE FUNCTION public.replication_lag() RETURNS DOUBLE PRECISION
+    LANGUAGE sql STABLE
+    AS $$
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        -- Everything received is replayed: caught up, however long ago the last commit was
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END::double precision
+$$;
+
+-- Only the backend's service role needs it
+REVOKE EXECUTE ON FUNCTION public.replication_lag() FROM PUBLIC;
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'anon') THEN
+        REVOKE EXECUTE ON FUNCTION public.replication_lag() FROM anon, authenticated;
+    END IF;
+END $$;
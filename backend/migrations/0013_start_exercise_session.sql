@@ -0,0 +1,63 @@
+-- POST /sessions in one round-trip: validates the patient and exercise,
+-- inserts the session and notifies the patient's doctor in a single
+-- transaction. The notification row reaches the doctor's open socket through
+-- the change feed (cdc.py), so nothing else waits on it.
+-- Errors raised with SQLSTATE PTxxx come back from PostgREST with status xxx.
+CREATE OR REPLACE FUNCTION public.start_exercise_session(
+    p_auth_user_id UUID,
+    p_exercise_id UUID,
+    p_duration_seconds INTEGER DEFAULT 0,
+    p_repetitions INTEGER DEFAULT 0,
+    p_notes TEXT DEFAULT NULL,
+    p_status TEXT DEFAULT 'in_progress'
+) RETURNS JSONB
+    LANGUAGE plpgsql
+    AS $$
+DECLARE
+    v_patient_id UUID;
+    v_doctor_id UUID;
+    v_full_name TEXT;
+    v_doctor_auth_id UUID;
+    v_session public.exercise_sessions;
+BEGIN
+    SELECT id, doctor_id, full_name INTO v_patient_id, v_doctor_id, v_full_name
+    FROM public.patients WHERE auth_user_id = p_auth_user_id LIMIT 1;
+    IF v_patient_id IS NULL THEN
+        RAISE SQLSTATE 'PT404' USING MESSAGE = 'Patient profile not found. Please complete your profile.';
+    END IF;
+
+    PERFORM 1 FROM public.exercises WHERE id = p_exercise_id;
+    IF NOT FOUND THEN
+        RAISE SQLSTATE 'PT404' USING MESSAGE = 'Exercise not found';
+    END IF;
+
+    INSERT INTO public.exercise_sessions (patient_id, exercise_id, duration_seconds, repetitions, notes, status, started_at)
+    VALUES (v_patient_id, p_exercise_id, coalesce(p_duration_seconds, 0), coalesce(p_repetitions, 0),
+            p_notes, coalesce(p_status, 'in_progress'), now())
+    RETURNING * INTO v_session;
+
+    SELECT auth_user_id INTO v_doctor_auth_id FROM public.doctors WHERE id = v_doctor_id;
+    IF v_doctor_auth_id IS NOT NULL THEN
+        -- A failed notification must not fail the session
+        BEGIN
+            INSERT INTO public.notifications (user_id, title, message, type, data, is_read)
+            VALUES (v_doctor_auth_id, 'Patient Started Session',
+                    coalesce(v_full_name, 'Patient') || ' has started a new exercise session.', 'info',
+                    jsonb_build_object('session_id', v_session.id, 'patient_id', v_patient_id), false);
+        EXCEPTION WHEN OTHERS THEN
+            RAISE WARNING 'start_exercise_session: could not notify doctor %: %', v_doctor_id, SQLERRM;
+        END;
+    END IF;
+
+    RETURN to_jsonb(v_session);
+END $$;
+
+-- It trusts p_auth_user_id, so only the backend's service role may call it
+REVOKE EXECUTE ON FUNCTION public.start_exercise_session(UUID, UUID, INTEGER, INTEGER, TEXT, TEXT) FROM PUBLIC;
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'anon') THEN
+        REVOKE EXECUTE ON FUNCTION public.start_exercise_session(UUID, UUID, INTEGER, INTEGER, TEXT, TEXT)
+            FROM anon, authenticated;
+    END IF;
+END $$;
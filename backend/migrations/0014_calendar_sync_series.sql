@@ -0,0 +1,3 @@
+-- create_series jobs name their series, so the worker can still create the
+-- recurring event after the occurrence the job is keyed to was deleted.
+ALTER TABLE public.calendar_sync_jobs ADD COLUMN IF NOT EXISTS series_id UUID;
@@ -0,0 +1,19 @@
+-- A doctor can't have two non-cancelled appointments whose times overlap.
+-- The schedule index in scheduling.py rejects overlaps before the write, but
+-- only within one worker; this constraint is what stops two workers booking
+-- the same slot. appointments.py maps its violation (23P01) to the same 409.
+-- Back-to-back appointments are fine: tsrange is half-open, [start, end).
+-- Existing overlapping rows make this migration fail; cancel or move one of
+-- each pair first.
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'appointments_no_overlap') THEN
+        ALTER TABLE public.appointments ADD CONSTRAINT appointments_no_overlap
+            EXCLUDE USING gist (
+                doctor_id WITH =,
+                tsrange(appointment_date + start_time, appointment_date + end_time) WITH &&
+            ) WHERE (status <> 'cancelled');
+    END IF;
+END $$;
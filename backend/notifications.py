@@ -4,6 +4,9 @@ from pydantic import BaseModel
 from typing import Optional, List
 from uuid import UUID
 from datetime import datetime
+import logging
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/notifications", tags=["Notifications"])
 
@@ -32,7 +35,28 @@ def create_notification(user_id: str, title: str, message: str, type: str = "inf
         res = supabase.from_("notifications").insert(payload).execute()
         return res
     except Exception as e:
-        print(f"Error creating notification: {e}")
+        logger.error(f"Error creating notification: {e}")
+        return None
+
+def create_notifications(notifications: list[dict]):
+    """
+    Bulk variant of create_notification: one insert for many recipients.
+    Each item needs user_id, title and message; type and data are optional.
+    """
+    if not notifications:
+        return None
+    try:
+        payload = [{
+            "user_id": n["user_id"],
+            "title": n["title"],
+            "message": n["message"],
+            "type": n.get("type", "info"),
+            "data": n.get("data", {}),
+            "is_read": False
+        } for n in notifications]
+        return supabase.from_("notifications").insert(payload).execute()
+    except Exception as e:
+        logger.error(f"Error creating notifications: {e}")
         return None
 
 @router.get("", response_model=List[NotificationBase])
@@ -50,7 +74,7 @@ def get_notifications(request: Request):
             
         return res.data or []
     except Exception as e:
-        print(f"Error fetching notifications: {e}")
+        logger.error(f"Error fetching notifications: {e}")
         return []
 
 @router.post("/{notification_id}/read")
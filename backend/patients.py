@@ -1,12 +1,62 @@
 from fastapi import APIRouter, HTTPException, Request
 from database import supabase
+from daily_plan import daily_plans
+from singleflight import single_flight
+from cache import response_cache
+from replicas import primary_reads
+import logging
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/patient", tags=["Patient"])
 
+@router.get("/today")
+def today(request: Request):
+    """Everything the patient home screen needs in one request."""
+    try:
+        user = request.state.user
+
+        patient_id = daily_plans.patient_id_for(user.id)
+        if not patient_id:
+            raise HTTPException(404, "Patient profile not found")
+
+        plan = daily_plans.get(patient_id)
+
+        unread_messages = supabase.from_("messages")\
+            .select("id", count="exact")\
+            .eq("recipient_id", user.id)\
+            .eq("is_read", False)\
+            .limit(1)\
+            .execute()
+        unread_notifications = supabase.from_("notifications")\
+            .select("id", count="exact")\
+            .eq("user_id", user.id)\
+            .eq("is_read", False)\
+            .limit(1)\
+            .execute()
+
+        return {
+            **plan,
+            "due_count": len(plan["exercises"]),
+            "completed_count": sum(1 for e in plan["exercises"] if e["completed"]),
+            "unread_messages": unread_messages.count or 0,
+            "unread_notifications": unread_notifications.count or 0
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching today's plan: {e}")
+        raise HTTPException(500, "Failed to fetch today's plan")
+
 @router.get("/my_exercises")
+@primary_reads()
 def my_exercises(request: Request):
     try:
         user = request.state.user
+        cache_key = f"my_exercises:{user.id}"
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return cached
         
         # Get patient record first
         patient_res = supabase.from_("patients").select("id").eq("auth_user_id", user.id).single().execute()
@@ -19,6 +69,7 @@ def my_exercises(request: Request):
         exercises = supabase.from_("assigned_exercises")\
             .select("*, exercises(*)")\
             .eq("patient_id", patient_id)\
+            .eq("status", "active")\
             .execute()
         
         if exercises.data:
@@ -27,11 +78,13 @@ def my_exercises(request: Request):
             #     print(f"AssignID: {ex.get('id')} -> ExerciseID: {ex.get('exercise_id')}")
             pass
 
+        response_cache.set(cache_key, exercises.data or [], tags=[f"user:{user.id}", f"patient:{patient_id}"] +
+                           [f"exercise:{ex['exercise_id']}" for ex in exercises.data or [] if ex.get("exercise_id")])
         return exercises.data or []
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error fetching exercises: {e}")
+        logger.error(f"Error fetching exercises: {e}")
         raise HTTPException(500, "Failed to fetch exercises")
 
 @router.get("/session/history")
@@ -58,7 +111,7 @@ def session_history(request: Request):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error fetching session history: {e}")
+        logger.error(f"Error fetching session history: {e}")
         raise HTTPException(500, "Failed to fetch session history")
 
 @router.get("/dashboard/stats")
@@ -84,6 +137,7 @@ def dashboard(request: Request):
         exercises = supabase.from_("assigned_exercises")\
             .select("*", count="exact")\
             .eq("patient_id", patient_id)\
+            .eq("status", "active")\
             .execute()
         
         return {
@@ -91,7 +145,7 @@ def dashboard(request: Request):
             "total_exercises": exercises.count or 0
         }
     except Exception as e:
-        print(f"Error fetching dashboard stats: {e}")
+        logger.error(f"Error fetching dashboard stats: {e}")
         return {"completed_sessions": 0, "total_exercises": 0}
 
 @router.get("/my-doctor")
@@ -125,13 +179,15 @@ def get_my_doctor(request: Request):
         doctor_name = "Dr. Physiotherapist"
         try:
              # This requires the client to be initialized with service_role_key which it is in database.py
-             doc_user = supabase.auth.admin.get_user_by_id(doctor_auth_id)
+             # Every patient of a doctor asks for the same user; share concurrent lookups
+             doc_user = single_flight.do(("auth_user", doctor_auth_id),
+                                         lambda: supabase.auth.admin.get_user_by_id(doctor_auth_id), "auth_users")
              if doc_user and doc_user.user and doc_user.user.user_metadata:
                  meta = doc_user.user.user_metadata
                  if meta.get("full_name"):
                      doctor_name = meta.get("full_name")
         except Exception as e:
-            print(f"Failed to fetch doctor auth details: {e}")
+            logger.error(f"Failed to fetch doctor auth details: {e}")
             
         return {
             "id": doctor_data["id"],
@@ -141,5 +197,5 @@ def get_my_doctor(request: Request):
         }
 
     except Exception as e:
-        print(f"Error fetching my doctor: {e}")
+        logger.error(f"Error fetching my doctor: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch doctor details")
@@ -2,10 +2,16 @@ from fastapi import APIRouter, HTTPException, Request
 from database import supabase
 from schemas import UserProfile, UserProfileUpdate, ChangePasswordRequest
 from email_service import send_email
+from cache import response_cache
+from replicas import primary_reads
+import logging
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/profile", tags=["Profile"])
 
 @router.get("/me", response_model=UserProfile)
+@primary_reads()
 def get_my_profile(request: Request):
     try:
         user = request.state.user
@@ -25,6 +31,9 @@ def get_my_profile(request: Request):
             pass
             
         elif role == "patient":
+            cached = response_cache.get(f"profile:{user.id}")
+            if cached is not None:
+                return cached
             # Fetch from patients table for authoritative data
             patient_res = supabase.from_("patients").select("*").eq("auth_user_id", user.id).maybe_single().execute()
             if patient_res.data:
@@ -32,11 +41,13 @@ def get_my_profile(request: Request):
                 profile_data["full_name"] = p_data.get("full_name")
                 profile_data["phone"] = p_data.get("phone")
                 # Add other patient specific fields if needed
+            response_cache.set(f"profile:{user.id}", profile_data,
+                               tags=[f"user:{user.id}", f"patient:{(patient_res.data or {}).get('id')}"])
         
         return profile_data
 
     except Exception as e:
-        print(f"Error fetching profile: {e}")
+        logger.error(f"Error fetching profile: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch profile")
 
 @router.put("/me")
@@ -60,7 +71,7 @@ def update_my_profile(payload: UserProfileUpdate, request: Request):
                 "data": update_data
             })
         except Exception as e:
-            print(f"Warning: Failed to update auth metadata: {e}")
+            logger.warning(f"Failed to update auth metadata: {e}")
 
         # 2. Update Role-specific tables
         if role == "patient":
@@ -70,17 +81,19 @@ def update_my_profile(payload: UserProfileUpdate, request: Request):
             if payload.phone: table_update["phone"] = payload.phone
             
             if table_update:
-                supabase.from_("patients").update(table_update).eq("auth_user_id", user.id).execute()
+                updated = supabase.from_("patients").update(table_update).eq("auth_user_id", user.id).execute()
+                response_cache.invalidate(*[f"patient:{p['id']}" for p in updated.data or []])
         
         elif role == "doctor":
             # Doctors might implement a table update later if we add a robust doctors table
             # For now, auth metadata is the primary store for name/phone for doctors in this system
             pass
 
+        response_cache.invalidate(f"user:{user.id}")
         return {"status": "success", "message": "Profile updated successfully"}
 
     except Exception as e:
-        print(f"Error updating profile: {e}")
+        logger.error(f"Error updating profile: {e}")
         raise HTTPException(status_code=500, detail="Failed to update profile")
 
 @router.post("/change-password")
@@ -100,7 +113,7 @@ def change_password(payload: ChangePasswordRequest, request: Request):
                 
         except Exception as e:
             # Need to catch potential auth errors from supabase client
-            print(f"Password verification failed: {e}")
+            logger.warning(f"Password verification failed: {e}")
             raise HTTPException(status_code=400, detail="Incorrect current password")
             
         # 2. Update to new password
@@ -120,10 +133,10 @@ def change_password(payload: ChangePasswordRequest, request: Request):
                     content=f"Hello,\n\nYour password for PhysioCheck was successfully changed.\n\nIf this wasn't you, please contact support immediately."
                 )
             except Exception as e:
-                print(f"Failed to send password change alert: {e}")
+                logger.error(f"Failed to send password change alert: {e}")
 
         except Exception as e:
-            print(f"Failed to update password: {e}")
+            logger.error(f"Failed to update password: {e}")
             raise HTTPException(status_code=500, detail="Failed to update password")
             
         return {"status": "success", "message": "Password changed successfully"}
@@ -131,5 +144,5 @@ def change_password(payload: ChangePasswordRequest, request: Request):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error changing password: {e}")
+        logger.error(f"Error changing password: {e}")
         raise HTTPException(status_code=500, detail="Failed to change password")
@@ -0,0 +1,246 @@
+import os
+import heapq
+import asyncio
+import itertools
+from datetime import datetime, date, timedelta
+from typing import Optional
+from postgrest.exceptions import APIError
+from database import supabase
+from async_db import db
+from notifications import create_notification
+from email_service import send_email
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Minutes before an appointment at which reminders go out
+REMINDER_OFFSETS_MINUTES = [int(m) for m in os.getenv("REMINDER_OFFSETS_MINUTES", "1440,60").split(",") if m.strip()]
+# How far ahead appointments are held in memory; the window slides forward in steps
+REMINDER_HORIZON_DAYS = int(os.getenv("REMINDER_HORIZON_DAYS", "2"))
+REMINDER_EMAILS_ENABLED = os.getenv("REMINDER_EMAILS_ENABLED", "true").lower() == "true"
+# A reminder that couldn't be claimed or delivered is tried again after this long
+REMINDER_RETRY_SECONDS = int(os.getenv("REMINDER_RETRY_SECONDS", "300"))
+
+def appointment_start(appointment: dict) -> datetime:
+    # Appointment times are stored as UTC, same as the calendar events
+    return datetime.fromisoformat(f"{appointment['appointment_date']}T{appointment['start_time'][:5]}:00")
+
+class ReminderScheduler:
+    """
+    Min-heap of pending reminders for appointments inside the horizon.
+
+    Appointments are loaded once for [today, today + horizon] and afterwards only
+    the newly uncovered dates are fetched, so history is never rescanned.
+    Rescheduling bumps a per-appointment version; stale heap entries are dropped
+    when they surface. Each send first claims a unique (appointment_id,
+    offset_minutes) row in appointment_reminders, which keeps reminders
+    exactly-once across restarts and across workers. A send that reaches no
+    channel releases its claim and is retried, as is one that hit a database
+    error, until the appointment starts.
+    """
+    def __init__(self):
+        self._heap: list[tuple[float, int, str, int, int]] = []
+        self._versions: dict[str, int] = {}
+        self._counter = itertools.count()
+        self._loaded_until: Optional[date] = None
+        self._wake = asyncio.Event()
+
+    def _push(self, appointment: dict, sent_offsets: set[int] = frozenset()):
+        appointment_id = appointment["id"]
+        version = self._versions.get(appointment_id, 0) + 1
+        self._versions[appointment_id] = version
+        if appointment.get("status", "scheduled") != "scheduled":
+            return
+        start = appointment_start(appointment)
+        now = datetime.utcnow()
+        if start <= now:
+            return
+        for offset in REMINDER_OFFSETS_MINUTES:
+            if offset in sent_offsets:
+                continue
+            # Reminders missed while the app was down go out immediately
+            fire_at = max(start - timedelta(minutes=offset), now)
+            heapq.heappush(self._heap, (fire_at.timestamp(), next(self._counter), appointment_id, offset, version))
+
+    def schedule(self, appointment: dict):
+        """Called by appointment writes; ignores appointments beyond the loaded horizon."""
+        if self._loaded_until is None:
+            return
+        if date.fromisoformat(appointment["appointment_date"]) > self._loaded_until:
+            self.cancel(appointment["id"])
+            return
+        self._push(appointment)
+        self._wake.set()
+
+    async def reschedule(self, appointment: dict):
+        """An appointment moved: its earlier reminders no longer apply."""
+        try:
+            await db.from_("appointment_reminders").delete().eq("appointment_id", appointment["id"]).execute()
+        except Exception as e:
+            logger.error(f"Failed to reset reminders for {appointment['id']}: {e}")
+        self.schedule(appointment)
+
+    def cancel(self, appointment_id: str):
+        if appointment_id in self._versions:
+            self._versions[appointment_id] += 1
+
+    def _load(self, first: date, last: date):
+        res = supabase.from_("appointments")\
+            .select("id, appointment_date, start_time, status")\
+            .eq("status", "scheduled")\
+            .gte("appointment_date", first.isoformat())\
+            .lte("appointment_date", last.isoformat())\
+            .execute()
+        appointments = res.data or []
+        sent: dict[str, set[int]] = {}
+        if appointments:
+            sent_res = supabase.from_("appointment_reminders")\
+                .select("appointment_id, offset_minutes")\
+                .in_("appointment_id", [a["id"] for a in appointments])\
+                .execute()
+            for row in sent_res.data or []:
+                sent.setdefault(row["appointment_id"], set()).add(row["offset_minutes"])
+        return appointments, sent
+
+    async def extend_horizon(self):
+        today = datetime.utcnow().date()
+        target = today + timedelta(days=REMINDER_HORIZON_DAYS)
+        first = today if self._loaded_until is None else self._loaded_until + timedelta(days=1)
+        if first > target:
+            return
+        # Forget versions of appointments with nothing left in the heap
+        pending = {entry[2] for entry in self._heap}
+        self._versions = {k: v for k, v in self._versions.items() if k in pending}
+        appointments, sent = await db.run(self._load, first, target)
+        for appointment in appointments:
+            self._push(appointment, sent.get(appointment["id"], set()))
+        self._loaded_until = target
+        self._wake.set()
+
+    def _retry(self, appointment_id: str, offset: int, version: int):
+        fire_at = datetime.utcnow() + timedelta(seconds=REMINDER_RETRY_SECONDS)
+        heapq.heappush(self._heap, (fire_at.timestamp(), next(self._counter), appointment_id, offset, version))
+
+    def _claim(self, appointment_id: str, offset: int) -> Optional[dict]:
+        """
+        Re-read the appointment and claim the reminder slot.
+        Returns the appointment with patient details, or None if another worker
+        already sent it or the appointment no longer matches this reminder.
+        Database errors propagate so the reminder is retried.
+        """
+        res = supabase.from_("appointments")\
+            .select("id, appointment_date, start_time, status, appointment_mode, google_meet_link, patients(auth_user_id, email, full_name)")\
+            .eq("id", appointment_id)\
+            .limit(1)\
+            .execute()
+        if not res.data or res.data[0].get("status") != "scheduled":
+            return None
+        appointment = res.data[0]
+        start = appointment_start(appointment)
+        now = datetime.utcnow()
+        if start <= now:
+            # Too late to remind; also ends retries
+            return None
+        if start - timedelta(minutes=offset) > now + timedelta(minutes=1):
+            # Moved later on another worker; whoever moved it owns the new reminder
+            return None
+        try:
+            supabase.from_("appointment_reminders").insert({
+                "appointment_id": appointment_id,
+                "offset_minutes": offset
+            }).execute()
+        except APIError as e:
+            if e.code == "23505":
+                # Unique violation: already sent
+                return None
+            raise
+        return appointment
+
+    def _release(self, appointment_id: str, offset: int):
+        """Drop the claim of a reminder that reached no one, so it can be sent again."""
+        supabase.from_("appointment_reminders")\
+            .delete()\
+            .eq("appointment_id", appointment_id)\
+            .eq("offset_minutes", offset)\
+            .execute()
+
+    def _send(self, appointment: dict, offset: int) -> bool:
+        """Deliver on every channel the patient has. False if none of them took it."""
+        patient = appointment.get("patients") or {}
+        when = f"{appointment['appointment_date']} at {appointment['start_time'][:5]}"
+        # Worded by date rather than lead time, since catch-up reminders fire late
+        message = f"Reminder: you have an appointment on {when} (UTC)."
+        if appointment.get("google_meet_link"):
+            message += f" Join: {appointment['google_meet_link']}"
+        attempted = delivered = False
+        if patient.get("auth_user_id"):
+            attempted = True
+            # Returns None when the insert failed
+            delivered = create_notification(
+                user_id=patient["auth_user_id"],
+                title="Upcoming Appointment",
+                message=message,
+                type="info",
+                data={"appointment_id": appointment["id"]}
+            ) is not None
+        if REMINDER_EMAILS_ENABLED and patient.get("email"):
+            try:
+                # False when SMTP isn't configured, which no retry would fix
+                if send_email(
+                    to=patient["email"],
+                    subject="PhysioCheck Appointment Reminder",
+                    content=f"Hello {patient.get('full_name') or ''},\n\n{message}\n\nBest regards,\nPhysioCheck Team\n"
+                ):
+                    delivered = True
+            except Exception as e:
+                attempted = True
+                logger.error(f"Failed to send reminder email: {e}")
+        # A patient with no channel at all has nothing to retry
+        return delivered or not attempted
+
+    async def _fire(self, appointment_id: str, offset: int, version: int):
+        try:
+            appointment = await db.run(self._claim, appointment_id, offset)
+            if not appointment:
+                return
+            if not await db.run(self._send, appointment, offset):
+                try:
+                    await db.run(self._release, appointment_id, offset)
+                except Exception as e:
+                    logger.error(f"Reminder for {appointment_id} reached no channel and its claim could not be released: {e}")
+                    return
+                logger.warning(f"Reminder for {appointment_id} reached no channel; retrying in {REMINDER_RETRY_SECONDS}s")
+                self._retry(appointment_id, offset, version)
+        except Exception as e:
+            logger.error(f"Reminder error for {appointment_id}, retrying in {REMINDER_RETRY_SECONDS}s: {e}")
+            self._retry(appointment_id, offset, version)
+
+    async def run(self):
+        """Background loop started with the app."""
+        await self.extend_horizon()
+        # Slide the horizon a few times per day so it never runs short
+        next_extend = datetime.utcnow() + timedelta(hours=6)
+        while True:
+            self._wake.clear()
+            now = datetime.utcnow()
+            if now >= next_extend:
+                try:
+                    await self.extend_horizon()
+                except Exception as e:
+                    logger.error(f"Reminder horizon load failed: {e}")
+                next_extend = now + timedelta(hours=6)
+
+            while self._heap and self._heap[0][0] <= now.timestamp():
+                _, _, appointment_id, offset, version = heapq.heappop(self._heap)
+                if self._versions.get(appointment_id) == version:
+                    await self._fire(appointment_id, offset, version)
+
+            timeout = (next_extend - now).total_seconds()
+            if self._heap:
+                timeout = min(timeout, self._heap[0][0] - now.timestamp())
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=max(timeout, 0.05))
+            except asyncio.TimeoutError:
+                pass
+
+reminder_scheduler = ReminderScheduler()
@@ -0,0 +1,377 @@
+import os
+import time
+import asyncio
+import threading
+import contextvars
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Optional
+import httpx
+from fastapi import Request
+from database import SUPABASE_SERVICE_ROLE_KEY
+from instrumentation import Counter, Gauge, METRICS, builder_request, builder_method
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# Comma-separated Supabase read replica URLs (https://<ref>-rr-<region>-<id>.supabase.co).
+# Unset: every query goes to SUPABASE_URL as before.
+READ_REPLICA_URLS = [u.strip().rstrip("/") for u in os.getenv("READ_REPLICA_URLS", "").split(",") if u.strip()]
+# Replicas further behind than this get no reads until they catch up
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+REPLICA_HEALTH_INTERVAL_SECONDS = float(os.getenv("REPLICA_HEALTH_INTERVAL_SECONDS", "2"))
+REPLICA_HEALTH_TIMEOUT_SECONDS = float(os.getenv("REPLICA_HEALTH_TIMEOUT_SECONDS", "2"))
+# Users whose recent writes are tracked for read-your-writes; the oldest are dropped first
+WRITE_TRACKER_MAX_USERS = int(os.getenv("WRITE_TRACKER_MAX_USERS", "50000"))
+# Shares recent writes between workers, so a user's next request avoids lagging
+# replicas whichever worker serves it
+REDIS_URL = os.getenv("REDIS_URL")
+REDIS_WRITE_KEY_PREFIX = "physiocheck:wrote:"
+# A write this old has replayed on every replica still taking reads: those are
+# at most the max lag behind as of a probe no older than three intervals
+WRITE_VISIBLE_AFTER_SECONDS = REPLICA_MAX_LAG_SECONDS + 3 * REPLICA_HEALTH_INTERVAL_SECONDS + 1
+
+replica_reads = Counter(
+    "replica_routed_reads_total",
+    "Reads by where they were sent: replica, or primary and why.", ("pool", "route"))
+replica_failures = Counter(
+    "replica_failures_total", "Reads or health checks that failed on a replica.", ("pool",))
+
+class Replica:
+    def __init__(self, url: str):
+        self.url = url
+        self.base = httpx.URL(url)
+        # None until the first probe
+        self.healthy: Optional[bool] = None
+        self.lag: Optional[float] = None
+        # Monotonic time before which every primary commit is visible on the replica
+        self.caught_up_to = 0.0
+        self.checked_at = 0.0
+        self.in_flight = 0
+
+class ReplicaSet:
+    """
+    Read endpoints for one kind of connection, with health and lag from
+    periodic probes. A replica gets reads while its last probe succeeded,
+    is recent, and showed it within max_lag_seconds of the primary; among
+    those the one with the fewest reads in flight wins.
+    `probe` returns the replica's replication lag in seconds.
+    """
+    def __init__(self, name: str, urls: list[str], probe: Callable[[Replica], Awaitable[float]],
+                 max_lag_seconds: float = REPLICA_MAX_LAG_SECONDS,
+                 interval_seconds: float = REPLICA_HEALTH_INTERVAL_SECONDS):
+        self.name = name
+        self.replicas = [Replica(url) for url in urls]
+        self.probe = probe
+        self.max_lag_seconds = max_lag_seconds
+        self.interval_seconds = interval_seconds
+        self._lock = threading.Lock()
+
+    def choose(self, wrote_at: Optional[float] = None) -> Optional[Replica]:
+        """A replica for one read, or None for the primary. wrote_at: the reader's last write (monotonic)."""
+        now = time.monotonic()
+        with self._lock:
+            candidates = [
+                r for r in self.replicas
+                if r.healthy and r.lag <= self.max_lag_seconds
+                and now - r.checked_at < self.interval_seconds * 3
+                and (wrote_at is None or r.caught_up_to > wrote_at)
+            ]
+            if not candidates:
+                return None
+            return min(candidates, key=lambda r: (r.in_flight, r.lag))
+
+    @contextmanager
+    def acquire(self, replica: Replica):
+        with self._lock:
+            replica.in_flight += 1
+        try:
+            yield replica
+        finally:
+            with self._lock:
+                replica.in_flight -= 1
+
+    def mark_failed(self, replica: Replica, error: Exception):
+        """Take a replica out of rotation until its next successful probe."""
+        replica_failures.inc((self.name,))
+        with self._lock:
+            was_healthy, replica.healthy = replica.healthy, False
+        if was_healthy is not False:
+            logger.warning(f"Read replica {replica.base.host} failed, reads go to the primary: {error}",
+                           extra={"pool": self.name})
+
+    async def _check(self, replica: Replica):
+        started = time.monotonic()
+        try:
+            lag = max(0.0, float(await self.probe(replica)))
+        except Exception as e:
+            self.mark_failed(replica, e)
+            return
+        with self._lock:
+            was_healthy = replica.healthy
+            replica.healthy, replica.lag, replica.checked_at = True, lag, started
+            # The probe ran after `started`, so everything committed before started - lag had replayed
+            replica.caught_up_to = started - lag
+        if not was_healthy:
+            logger.info(f"Read replica {replica.base.host} is healthy ({lag:.2f}s behind)", extra={"pool": self.name})
+
+    async def run(self):
+        """Background task started with the app: probes every replica each interval."""
+        if not self.replicas:
+            return
+        while True:
+            await asyncio.gather(*(self._check(r) for r in self.replicas))
+            await asyncio.sleep(self.interval_seconds)
+
+    def healthy_count(self) -> int:
+        with self._lock:
+            return sum(1 for r in self.replicas if r.healthy and r.lag <= self.max_lag_seconds)
+
+class _WriteTracker:
+    """
+    When each user last wrote, so their next reads can avoid replicas that
+    haven't replayed it. Kept in process memory, and mirrored to Redis (with
+    a TTL of WRITE_VISIBLE_AFTER_SECONDS) when REDIS_URL is set so every
+    worker sees writes made through any other.
+    """
+    def __init__(self, max_users: int = WRITE_TRACKER_MAX_USERS, redis_url: Optional[str] = None):
+        self.max_users = max_users
+        self._writes: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._redis = None
+        if redis_url and redis is not None:
+            try:
+                self._redis = redis.Redis.from_url(redis_url, socket_timeout=0.5, decode_responses=True)
+            except Exception as e:
+                logger.warning(f"Write tracker: Redis unavailable, tracking writes per worker: {e}")
+
+    def record(self, user_id: str):
+        with self._lock:
+            self._writes[user_id] = time.monotonic()
+            self._writes.move_to_end(user_id)
+            while len(self._writes) > self.max_users:
+                self._writes.popitem(last=False)
+        if self._redis is not None:
+            try:
+                self._redis.set(REDIS_WRITE_KEY_PREFIX + user_id, time.time(),
+                                ex=max(1, round(WRITE_VISIBLE_AFTER_SECONDS)))
+            except Exception as e:
+                logger.error(f"Write tracker: Redis write failed: {e}")
+
+    def last_write(self, user_id: Optional[str]) -> Optional[float]:
+        """Monotonic time of the user's last write, or None. May call Redis: keep off the event loop."""
+        if user_id is None:
+            return None
+        with self._lock:
+            local = self._writes.get(user_id)
+        if self._redis is None:
+            return local
+        try:
+            shared = self._redis.get(REDIS_WRITE_KEY_PREFIX + user_id)
+        except Exception as e:
+            logger.error(f"Write tracker: Redis read failed: {e}")
+            return local
+        if shared is None:
+            return local
+        # Stored as wall-clock time by whichever worker saw the write
+        shared_at = time.monotonic() - max(0.0, time.time() - float(shared))
+        return shared_at if local is None else max(local, shared_at)
+
+recent_writes = _WriteTracker(redis_url=REDIS_URL)
+
+class _ReadContext:
+    __slots__ = ("replica_ok", "user_id", "wrote", "wrote_at")
+
+    def __init__(self, replica_ok: bool, user_id: Optional[str], wrote_at: Optional[float] = None):
+        self.replica_ok = replica_ok
+        self.user_id = user_id
+        self.wrote = False
+        # The user's last write before this request, looked up once at its start
+        self.wrote_at = wrote_at
+
+# Set per HTTP request; background jobs and WebSockets have none and read the primary
+_read_context: contextvars.ContextVar[Optional[_ReadContext]] = contextvars.ContextVar("read_context", default=None)
+
+async def read_routing_middleware(request: Request, call_next):
+    """
+    GET requests may read from replicas; everything else reads the primary.
+    Register before the auth middleware so it runs inside it and sees the user.
+    """
+    user = getattr(request.state, "user", None)
+    user_id = str(user.id) if user is not None else None
+    replica_ok = request.method in ("GET", "HEAD")
+    wrote_at = None
+    if replica_ok and user_id is not None and read_replicas.replicas:
+        wrote_at = await asyncio.to_thread(recent_writes.last_write, user_id)
+    token = _read_context.set(_ReadContext(replica_ok, user_id, wrote_at))
+    try:
+        return await call_next(request)
+    finally:
+        _read_context.reset(token)
+
+@contextmanager
+def primary_reads():
+    """
+    Read from the primary inside this block, e.g. a lookup deciding whether
+    to insert, or reads that fill a cache: a copy taken from a lagging replica
+    would outlive the lag. Also works as a decorator on sync functions.
+    """
+    context = _read_context.get()
+    if context is None:
+        yield
+        return
+    inner = _ReadContext(False, context.user_id, context.wrote_at)
+    token = _read_context.set(inner)
+    try:
+        yield
+    finally:
+        _read_context.reset(token)
+        context.wrote = context.wrote or inner.wrote
+
+def note_write(user_id: Optional[str] = None):
+    """
+    Keep reads on the primary for the rest of this request, and for the user's
+    later requests until a replica has replayed the write. Writes through the
+    Supabase client call this themselves; pass user_id where the request has
+    no authenticated user yet (login, register).
+    """
+    context = _read_context.get()
+    if context is not None:
+        context.wrote = True
+        user_id = user_id or context.user_id
+    if user_id is not None:
+        recent_writes.record(str(user_id))
+
+def choose_replica(replica_set: ReplicaSet) -> Optional[Replica]:
+    """The replica this read should use under the current request's rules, or None for the primary."""
+    if not replica_set.replicas:
+        return None
+    context = _read_context.get()
+    if context is None:
+        route = "primary_background"
+    elif not context.replica_ok:
+        route = "primary_required"
+    elif context.wrote:
+        route = "primary_after_write"
+    else:
+        replica = replica_set.choose(context.wrote_at)
+        if replica is not None:
+            replica_reads.inc((replica_set.name, "replica"))
+            return replica
+        route = "primary_no_replica" if context.wrote_at is None else "primary_recent_write"
+    replica_reads.inc((replica_set.name, route))
+    return None
+
+def coalesce_scope() -> Optional[str]:
+    """
+    Which identical in-flight reads this one may share (see singleflight.read_key),
+    so a read never gets an answer from a source choose_replica() wouldn't send
+    it to: "primary" for reads that must go there, "replica" for reads any
+    caught-up replica may answer. None for a user with a write of their own
+    that a read already in flight may not reflect.
+    """
+    if not read_replicas.replicas:
+        return "primary"
+    context = _read_context.get()
+    if context is None or not context.replica_ok:
+        return "primary"
+    if context.wrote or context.wrote_at is not None:
+        return None
+    return "replica"
+
+_http: Optional[httpx.AsyncClient] = None
+
+async def open_http_client():
+    """
+    Build the health probe client at startup. Off the loop: loading the
+    default SSL context takes a few hundred milliseconds.
+    """
+    global _http
+    if _http is None and read_replicas.replicas:
+        _http = await asyncio.to_thread(httpx.AsyncClient, timeout=REPLICA_HEALTH_TIMEOUT_SECONDS)
+
+async def _postgrest_lag(replica: Replica) -> float:
+    if _http is None:
+        await open_http_client()
+    # GET runs the function in a read-only transaction, which is all a replica accepts
+    response = await _http.get(f"{replica.url}/rest/v1/rpc/replication_lag", headers={
+        "apikey": SUPABASE_SERVICE_ROLE_KEY,
+        "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}"
+    })
+    response.raise_for_status()
+    return float(response.json())
+
+async def close_http_client():
+    global _http
+    if _http is not None:
+        await _http.aclose()
+        _http = None
+
+read_replicas = ReplicaSet("postgrest", READ_REPLICA_URLS, _postgrest_lag)
+
+def _route(builder, execute: Callable):
+    request = builder_request(builder)
+    if builder_method(builder) not in ("GET", "HEAD"):
+        try:
+            return execute(builder)
+        finally:
+            note_write()
+    replica = choose_replica(read_replicas)
+    if replica is None:
+        return execute(builder)
+    primary_path = request.path
+    # yarl in postgrest 1.x+, httpx before that; both build from a string
+    request.path = type(primary_path)(str(httpx.URL(str(primary_path)).copy_with(
+        scheme=replica.base.scheme, host=replica.base.host, port=replica.base.port)))
+    try:
+        with read_replicas.acquire(replica):
+            return execute(builder)
+    except httpx.TransportError as e:
+        read_replicas.mark_failed(replica, e)
+    finally:
+        request.path = primary_path
+    return execute(builder)
+
+def install_postgrest_replicas():
+    """
+    Send reads made through the sync client's execute() to a read replica when
+    the current request allows it, falling back to the primary if the replica
+    can't be reached; writes mark the request and user as needing the primary.
+    Call before instrument_postgrest() so timing, single-flight and breakers
+    wrap the routed call.
+    """
+    if not read_replicas.replicas:
+        return
+    try:
+        from postgrest._sync import request_builder
+    except ImportError:
+        return
+    for cls in vars(request_builder).values():
+        if not isinstance(cls, type) or "execute" not in vars(cls) or getattr(cls.execute, "_replicas", False):
+            continue
+        original = cls.execute
+
+        def execute(self, _original=original):
+            request = builder_request(self)
+            # maybe_single()'s execute calls its parent's; route the outer call only
+            if getattr(request, "_routing", False):
+                return _original(self)
+            request._routing = True
+            try:
+                return _route(self, _original)
+            finally:
+                request._routing = False
+
+        execute._replicas = True
+        cls.execute = execute
+
+METRICS.extend([
+    replica_reads,
+    replica_failures,
+    Gauge("read_replicas_healthy", "Read replicas currently taking reads.", read_replicas.healthy_count),
+])
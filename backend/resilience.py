@@ -0,0 +1,292 @@
+import os
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+import httpx
+from instrumentation import Counter, Gauge, METRICS, builder_table
+from async_db import db_executor
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Consecutive failures (errors or slow calls) that open a table's breaker
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+# How long an open breaker fails fast before letting one probe call through
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "15"))
+# A call that succeeds but takes longer than this still counts as a failure
+CIRCUIT_SLOW_CALL_SECONDS = float(os.getenv("CIRCUIT_SLOW_CALL_SECONDS", "5"))
+STALE_CACHE_MAX_ENTRIES = int(os.getenv("STALE_CACHE_MAX_ENTRIES", "5000"))
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+# Background revalidations started by read_async, kept until they finish
+_refreshes: set[asyncio.Task] = set()
+
+class UpstreamUnavailable(Exception):
+    """Supabase can't be reached for this read and there is no usable cached copy."""
+
+class CircuitOpenError(UpstreamUnavailable):
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"Circuit for {name} is open; retry in {retry_in:.0f}s")
+        self.name = name
+        self.retry_in = retry_in
+
+circuit_transitions = Counter(
+    "circuit_breaker_transitions_total", "Circuit breaker state changes by table.", ("name", "state"))
+circuit_rejections = Counter(
+    "circuit_breaker_rejections_total", "Calls failed fast because the breaker was open.", ("name",))
+stale_reads = Counter(
+    "stale_cache_reads_total", "Cached reads by outcome: fresh, revalidating, stale_on_error, miss.", ("cache", "outcome"))
+
+class CircuitBreaker:
+    """
+    Classic three-state breaker. Closed counts consecutive failures; open
+    rejects calls until reset_seconds have passed; half-open lets a single
+    probe through, which closes the breaker on success or re-opens it.
+    """
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 reset_seconds: float = CIRCUIT_RESET_SECONDS, slow_call_seconds: float = CIRCUIT_SLOW_CALL_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.slow_call_seconds = slow_call_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            self.state = state
+            circuit_transitions.inc((self.name, state))
+            log = logger.warning if state == OPEN else logger.info
+            log(f"Circuit for {self.name} is now {state}", extra={"circuit": self.name, "state": state})
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == OPEN and time.monotonic() - self._opened_at < self.reset_seconds
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go through now."""
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            elapsed = time.monotonic() - self._opened_at
+            if self.state == OPEN and elapsed >= self.reset_seconds:
+                self._set_state(HALF_OPEN)
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+        circuit_rejections.inc((self.name,))
+        raise CircuitOpenError(self.name, max(0.0, self.reset_seconds - elapsed))
+
+    def record(self, ok: bool):
+        with self._lock:
+            self._probing = False
+            if ok:
+                # A slow call started before the breaker opened doesn't close it
+                if self.state != OPEN:
+                    self.failures = 0
+                    self._set_state(CLOSED)
+                return
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._set_state(OPEN)
+
+    def call(self, fn: Callable[[], Any]) -> Any:
+        self.before_call()
+        start = time.monotonic()
+        try:
+            result = fn()
+        except Exception as e:
+            self.record(not is_upstream_failure(e))
+            raise
+        self.record(time.monotonic() - start < self.slow_call_seconds)
+        return result
+
+def is_upstream_failure(error: Exception) -> bool:
+    """Timeouts and connection errors trip breakers; a 404 or a bad filter is the caller's problem."""
+    return isinstance(error, (httpx.TransportError, CircuitOpenError))
+
+class BreakerRegistry:
+    def __init__(self):
+        self._breakers: dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(name)
+            if breaker is None:
+                breaker = self._breakers[name] = CircuitBreaker(name)
+            return breaker
+
+    def open_count(self) -> int:
+        with self._lock:
+            return sum(1 for b in self._breakers.values() if b.state != CLOSED)
+
+breakers = BreakerRegistry()
+
+def install_postgrest_breakers():
+    """
+    Put every sync PostgREST round-trip behind its table's breaker, so calls
+    against a table Supabase is failing on return at once instead of each
+    waiting out the client timeout. Call after instrument_postgrest() and
+    before install_postgrest_singleflight(), so a round-trip shared by
+    coalesced readers is recorded once, by the reader that made it.
+    """
+    try:
+        from postgrest._sync import request_builder
+    except ImportError:
+        return
+    for cls in vars(request_builder).values():
+        if not isinstance(cls, type) or "execute" not in vars(cls) or getattr(cls.execute, "_breaker", False):
+            continue
+        original = cls.execute
+
+        def execute(self, _original=original):
+            return breakers.get(builder_table(self)).call(lambda: _original(self))
+
+        execute._breaker = True
+        execute._instrumented = getattr(original, "_instrumented", False)
+        cls.execute = execute
+
+class StaleCache:
+    """
+    Last-known-good results for read paths, bounded LRU. Per read:
+      - younger than fresh_seconds: served as is;
+      - within revalidate_seconds after that: served, and refreshed in the background;
+      - within stale_if_error_seconds: served only when the fetch fails or the
+        table's breaker is open.
+    Anything older is fetched inline; with no usable copy, a failed fetch
+    raises UpstreamUnavailable.
+    """
+    def __init__(self, name: str, max_entries: int = STALE_CACHE_MAX_ENTRIES):
+        self.name = name
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+        self._refreshing: set[str] = set()
+        self._lock = threading.Lock()
+
+    def _get(self, key: str) -> Optional[tuple[float, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def _set(self, key: str, value: Any):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_prefix(self, prefix: str):
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                del self._entries[key]
+
+    def _claim_refresh(self, key: str) -> bool:
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def _release_refresh(self, key: str):
+        with self._lock:
+            self._refreshing.discard(key)
+
+    def _plan(self, key: str, table: str, fresh_seconds: float, revalidate_seconds: float,
+              stale_if_error_seconds: float) -> tuple[Optional[tuple[float, Any]], str]:
+        entry = self._get(key)
+        if entry is None:
+            return None, "miss"
+        age = time.monotonic() - entry[0]
+        if age < fresh_seconds:
+            return entry, "fresh"
+        if age < fresh_seconds + revalidate_seconds and not breakers.get(table).is_open:
+            return entry, "revalidating"
+        if age < max(stale_if_error_seconds, fresh_seconds + revalidate_seconds):
+            return entry, "fetch_or_stale"
+        return None, "miss"
+
+    def _fallback(self, key: str, table: str, entry, error: Exception):
+        if entry is not None and is_upstream_failure(error):
+            stale_reads.inc((self.name, "stale_on_error"))
+            logger.warning(f"Serving stale {self.name} for {key}: {error}", extra={"cache": self.name, "table": table})
+            return entry[1]
+        if is_upstream_failure(error):
+            raise UpstreamUnavailable(str(error)) from error
+        raise error
+
+    def read(self, key: str, fetch: Callable[[], Any], table: str, fresh_seconds: float = 0,
+             revalidate_seconds: float = 0, stale_if_error_seconds: float = 300) -> Any:
+        """For sync routes; `fetch` runs the query and returns what should be cached."""
+        entry, plan = self._plan(key, table, fresh_seconds, revalidate_seconds, stale_if_error_seconds)
+        if plan in ("fresh", "revalidating"):
+            stale_reads.inc((self.name, plan))
+            if plan == "revalidating" and self._claim_refresh(key):
+                # On the DB pool, so a brownout queues refreshes instead of piling up threads
+                db_executor.submit(self._refresh, key, fetch)
+            return entry[1]
+        if plan == "miss":
+            stale_reads.inc((self.name, "miss"))
+        try:
+            value = fetch()
+        except Exception as e:
+            return self._fallback(key, table, entry, e)
+        self._set(key, value)
+        return value
+
+    def _refresh(self, key: str, fetch: Callable[[], Any]):
+        try:
+            self._set(key, fetch())
+        except Exception as e:
+            logger.warning(f"Background refresh of {self.name} {key} failed: {e}")
+        finally:
+            self._release_refresh(key)
+
+    async def read_async(self, key: str, fetch: Callable[[], Awaitable[Any]], table: str, fresh_seconds: float = 0,
+                         revalidate_seconds: float = 0, stale_if_error_seconds: float = 300) -> Any:
+        """For async handlers; `fetch` is a coroutine function, e.g. one awaiting async_db."""
+        entry, plan = self._plan(key, table, fresh_seconds, revalidate_seconds, stale_if_error_seconds)
+        if plan in ("fresh", "revalidating"):
+            stale_reads.inc((self.name, plan))
+            if plan == "revalidating" and self._claim_refresh(key):
+                task = asyncio.create_task(self._refresh_async(key, fetch))
+                # The loop only holds tasks weakly
+                _refreshes.add(task)
+                task.add_done_callback(_refreshes.discard)
+            return entry[1]
+        if plan == "miss":
+            stale_reads.inc((self.name, "miss"))
+        try:
+            value = await fetch()
+        except Exception as e:
+            return self._fallback(key, table, entry, e)
+        self._set(key, value)
+        return value
+
+    async def _refresh_async(self, key: str, fetch: Callable[[], Awaitable[Any]]):
+        try:
+            self._set(key, await fetch())
+        except Exception as e:
+            logger.warning(f"Background refresh of {self.name} {key} failed: {e}")
+        finally:
+            self._release_refresh(key)
+
+METRICS.extend([
+    circuit_transitions,
+    circuit_rejections,
+    stale_reads,
+    Gauge("circuit_breakers_open", "Tables whose breaker is open or half-open.", breakers.open_count),
+])
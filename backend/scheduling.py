@@ -0,0 +1,288 @@
+import os
+import time
+import bisect
+import asyncio
+import threading
+from datetime import date, datetime, timedelta
+from typing import Optional
+from database import supabase
+from replicas import primary_reads
+
+# Index entries are reloaded after this long so writes from other workers show up
+SCHEDULE_INDEX_TTL_SECONDS = int(os.getenv("SCHEDULE_INDEX_TTL_SECONDS", "300"))
+
+def parse_minutes(value: str) -> int:
+    """'HH:MM' or 'HH:MM:SS' -> minutes since midnight"""
+    parts = value.split(":")
+    return int(parts[0]) * 60 + int(parts[1])
+
+def format_minutes(minutes: int) -> str:
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+class DaySchedule:
+    """
+    Appointments of one doctor on one date, as a sorted array of
+    (start, end, appointment_id) in minutes. Overlap checks are a binary
+    search plus a short backwards scan bounded by the longest interval.
+    """
+    def __init__(self):
+        self.intervals: list[tuple[int, int, str]] = []
+        self.max_length = 0
+
+    def add(self, start: int, end: int, appointment_id: str):
+        bisect.insort(self.intervals, (start, end, appointment_id))
+        self.max_length = max(self.max_length, end - start)
+
+    def remove(self, appointment_id: str):
+        self.intervals = [iv for iv in self.intervals if iv[2] != appointment_id]
+
+    def overlapping(self, start: int, end: int, exclude_id: Optional[str] = None) -> Optional[str]:
+        # Every interval starting before `end` is a candidate; only those that
+        # also start within max_length of `start` can still reach it.
+        i = bisect.bisect_left(self.intervals, (end,))
+        while i > 0:
+            i -= 1
+            iv_start, iv_end, iv_id = self.intervals[i]
+            if iv_start < start - self.max_length:
+                break
+            if iv_end > start and iv_id != exclude_id:
+                return iv_id
+        return None
+
+    def free_windows(self, day_start: int, day_end: int, min_length: int) -> list[tuple[int, int]]:
+        windows = []
+        cursor = day_start
+        for iv_start, iv_end, _ in self.intervals:
+            if iv_end <= cursor:
+                continue
+            if iv_start >= day_end:
+                break
+            if iv_start - cursor >= min_length:
+                windows.append((cursor, iv_start))
+            cursor = max(cursor, iv_end)
+        if day_end - cursor >= min_length:
+            windows.append((cursor, day_end))
+        return windows
+
+class ScheduleIndex:
+    """
+    Per-doctor appointment index, loaded lazily from the appointments table on
+    first use and kept current by the appointment write handlers.
+    Cancelled appointments are not indexed since they don't block time, and
+    neither are past days; the rare check against one goes to the database.
+
+    Checks are exact only within one worker. Across workers the
+    appointments_no_overlap constraint (migration 0015) rejects the write.
+    """
+    def __init__(self):
+        self._days: dict[str, dict[str, DaySchedule]] = {}
+        self._loaded_at: dict[str, float] = {}
+        # First date in each doctor's index
+        self._loaded_from: dict[str, str] = {}
+        # appointment_id -> (doctor_id, date) so writes can find the entry to replace
+        self._location: dict[str, tuple[str, str]] = {}
+        self._lock = threading.RLock()
+        self._booking_locks: dict[str, asyncio.Lock] = {}
+
+    def booking_lock(self, doctor_id: str) -> asyncio.Lock:
+        """
+        Held by async handlers from conflict check until the write is indexed.
+        Serializes bookings on this worker only.
+        """
+        lock = self._booking_locks.get(doctor_id)
+        if lock is None:
+            lock = self._booking_locks[doctor_id] = asyncio.Lock()
+        return lock
+
+    # Conflict checks trust the index, so it must not come from a lagging replica
+    @primary_reads()
+    def _ensure_loaded(self, doctor_id: str):
+        loaded_at = self._loaded_at.get(doctor_id)
+        if loaded_at is not None and time.monotonic() - loaded_at < SCHEDULE_INDEX_TTL_SECONDS:
+            return
+        # Past days can't conflict with new bookings, so history stays out of memory
+        today = datetime.utcnow().date().isoformat()
+        res = supabase.from_("appointments")\
+            .select("id, appointment_date, start_time, end_time")\
+            .eq("doctor_id", doctor_id)\
+            .neq("status", "cancelled")\
+            .gte("appointment_date", today)\
+            .execute()
+        days: dict[str, DaySchedule] = {}
+        with self._lock:
+            for appt_id in [a for a, loc in self._location.items() if loc[0] == doctor_id]:
+                del self._location[appt_id]
+            for row in res.data or []:
+                day = days.setdefault(row["appointment_date"], DaySchedule())
+                day.add(parse_minutes(row["start_time"]), parse_minutes(row["end_time"]), row["id"])
+                self._location[row["id"]] = (doctor_id, row["appointment_date"])
+            self._days[doctor_id] = days
+            self._loaded_from[doctor_id] = today
+            self._loaded_at[doctor_id] = time.monotonic()
+
+    @primary_reads()
+    def _load_day(self, doctor_id: str, appointment_date: str) -> DaySchedule:
+        res = supabase.from_("appointments")\
+            .select("id, start_time, end_time")\
+            .eq("doctor_id", doctor_id)\
+            .eq("appointment_date", appointment_date)\
+            .neq("status", "cancelled")\
+            .execute()
+        day = DaySchedule()
+        for row in res.data or []:
+            day.add(parse_minutes(row["start_time"]), parse_minutes(row["end_time"]), row["id"])
+        return day
+
+    def find_conflict(self, doctor_id: str, appointment_date: str, start_time: str, end_time: str,
+                      exclude_id: Optional[str] = None) -> Optional[str]:
+        """Id of an appointment overlapping the given slot, or None if the slot is free."""
+        self._ensure_loaded(doctor_id)
+        if appointment_date < self._loaded_from.get(doctor_id, appointment_date):
+            # Before the indexed range, e.g. an appointment moved into the past
+            return self._load_day(doctor_id, appointment_date)\
+                .overlapping(parse_minutes(start_time), parse_minutes(end_time), exclude_id)
+        with self._lock:
+            day = self._days.get(doctor_id, {}).get(appointment_date)
+            if not day:
+                return None
+            return day.overlapping(parse_minutes(start_time), parse_minutes(end_time), exclude_id)
+
+    def add(self, doctor_id: str, appointment_id: str, appointment_date: str, start_time: str, end_time: str):
+        with self._lock:
+            if doctor_id not in self._days:
+                # Not loaded yet; the lazy load will pick this row up
+                return
+            self.remove(appointment_id)
+            if appointment_date < self._loaded_from[doctor_id]:
+                return
+            day = self._days[doctor_id].setdefault(appointment_date, DaySchedule())
+            day.add(parse_minutes(start_time), parse_minutes(end_time), appointment_id)
+            self._location[appointment_id] = (doctor_id, appointment_date)
+
+    def remove(self, appointment_id: str):
+        with self._lock:
+            location = self._location.pop(appointment_id, None)
+            if not location:
+                return
+            doctor_id, appointment_date = location
+            day = self._days.get(doctor_id, {}).get(appointment_date)
+            if day:
+                day.remove(appointment_id)
+
+    def invalidate(self, doctor_id: str):
+        with self._lock:
+            self._loaded_at.pop(doctor_id, None)
+
+    def clear(self):
+        """Reload every doctor's schedule on next use."""
+        with self._lock:
+            self._loaded_at.clear()
+
+    def free_slots(self, doctor_id: str, start_date: date, end_date: date,
+                   day_start: str, day_end: str, min_minutes: int) -> list[dict]:
+        self._ensure_loaded(doctor_id)
+        open_from, open_until = parse_minutes(day_start), parse_minutes(day_end)
+        slots = []
+        with self._lock:
+            days = self._days.get(doctor_id, {})
+            current = start_date
+            while current <= end_date:
+                day = days.get(current.isoformat()) or DaySchedule()
+                for window_start, window_end in day.free_windows(open_from, open_until, min_minutes):
+                    slots.append({
+                        "date": current.isoformat(),
+                        "start_time": format_minutes(window_start),
+                        "end_time": format_minutes(window_end)
+                    })
+                current += timedelta(days=1)
+        return slots
+
+schedule_index = ScheduleIndex()
+
+WEEKDAY_CODES = ["MO", "TU", "WE", "TH", "FR", "SA", "SU"]
+MAX_SERIES_OCCURRENCES = 200
+
+def expand_recurrence(start_date: date, freq: str, interval: int = 1, by_day: Optional[list[str]] = None,
+                      count: Optional[int] = None, until: Optional[date] = None) -> list[date]:
+    """
+    Dates of an RRULE-like spec (FREQ=DAILY|WEEKLY, INTERVAL, BYDAY, COUNT/UNTIL),
+    matching how Google expands the same rule. Weeks start on Monday.
+    """
+    if count is None and until is None:
+        raise ValueError("Either count or until is required")
+    if interval < 1:
+        raise ValueError("interval must be at least 1")
+    if count is not None and not 1 <= count <= MAX_SERIES_OCCURRENCES:
+        raise ValueError(f"count must be between 1 and {MAX_SERIES_OCCURRENCES}")
+    # One past the maximum, so an until that reaches too far is caught below
+    limit = count or MAX_SERIES_OCCURRENCES + 1
+
+    if freq == "daily":
+        weekdays = None
+    elif freq == "weekly":
+        codes = by_day or [WEEKDAY_CODES[start_date.weekday()]]
+        try:
+            weekdays = sorted({WEEKDAY_CODES.index(code.upper()) for code in codes})
+        except ValueError:
+            raise ValueError(f"by_day must use {', '.join(WEEKDAY_CODES)}")
+    else:
+        raise ValueError("freq must be 'daily' or 'weekly'")
+
+    dates = _expand(start_date, interval, weekdays, limit, until)
+    if len(dates) > MAX_SERIES_OCCURRENCES:
+        raise ValueError(f"A series can have at most {MAX_SERIES_OCCURRENCES} occurrences; move until earlier")
+    return dates
+
+def _expand(start_date: date, interval: int, weekdays: Optional[list[int]], limit: int,
+            until: Optional[date]) -> list[date]:
+    dates = []
+    if weekdays is None:
+        current = start_date
+        while len(dates) < limit and (until is None or current <= until):
+            dates.append(current)
+            current += timedelta(days=interval)
+        return dates
+
+    week_start = start_date - timedelta(days=start_date.weekday())
+    while len(dates) < limit:
+        for weekday in weekdays:
+            current = week_start + timedelta(days=weekday)
+            if current < start_date:
+                continue
+            if (until is not None and current > until) or len(dates) >= limit:
+                return dates
+            dates.append(current)
+        week_start += timedelta(weeks=interval)
+    return dates
+
+def to_rrule(freq: str, interval: int, occurrences: list[date], by_day: Optional[list[str]] = None) -> str:
+    """RRULE for an already expanded series; COUNT pins it to exactly these dates."""
+    parts = [f"FREQ={freq.upper()}", f"INTERVAL={interval}"]
+    if freq == "weekly":
+        days = sorted({d.weekday() for d in occurrences})
+        parts.append("BYDAY=" + ",".join(WEEKDAY_CODES[d] for d in days))
+    parts.append(f"COUNT={len(occurrences)}")
+    return "RRULE:" + ";".join(parts)
+
+def parse_rrule(rule: str) -> tuple[str, int]:
+    """FREQ and INTERVAL of an RRULE written by to_rrule()."""
+    parts = dict(p.split("=", 1) for p in rule.split(":", 1)[-1].split(";") if "=" in p)
+    return parts.get("FREQ", "WEEKLY").lower(), int(parts.get("INTERVAL", "1"))
+
+def series_recurrence(freq: str, interval: int, dates: list[date], start_time: str) -> tuple[list[str], list[date]]:
+    """
+    Recurrence lines for an event starting on dates[0] whose instances are
+    exactly `dates`: the rule's pattern through the last date, with EXDATEs
+    for pattern dates that have no occurrence (deleted rows). Also returns
+    the dates the pattern can't reach, i.e. occurrences moved off it.
+    """
+    weekdays = sorted({d.weekday() for d in dates}) if freq == "weekly" else None
+    pattern = _expand(dates[0], interval, weekdays, len(dates) * 7 * interval, dates[-1])
+    on_pattern, wanted = set(pattern), set(dates)
+    lines = [to_rrule(freq, interval, pattern)]
+    excluded = [d for d in pattern if d not in wanted]
+    if excluded:
+        # Same UTC start-time form as instance ids
+        at = f"T{start_time[:5].replace(':', '')}00Z"
+        lines.append("EXDATE:" + ",".join(d.isoformat().replace("-", "") + at for d in excluded))
+    return lines, [d for d in dates if d not in on_pattern]
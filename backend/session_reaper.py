@@ -0,0 +1,115 @@
+import os
+import time
+import asyncio
+import threading
+from datetime import datetime, timedelta
+from database import supabase
+from async_db import db
+from cache import invalidate_dashboard
+from daily_plan import daily_plans
+import logging
+
+logger = logging.getLogger(__name__)
+
+# A session with no heartbeat for this long is considered abandoned
+SESSION_STALE_AFTER_SECONDS = int(os.getenv("SESSION_STALE_AFTER_SECONDS", "600"))
+SESSION_REAPER_INTERVAL_SECONDS = int(os.getenv("SESSION_REAPER_INTERVAL_SECONDS", "60"))
+# PostgREST puts in_() filters in the URL, so ids are updated in chunks
+REAPER_BATCH_SIZE = 200
+# Upper bound on batches per tick, so one pass never runs unbounded
+REAPER_MAX_BATCHES = int(os.getenv("REAPER_MAX_BATCHES", "10"))
+
+class HeartbeatTracker:
+    """
+    Last-seen times of exercise sessions streaming on this worker.
+    Touching is a dict write, so it is safe to call for every WebSocket frame;
+    the timestamps reach the database once per reaper tick in a single bulk update.
+    """
+    def __init__(self):
+        self._last_seen: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def touch(self, session_id: str):
+        with self._lock:
+            self._last_seen[session_id] = time.time()
+
+    def forget(self, session_id: str):
+        with self._lock:
+            self._last_seen.pop(session_id, None)
+
+    def alive(self, max_age_seconds: float) -> list[str]:
+        cutoff = time.time() - max_age_seconds
+        with self._lock:
+            for session_id in [s for s, t in self._last_seen.items() if t < cutoff]:
+                del self._last_seen[session_id]
+            return list(self._last_seen.keys())
+
+heartbeats = HeartbeatTracker()
+
+def _chunks(items: list, size: int):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def flush_heartbeats() -> int:
+    """Stamp last_seen_at on every session that sent a heartbeat since the previous tick."""
+    alive = heartbeats.alive(SESSION_REAPER_INTERVAL_SECONDS * 2)
+    if not alive:
+        return 0
+    now = datetime.utcnow().isoformat()
+    for batch in _chunks(alive, REAPER_BATCH_SIZE):
+        supabase.from_("exercise_sessions")\
+            .update({"last_seen_at": now})\
+            .in_("id", batch)\
+            .eq("status", "in_progress")\
+            .execute()
+    return len(alive)
+
+def reap_stale_sessions() -> int:
+    """
+    Mark in_progress sessions without a recent heartbeat as abandoned.
+    Sessions that never sent one fall back to their started_at time.
+    A large backlog is worked off REAPER_BATCH_SIZE sessions at a time, at most
+    REAPER_MAX_BATCHES per tick; the rest wait for the next tick.
+    """
+    cutoff = (datetime.utcnow() - timedelta(seconds=SESSION_STALE_AFTER_SECONDS)).isoformat()
+    stale_filter = f"last_seen_at.lt.{cutoff},and(last_seen_at.is.null,started_at.lt.{cutoff})"
+    reaped: list[dict] = []
+    for _ in range(REAPER_MAX_BATCHES):
+        stale_res = supabase.from_("exercise_sessions")\
+            .select("id")\
+            .eq("status", "in_progress")\
+            .or_(stale_filter)\
+            .limit(REAPER_BATCH_SIZE)\
+            .execute()
+        batch = [s["id"] for s in stale_res.data or []]
+        if not batch:
+            break
+        # The cutoff is checked again here: a heartbeat flushed by another worker
+        # since the select keeps that session alive
+        updated = supabase.from_("exercise_sessions")\
+            .update({"status": "abandoned"})\
+            .in_("id", batch)\
+            .eq("status", "in_progress")\
+            .or_(stale_filter)\
+            .execute()
+        reaped.extend(updated.data or [])
+        if len(batch) < REAPER_BATCH_SIZE:
+            break
+
+    for patient_id in set(s["patient_id"] for s in reaped):
+        invalidate_dashboard(patient_id=patient_id)
+        # An abandoned session no longer counts toward today's plan
+        daily_plans.invalidate(patient_id)
+    return len(reaped)
+
+async def run_reaper():
+    """Background loop started with the app. DB work runs on the DB pool."""
+    while True:
+        try:
+            await db.run(flush_heartbeats)
+            reaped = await db.run(reap_stale_sessions)
+            if reaped:
+                logger.info(f"Session reaper: marked {reaped} stale sessions as abandoned")
+        except Exception as e:
+            logger.error(f"Session reaper error: {e}")
+        await asyncio.sleep(SESSION_REAPER_INTERVAL_SECONDS)
@@ -1,10 +1,19 @@
 from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel
 from typing import Optional
+from postgrest.exceptions import APIError
 from datetime import datetime
 from database import supabase
+from async_db import db
 from websocket import manager
-from notifications import create_notification
+from live_sessions import live_sessions
+from session_reaper import heartbeats
+from cache import invalidate_dashboard
+from compliance import invalidate_compliance
+from daily_plan import daily_plans
+import logging
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/sessions", tags=["Sessions"])
 
@@ -17,88 +26,44 @@ class CreateSessionPayload(BaseModel):
 
 @router.post("")
 def create_session(payload: CreateSessionPayload, request: Request):
-    """Create a new exercise session"""
+    """
+    Create a new exercise session. One call to start_exercise_session
+    (migrations/0013) finds the patient, checks the exercise, inserts the
+    session and notifies the doctor in a single transaction.
+    """
     try:
         user = request.state.user
         
-        # Get patient record
-        patient_res = supabase.from_("patients")\
-            .select("id")\
-            .eq("auth_user_id", user.id)\
-            .limit(1)\
-            .execute()
-        
-        if not patient_res.data or len(patient_res.data) == 0:
-            print(f"Patient profile not found for user {user.id}")
-            raise HTTPException(404, "Patient profile not found. Please complete your profile.")
-        
-        patient_id = patient_res.data[0]["id"]
-        
-        # Verify exercise exists
-        exercise = supabase.from_("exercises")\
-            .select("id")\
-            .eq("id", payload.exercise_id)\
-            .limit(1)\
-            .execute()
-        
-        if not exercise.data or len(exercise.data) == 0:
-            print(f"Exercise not found: {payload.exercise_id}")
-            raise HTTPException(404, "Exercise not found")
-        
-        # Create session
-        session_data = {
-            "patient_id": patient_id,
-            "exercise_id": payload.exercise_id,
-            "duration_seconds": payload.duration_seconds or 0,
-            "repetitions": payload.repetitions or 0,
-            "notes": payload.notes,
-            "status": payload.status,
-            "started_at": datetime.utcnow().isoformat()
-        }
-        
-        result = supabase.from_("exercise_sessions")\
-            .insert(session_data)\
-            .execute()
-        
-        if not result.data:
-            print("Failed to insert session, result data empty")
-            print(f"Result error: {result}")
+        result = supabase.rpc("start_exercise_session", {
+            "p_auth_user_id": user.id,
+            "p_exercise_id": payload.exercise_id,
+            "p_duration_seconds": payload.duration_seconds or 0,
+            "p_repetitions": payload.repetitions or 0,
+            "p_notes": payload.notes,
+            "p_status": payload.status
+        }).execute()
+        session = result.data
+        
+        if not session:
+            logger.error(f"Failed to insert session, result data empty: {result}")
             raise Exception("Failed to create session")
-            
-        # Notify Doctor
-        try:
-             # Get doctor ID from patient record to notify them
-             # We need to fetch doctor_id from patient first
-             p_data = supabase.from_("patients").select("doctor_id, full_name").eq("id", patient_id).single().execute()
-             
-             if p_data.data and p_data.data.get("doctor_id"):
-                 doc_id = p_data.data["doctor_id"]
-                 # Get doctor auth id
-                 d_res = supabase.from_("doctors").select("auth_user_id").eq("id", doc_id).single().execute()
-                 
-                 if d_res.data:
-                     doc_auth_id = d_res.data["auth_user_id"]
-                     create_notification(
-                         user_id=doc_auth_id,
-                         title="Patient Started Session",
-                         message=f"{p_data.data.get('full_name', 'Patient')} has started a new exercise session.",
-                         type="info",
-                         data={"session_id": result.data[0]["id"], "patient_id": patient_id}
-                     )
-        except Exception as e:
-            print(f"Failed to notify doctor: {e}")
+
+        invalidate_dashboard(patient_id=session["patient_id"])
+        daily_plans.record_session(session["patient_id"], payload.exercise_id, payload.status)
         
-        return result.data[0]
+        return session
         
     except HTTPException:
         raise
+    except APIError as e:
+        # Missing patient profile or exercise, raised by the function as PT404
+        if e.code == "PT404":
+            logger.warning(f"{e.message} (user {request.state.user.id}, exercise {payload.exercise_id})")
+            raise HTTPException(404, e.message)
+        logger.exception(f"Error creating session: {e}")
+        raise HTTPException(500, f"Failed to create exercise session: {e.message}")
     except Exception as e:
-        import traceback
-        traceback.print_exc()
-        print(f"Error creating session: {e}")
-        # Improve error message if it's the specific PGRST116
-        if "PGRST116" in str(e):
-             raise HTTPException(404, "Data not found (PGRST116). Likely missing patient profile or exercise.")
+        logger.exception(f"Error creating session: {e}")
         raise HTTPException(500, f"Failed to create exercise session: {str(e)}")
 
 @router.patch("/{session_id}")
@@ -108,7 +73,7 @@ async def update_session(session_id: str, payload: dict, request: Request):
         user = request.state.user
         
         # Get patient record
-        patient_res = supabase.from_("patients")\
+        patient_res = await db.from_("patients")\
             .select("id")\
             .eq("auth_user_id", user.id)\
             .single()\
@@ -120,7 +85,7 @@ async def update_session(session_id: str, payload: dict, request: Request):
         patient_id = patient_res.data["id"]
         
         # Verify session belongs to this patient
-        session = supabase.from_("exercise_sessions")\
+        session = await db.from_("exercise_sessions")\
             .select("*")\
             .eq("id", session_id)\
             .eq("patient_id", patient_id)\
@@ -143,13 +108,25 @@ async def update_session(session_id: str, payload: dict, request: Request):
             if payload["status"] == "completed":
                 update_data["completed_at"] = datetime.utcnow().isoformat()
         
-        result = supabase.from_("exercise_sessions")\
+        result = await db.from_("exercise_sessions")\
             .update(update_data)\
             .eq("id", session_id)\
             .execute()
         
         if not result.data:
             raise Exception("Failed to update session")
+
+        invalidate_dashboard(patient_id=patient_id)
+        if update_data.get("status") == "completed":
+            invalidate_compliance(patient_id)
+        if update_data.get("status") and update_data["status"] != session.data.get("status"):
+            daily_plans.record_session(patient_id, session.data["exercise_id"], update_data["status"])
+        
+        if update_data.get("status") and update_data["status"] != "in_progress":
+            heartbeats.forget(session_id)
+            live = live_sessions.get(patient_id)
+            if live and live.get("session_id") == session_id:
+                await live_sessions.unregister(patient_id, live.get("connection_id"))
         
         # Notify doctor if session is updated
         await manager.signal_to_doctor(patient_id, {
@@ -164,7 +141,7 @@ async def update_session(session_id: str, payload: dict, request: Request):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error updating session: {e}")
+        logger.error(f"Error updating session: {e}")
         raise HTTPException(500, "Failed to update exercise session")
 
 @router.get("/{session_id}")
@@ -201,5 +178,5 @@ def get_session(session_id: str, request: Request):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error fetching session: {e}")
+        logger.error(f"Error fetching session: {e}")
         raise HTTPException(500, "Failed to fetch session details")
\ No newline at end of file
@@ -0,0 +1,167 @@
+import os
+import copy
+import asyncio
+import threading
+from typing import Any, Callable, Hashable, Optional
+from instrumentation import Counter, METRICS, builder_request, builder_method, builder_table
+from replicas import coalesce_scope
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Identical concurrent reads share one Supabase round-trip
+SINGLEFLIGHT_ENABLED = os.getenv("SINGLEFLIGHT_ENABLED", "true").lower() == "true"
+
+singleflight_calls = Counter(
+    "singleflight_calls_total",
+    "Coalesced reads by key group; 'shared' calls got a result without a round-trip of their own.",
+    ("group", "role"))
+METRICS.append(singleflight_calls)
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time; callers arriving while it is in
+    flight wait for it and get a deep copy of its result, so handlers that
+    mutate what they read don't see each other's changes.
+    Nothing is kept once the call finishes - this coalesces, it doesn't cache.
+    """
+    def __init__(self):
+        self._calls: dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], Any], group: str = "other") -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+        if not leader:
+            singleflight_calls.inc((group, "shared"))
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result)
+
+        singleflight_calls.inc((group, "leader"))
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                shared = call.waiters > 0
+            call.done.set()
+        # Nobody can join once the key is gone, so an unshared result needs no copy
+        return copy.deepcopy(call.result) if shared else call.result
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines on one event loop; waiters don't hold a thread."""
+    def __init__(self):
+        # key -> (future, [waiter count])
+        self._calls: dict[Hashable, tuple[asyncio.Future, list[int]]] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Any], group: str = "other") -> Any:
+        entry = self._calls.get(key)
+        if entry is not None:
+            singleflight_calls.inc((group, "shared"))
+            entry[1][0] += 1
+            try:
+                # shield: a cancelled waiter must not cancel the leader's call
+                return copy.deepcopy(await asyncio.shield(entry[0]))
+            except asyncio.CancelledError:
+                if not entry[0].cancelled() or asyncio.current_task().cancelling():
+                    raise
+            # The leader was cancelled (its client went away); run the read ourselves
+            return await self.do(key, fn, group)
+
+        singleflight_calls.inc((group, "leader"))
+        future = asyncio.get_running_loop().create_future()
+        waiters = [0]
+        self._calls[key] = (future, waiters)
+        try:
+            result = await fn()
+        except BaseException as e:
+            del self._calls[key]
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                # Retrieved here so an error nobody waited for isn't logged as unhandled
+                future.exception()
+            raise
+        del self._calls[key]
+        future.set_result(result)
+        return copy.deepcopy(result) if waiters[0] else result
+
+single_flight = SingleFlight()
+async_single_flight = AsyncSingleFlight()
+
+def read_key(builder) -> Optional[tuple]:
+    """
+    Fingerprint of a PostgREST read: method, table, query string, the
+    headers that shape the response (Accept for .single(), Prefer for counts)
+    and whether the read may be answered by a replica.
+    None for writes, which must never be shared, and for reads that must not
+    join one already in flight.
+    """
+    method = builder_method(builder)
+    if method not in ("GET", "HEAD"):
+        return None
+    scope = coalesce_scope()
+    if scope is None:
+        return None
+    request = builder_request(builder)
+    headers = getattr(request, "headers", None) or {}
+    return (
+        method,
+        str(getattr(request, "path", "")),
+        str(getattr(request, "params", "")),
+        headers.get("Accept"),
+        headers.get("Prefer"),
+        headers.get("Range"),
+        scope
+    )
+
+def install_postgrest_singleflight():
+    """
+    Route reads made through the sync client's execute() via single_flight,
+    so concurrent identical queries from sync routes share one round-trip.
+    Call after instrument_postgrest() and install_postgrest_breakers() so only
+    the leader is timed as a DB call and counted by its table's breaker.
+    """
+    if not SINGLEFLIGHT_ENABLED:
+        return
+    try:
+        from postgrest._sync import request_builder
+    except ImportError:
+        return
+    for cls in vars(request_builder).values():
+        if not isinstance(cls, type) or "execute" not in vars(cls) or getattr(cls.execute, "_single_flight", False):
+            continue
+        original = cls.execute
+
+        # The class name is part of the key: maybe_single()'s execute calls its
+        # parent's, and the inner call must not wait on the outer one.
+        def execute(self, _original=original, _owner=cls.__name__):
+            key = read_key(self)
+            if key is None:
+                return _original(self)
+            return single_flight.do((_owner,) + key, lambda: _original(self), builder_table(self))
+
+        execute._single_flight = True
+        execute._instrumented = getattr(original, "_instrumented", False)
+        execute._breaker = getattr(original, "_breaker", False)
+        cls.execute = execute
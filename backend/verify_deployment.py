@@ -22,7 +22,7 @@ async def verify_deployment():
         print("✅ 'doctors' table has 'google_refresh_token' column.")
     except Exception as e:
         print(f"❌ 'doctors' table missing 'google_refresh_token' column: {e}")
-        print("   -> Please run 'backend/update_doctors_schema.sql' in Supabase.")
+        print("   -> Run 'python migrate.py up' in backend/ with DATABASE_URL set.")
         all_good = False
 
     if all_good:
@@ -1,7 +1,15 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query
 from typing import Optional
-from database import supabase
+from async_db import db
+from live_sessions import live_sessions
+from session_reaper import heartbeats
+from datetime import datetime
 import json
+import logging
+
+logger = logging.getLogger(__name__)
+# Per-frame events; sampled (see LOG_SAMPLE_RATES)
+event_logger = logging.getLogger("websocket.events")
 
 router = APIRouter()
 
@@ -16,8 +24,9 @@ class ConnectionManager:
         await websocket.accept()
         self.patient_connections[patient_id] = websocket
 
-    async def disconnect_patient(self, patient_id: str):
-        if patient_id in self.patient_connections:
+    async def disconnect_patient(self, patient_id: str, websocket: WebSocket):
+        # A reconnect may already have replaced this socket
+        if self.patient_connections.get(patient_id) is websocket:
             del self.patient_connections[patient_id]
         # Notify doctors?
         
@@ -26,7 +35,7 @@ class ConnectionManager:
         if patient_id not in self.doctor_connections:
             self.doctor_connections[patient_id] = []
         self.doctor_connections[patient_id].append(websocket)
-        print(f"DEBUG: Doctor connected for {patient_id}. Total docs: {len(self.doctor_connections[patient_id])}. Active keys: {list(self.doctor_connections.keys())}")
+        logger.debug("Doctor connected", extra={"patient_id": patient_id, "doctors": len(self.doctor_connections[patient_id])})
 
     def disconnect_doctor(self, patient_id: str, websocket: WebSocket):
         if patient_id in self.doctor_connections:
@@ -34,30 +43,30 @@ class ConnectionManager:
                 self.doctor_connections[patient_id].remove(websocket)
             if not self.doctor_connections[patient_id]:
                 del self.doctor_connections[patient_id]
-        print(f"DEBUG: Doctor disconnected for {patient_id}. Active keys: {list(self.doctor_connections.keys())}")
+        logger.debug("Doctor disconnected", extra={"patient_id": patient_id})
 
     async def signal_to_doctor(self, patient_id: str, message: dict):
         # Patient sends signal to doctor(s)
         if patient_id in self.doctor_connections:
-            # print(f"DEBUG: Signaling doctor for patient {patient_id}, type={message.get('type')}")
+            event_logger.debug("Signal to doctor", extra={"patient_id": patient_id, "type": message.get("type")})
             for socket in self.doctor_connections[patient_id]:
                 try:
                     await socket.send_json(message)
                 except Exception as e:
-                    print(f"Error signaling doctor: {e}")
+                    logger.error(f"Error signaling doctor: {e}")
         else:
-            print(f"DEBUG: No doctor connected for patient {patient_id}. Active keys: {list(self.doctor_connections.keys())}")
+            event_logger.debug("No doctor connected", extra={"patient_id": patient_id, "type": message.get("type")})
 
     async def signal_to_patient(self, patient_id: str, message: dict):
         # Doctor sends signal to patient
         if patient_id in self.patient_connections:
-            # print(f"DEBUG: Signaling patient {patient_id}, type={message.get('type')}")
+            event_logger.debug("Signal to patient", extra={"patient_id": patient_id, "type": message.get("type")})
             try:
                 await self.patient_connections[patient_id].send_json(message)
             except Exception as e:
-                print(f"Error signaling patient: {e}")
+                logger.error(f"Error signaling patient: {e}")
         else:
-            print(f"DEBUG: Patient {patient_id} not connected/found for signal. Active keys: {list(self.patient_connections.keys())}")
+            event_logger.debug("Patient not connected", extra={"patient_id": patient_id, "type": message.get("type")})
 
 manager = ConnectionManager()
 
@@ -67,7 +76,7 @@ async def monitor_patient(
     session_id: str,
     token: Optional[str] = Query(None)
 ):
-    print(f"DEBUG: Entering monitor_patient for session_id={session_id}")
+    logger.debug("Doctor monitor connecting", extra={"session_id": session_id})
     """
     WebSocket endpoint for doctors to monitor patient exercise sessions in real-time.
     Requires authentication token as query parameter.
@@ -79,7 +88,7 @@ async def monitor_patient(
     
     try:
         # Verify the token
-        user = supabase.auth.get_user(token)
+        user = await db.get_user(token)
         if not user or not user.user:
             await websocket.close(code=1008, reason="Invalid authentication token")
             return
@@ -91,14 +100,14 @@ async def monitor_patient(
             return
         
         # Fetch session to get patient_id
-        session_res = supabase.from_("exercise_sessions")\
+        session_res = await db.from_("exercise_sessions")\
             .select("patient_id, patients(full_name)")\
             .eq("id", session_id)\
             .limit(1)\
             .execute()
         
         if not session_res.data or len(session_res.data) == 0:
-            print("DEBUG: Session not found")
+            logger.debug("Session not found")
             await websocket.close(code=1008, reason="Session not found")
             return
             
@@ -108,15 +117,13 @@ async def monitor_patient(
         patient_name = session_data.get("patients", {}).get("full_name", "Unknown Patient")
         
     except Exception as e:
-        print(f"WebSocket auth error: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"WebSocket auth error: {e}")
         await websocket.close(code=1008, reason="Authentication failed")
         return
     
     # Connection authenticated, proceed with monitoring
     doctor_name = user.user.user_metadata.get("full_name", "Doctor")
-    print(f"DEBUG: Authentication successful for patient {patient_id} by {doctor_name}, accepting connection")
+    logger.debug("Doctor monitor authenticated", extra={"patient_id": patient_id, "session_id": session_id})
     await manager.connect_doctor(patient_id, websocket)
     
     # Notify patient that doctor has joined
@@ -164,7 +171,7 @@ async def monitor_patient(
                     })
                     
             except WebSocketDisconnect:
-                print(f"WebSocket disconnected for patient {patient_id}")
+                logger.info(f"WebSocket disconnected for patient {patient_id}")
                 break
             except json.JSONDecodeError:
                 await websocket.send_json({
@@ -172,11 +179,11 @@ async def monitor_patient(
                     "message": "Invalid JSON format"
                 })
             except Exception as e:
-                print(f"Error in WebSocket loop: {e}")
+                logger.error(f"Error in WebSocket loop: {e}")
                 break
                 
     except Exception as e:
-        print(f"WebSocket error for patient {patient_id}: {e}")
+        logger.error(f"WebSocket error for patient {patient_id}: {e}")
     finally:
         manager.disconnect_doctor(patient_id, websocket)
         try:
@@ -187,11 +194,14 @@ async def monitor_patient(
 @router.websocket("/ws/patient/session")
 async def patient_session(
     websocket: WebSocket,
-    token: Optional[str] = Query(None)
+    token: Optional[str] = Query(None),
+    session_id: Optional[str] = Query(None)
 ):
     """
     WebSocket endpoint for patients to stream exercise session data.
     Requires authentication token as query parameter.
+    The exercise session id should be passed as well; without it the patient's
+    newest in-progress session is used.
     """
     # Authenticate the connection
     if not token:
@@ -200,14 +210,14 @@ async def patient_session(
     
     try:
         # Verify the token
-        user = supabase.auth.get_user(token)
+        user = await db.get_user(token)
         if not user or not user.user:
             await websocket.close(code=1008, reason="Invalid authentication token")
             return
         
         # Get patient record
-        patient = supabase.from_("patients")\
-            .select("id")\
+        patient = await db.from_("patients")\
+            .select("id, doctor_id, full_name")\
             .eq("auth_user_id", user.user.id)\
             .limit(1)\
             .execute()
@@ -217,14 +227,41 @@ async def patient_session(
             return
         
         patient_id = patient.data[0]["id"]
+        doctor_id = patient.data[0].get("doctor_id")
+        
+        # Resolve the exercise session this socket streams for
+        session_query = db.from_("exercise_sessions")\
+            .select("id, exercise_id, created_at, exercises(name)")\
+            .eq("patient_id", patient_id)\
+            .eq("status", "in_progress")
+        if session_id:
+            session_query = session_query.eq("id", session_id)
+        session_res = await session_query.order("created_at", desc=True).limit(1).execute()
+        live_session = session_res.data[0] if session_res.data else None
         
     except Exception as e:
-        print(f"WebSocket auth error: {e}")
+        logger.error(f"WebSocket auth error: {e}")
         await websocket.close(code=1008, reason="Authentication failed")
         return
     
     await manager.connect_patient(patient_id, websocket)
     
+    live_session_id = live_session["id"] if live_session else None
+    if live_session_id:
+        heartbeats.touch(live_session_id)
+    
+    connection_id = None
+    if doctor_id and live_session:
+        connection_id = await live_sessions.register(doctor_id, patient_id, {
+            "session_id": live_session["id"],
+            "patient_name": patient.data[0].get("full_name"),
+            "exercise_id": live_session.get("exercise_id"),
+            "exercise_name": (live_session.get("exercises") or {}).get("name"),
+            "started_at": live_session.get("created_at"),
+            "connected_at": datetime.utcnow().isoformat(),
+            "metrics": {}
+        })
+    
     try:
         await websocket.send_json({
             "type": "connected",
@@ -238,6 +275,8 @@ async def patient_session(
                 
                 # Handle exercise data streaming
                 if message.get("type") == "exercise_data":
+                    if live_session_id:
+                        heartbeats.touch(live_session_id)
                     # Process and potentially broadcast to monitoring doctors
                     # For now, just acknowledge receipt
                     await websocket.send_json({
@@ -245,6 +284,10 @@ async def patient_session(
                         "timestamp": message.get("timestamp")
                     })
                     
+                    await live_sessions.update_metrics(patient_id, {
+                        k: v for k, v in message.items() if k not in ("type", "timestamp")
+                    })
+                    
                     # ALSO broadcast data to doctor for live preview (simulated stats)
                     # In real app, we'd process analysis here
                     await manager.signal_to_doctor(patient_id, {
@@ -252,7 +295,16 @@ async def patient_session(
                         "type": "exercise_update" 
                     })
 
+                elif message.get("type") == "ping":
+                    if live_session_id:
+                        heartbeats.touch(live_session_id)
+                    await live_sessions.touch(patient_id)
+                    await websocket.send_json({"type": "pong"})
+
                 elif message.get("type") == "session_ended":
+                    if live_session_id:
+                        heartbeats.forget(live_session_id)
+                    await live_sessions.unregister(patient_id, connection_id, doctor_id)
                     await manager.signal_to_doctor(patient_id, {
                         "type": "session_ended",
                         "reason": "Patient ended session"
@@ -265,13 +317,16 @@ async def patient_session(
             except WebSocketDisconnect:
                 break
             except Exception as e:
-                print(f"Error in patient session WebSocket: {e}")
+                logger.error(f"Error in patient session WebSocket: {e}")
                 break
                 
     except Exception as e:
-        print(f"WebSocket error: {e}")
+        logger.error(f"WebSocket error: {e}")
     finally:
-        await manager.disconnect_patient(patient_id)
+        if live_session_id:
+            heartbeats.forget(live_session_id)
+        await manager.disconnect_patient(patient_id, websocket)
+        await live_sessions.unregister(patient_id, connection_id, doctor_id)
         try:
             await websocket.close()
         except:
@@ -11,7 +11,6 @@ import { ProgressRing } from '@/components/charts/ProgressRing'
 import { ExerciseCard } from '@/components/cards/ExerciseCard'
 import { AnimatedLoader } from '@/components/loaders/AnimatedLoader'
 import { api, apiEndpoints } from '@/lib/api'
-import { supabase } from '@/lib/supabase'
 import Link from 'next/link'
 import { AppointmentList } from '@/components/appointments/AppointmentList'
 
@@ -44,97 +43,30 @@ export default function PatientDashboard() {
 
   const fetchDashboardData = async () => {
     try {
-      const [statsRes, exercisesRes] = await Promise.all([
-        api.get(apiEndpoints.patient.dashboard.stats),
-        api.get(apiEndpoints.patient.exercises.list)
-      ])
-
-      const statsData = statsRes.data
-      const exercisesList = exercisesRes.data || []
-
-      // Fetch sessions for streak calculation
-      const { data: { user } } = await supabase.auth.getUser()
-      let streak = 0
-      let completedToday = 0
-
-      if (user) {
-        const { data: patients } = await supabase
-          .from('patients')
-          .select('id')
-          .eq('auth_user_id', user.id)
-
-        if (patients && patients.length > 0) {
-          const patientIds = patients.map(p => p.id)
-
-          const { data: sessions } = await supabase
-            .from('exercise_sessions')
-            .select('started_at, completed_at')
-            .in('patient_id', patientIds)
-            .not('completed_at', 'is', null)
-            .order('started_at', { ascending: false })
-
-          if (sessions && sessions.length > 0) {
-            const today = new Date()
-            today.setHours(0, 0, 0, 0)
-
-            // Get unique dates of completed sessions
-            const sessionDates = sessions
-              .map(s => {
-                const date = new Date(s.completed_at)
-                date.setHours(0, 0, 0, 0)
-                return date.getTime()
-              })
-              .filter((date, index, self) => self.indexOf(date) === index)
-              .sort((a, b) => b - a)
-
-            // Calculate streak
-            let currentDate = sessionDates[0]
-            const todayTime = today.getTime()
-            const yesterdayTime = todayTime - 24 * 60 * 60 * 1000
-
-            if (currentDate >= yesterdayTime) {
-              streak = 1
-              for (let i = 1; i < sessionDates.length; i++) {
-                const expectedDate = currentDate - 24 * 60 * 60 * 1000
-                if (sessionDates[i] === expectedDate) {
-                  streak++
-                  currentDate = sessionDates[i]
-                } else {
-                  break
-                }
-              }
-            }
-
-            // Count completed today
-            completedToday = sessions.filter(s => {
-              const sessionDate = new Date(s.completed_at)
-              return sessionDate >= today
-            }).length
-          }
-        }
-      }
+      // Today's plan, streak and counters come precomputed in one request
+      const { data: today } = await api.get(apiEndpoints.patient.dashboard.today)
+      const exercisesList = today.exercises || []
 
       setStats({
-        totalExercises: exercisesList.length,
-        completedToday: completedToday,
-        streak: streak,
-        avgAccuracy: statsData.avgAccuracy || 0
+        totalExercises: today.due_count || 0,
+        completedToday: today.completed_count || 0,
+        streak: today.streak || 0,
+        avgAccuracy: 0
       })
 
-      // Filter exercises due today (mock logic: all active exercises are "due" for demo)
       const upcoming = exercisesList.map((ex: any) => {
-        let exerciseData = ex.exercises || ex.exercise || ex
+        let exerciseData = ex.exercise || {}
         if (Array.isArray(exerciseData)) {
           exerciseData = exerciseData[0] || {}
         }
 
         return {
-          id: ex.exercise_id || ex.id,
-          name: exerciseData.title || exerciseData.name || exerciseData.exercise_name || ex.title || ex.name || 'Unknown Exercise',
-          description: exerciseData.description || exerciseData.exercise_description || ex.description || ex.exercise_description || '',
-          difficulty: exerciseData.difficulty || ex.difficulty || 'beginner',
-          duration: exerciseData.duration_minutes || ex.duration_minutes || 15,
-          dueToday: true,
+          id: ex.exercise_id,
+          name: exerciseData.title || exerciseData.name || exerciseData.exercise_name || 'Unknown Exercise',
+          description: exerciseData.description || exerciseData.exercise_description || '',
+          difficulty: exerciseData.difficulty || 'beginner',
+          duration: exerciseData.duration_minutes || 15,
+          dueToday: !ex.completed,
           bodyPart: exerciseData.body_part || []
         }
       })
@@ -74,18 +74,27 @@ export default function LiveSessionPage() {
 
   // WebSocket Connection
   useEffect(() => {
+    // Heartbeat so the backend doesn't reap the session while the patient is paused
+    let pingTimer: ReturnType<typeof setInterval> | null = null
+
     const connectWs = async () => {
       const { data: { session } } = await supabase.auth.getSession()
       if (!session?.access_token) return
 
       const host = window.location.hostname
-      const wsUrl = `ws://${host}:8000/api/v1/ws/patient/session?token=${session.access_token}`
+      const sessionParam = sessionId ? `&session_id=${sessionId}` : ''
+      const wsUrl = `ws://${host}:8000/api/v1/ws/patient/session?token=${session.access_token}${sessionParam}`
       const ws = new WebSocket(wsUrl)
       wsRef.current = ws
 
       ws.onopen = () => {
         setIsConnected(true)
         console.log('Connected to session WS')
+        pingTimer = setInterval(() => {
+          if (ws.readyState === WebSocket.OPEN) {
+            ws.send(JSON.stringify({ type: 'ping' }))
+          }
+        }, 30000)
       }
 
       ws.onmessage = (event) => {
@@ -97,7 +106,10 @@ export default function LiveSessionPage() {
         }
       }
 
-      ws.onclose = () => setIsConnected(false)
+      ws.onclose = () => {
+        setIsConnected(false)
+        if (pingTimer) clearInterval(pingTimer)
+      }
     }
 
     if (isStarted) {
@@ -105,6 +117,7 @@ export default function LiveSessionPage() {
     }
 
     return () => {
+      if (pingTimer) clearInterval(pingTimer)
       wsRef.current?.close()
       if (peerRef.current) {
         peerRef.current.destroy()
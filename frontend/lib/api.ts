@@ -48,6 +48,7 @@ export const apiEndpoints = {
     },
     doctor: {
         dashboard: {
+            overview: '/doctor/dashboard',
             stats: '/doctor/dashboard/stats',
             activeSessions: '/doctor/sessions/active',
         },
@@ -68,6 +69,7 @@ export const apiEndpoints = {
     patient: {
         dashboard: {
             stats: '/patient/dashboard/stats',
+            today: '/patient/today',
         },
         session: {
             history: '/patient/session/history',
@@ -76,6 +78,11 @@ export const apiEndpoints = {
             list: '/patient/my_exercises',
         }
     },
+    appointments: {
+        list: '/appointments',
+        series: '/appointments/series',
+        freeSlots: '/appointments/free-slots',
+    },
     exercises: {
         list: '/exercises',
         details: (id: string) => `/exercises/${id}`,